@@ -0,0 +1,103 @@
+'''
+Measures the peak memory of transform_articles over growing article counts, run in one
+piece and in checkpointed chunks. The iSchool APIs are replaced by an in-process fake,
+so only the pipeline's own memory is measured.
+
+Run from the project folder:
+    python benchmarks/bench_chunked_transform.py --rows 1000 4000 --chunk-size 500
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+import api_budget
+import http_client
+import transform
+from enrichment_cache import EnrichmentCache
+
+class FakeResponse:
+    status_code = 200
+    def __init__(self, data):
+        self.data = data
+    def json(self):
+        return self.data
+
+def fake_post(url, headers = None, data = None, **kwargs):
+    '''
+    Stands in for the iSchool APIs: every article is positive, its first word is the entity and the topic is politics
+    '''
+    if 'genai' in url:
+        return FakeResponse('politics')
+    documents = [
+        {'id': str(i), 'sentiment': 'positive', 'entities': [{'text': text.split()[0]}]}
+        for i, (_, text) in enumerate(data)
+    ]
+    return FakeResponse({'results': {'documents': documents}})
+
+def write_raw_articles(rows):
+    '''
+    Writes 'rows' fake raw articles for the country 'bench'
+    '''
+    os.makedirs('cache', exist_ok = True)
+    pd.DataFrame({
+        'title': [f'Headline number {i} about the markets and the election' for i in range(rows)],
+        'description': ['A short description of the story'] * rows,
+        'url': [f'https://example.com/{i}' for i in range(rows)],
+        'publishedAt': ['2025-04-28T12:00:00Z'] * rows,
+        'content': [f'Story{i % 500} content ' + 'word ' * 40 for i in range(rows)],
+        'source_name': ['CBS'] * rows
+    }).to_csv(os.path.join('cache', 'top_headlines_bench.csv'), index = False)
+
+def measure(rows, chunk_size):
+    '''
+    Runs the transform on fresh data and returns its peak traced memory in MB and its run time
+    '''
+    write_raw_articles(rows)
+    for filename in os.listdir('cache'):
+        if filename.startswith('cleaned_headlines_bench') or filename.endswith('.db'):
+            os.remove(os.path.join('cache', filename))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    transform.transform_articles('bench', max_workers = 1, requests_per_second = None, chunk_size = chunk_size)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'peak_mb': round(peak / 1e6, 1), 'seconds': round(seconds, 2)}
+
+def run(row_counts, chunk_size):
+    '''
+    Measures every row count in one piece and in chunks
+    '''
+    http_client.post = fake_post
+    results = {'chunk_size': chunk_size, 'runs': []}
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            transform.get_default_cache = lambda: EnrichmentCache(os.path.join('cache', 'bench_cache.db'))
+            #The stub servers don't count against the real daily API budget
+            api_budget._default_budget = api_budget.BudgetTracker(os.path.join('cache', 'api_budget.db'), limits = {})
+            for rows in row_counts:
+                results['runs'].append({
+                    'rows': rows,
+                    'whole': measure(rows, None),
+                    'chunked': measure(rows, chunk_size)
+                })
+        finally:
+            os.chdir(cwd)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark peak memory of the whole and chunked transform')
+    parser.add_argument('--rows', type = int, nargs = '+', default = [1000, 4000])
+    parser.add_argument('--chunk-size', type = int, default = 500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.chunk_size), indent = 2))
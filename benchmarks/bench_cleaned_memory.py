@@ -0,0 +1,101 @@
+'''
+Compares the memory the cleaned headlines take once loaded, per row and per column:
+    -before: every text and label column as Python objects (the default dtypes of to_pandas)
+    -after: the compact schema (see code/schema.py), with categoricals for the labels, ordered
+     categoricals for the day, month and time of day, and Arrow-backed strings for the text
+It also times loading the file both ways and counting the "Group Articles By" charts from each frame.
+The data is a fake cleaned cache written to a temporary folder.
+
+Run from the project folder:
+    python benchmarks/bench_cleaned_memory.py --rows 10000 100000
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'code'))
+sys.path.insert(0, BENCH_DIR)
+import dashboard_data
+import schema
+import storage
+from bench_dashboard_rerun import write_cleaned_cache
+
+def load_objects(path):
+    '''
+    Loads a cleaned Parquet file with every text and label column as Python objects
+    '''
+    df = storage.pq.read_table(path).to_pandas()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(df[column].dtype):
+            df[column] = df[column].astype(object)
+    return df
+
+def timed(action):
+    '''
+    Returns (result, seconds) of calling 'action'
+    '''
+    start = time.perf_counter()
+    result = action()
+    return result, time.perf_counter() - start
+
+def bytes_per_row(df):
+    '''
+    Returns the deep memory of each column divided by the number of rows, and their total
+    '''
+    usage = df.memory_usage(deep = True, index = False) / max(1, len(df))
+    return round(float(usage.sum()), 1), {column: round(float(size), 1) for column, size in usage.items()}
+
+def run(rows_list):
+    '''
+    Writes each dataset size once and measures it loaded with object dtypes and with the schema
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            for rows in rows_list:
+                write_cleaned_cache(rows, country_code = f'b{rows}')
+                path = storage.cleaned_parquet_path(f'b{rows}')
+
+                before, before_seconds = timed(lambda: load_objects(path))
+                after, after_seconds = timed(lambda: storage.load_cleaned(f'b{rows}'))
+                before_total, before_columns = bytes_per_row(before)
+                after_total, after_columns = bytes_per_row(after)
+
+                #Object columns are sorted with value_counts().reindex, which the ordered categoricals don't need
+                _, count_before = timed(lambda: [
+                    before[column].value_counts().reindex(schema.ORDERED_COLUMNS[column].categories)
+                    for column in dashboard_data.GROUP_BY_OPTIONS.values()
+                ])
+                _, count_after = timed(lambda: [dashboard_data.publication_counts(after, option) for option in dashboard_data.GROUP_BY_OPTIONS])
+
+                results.append({
+                    'rows': rows,
+                    'before_bytes_per_row': before_total,
+                    'after_bytes_per_row': after_total,
+                    'reduction': round(before_total / after_total, 1) if after_total else None,
+                    'before_load_seconds': round(before_seconds, 4),
+                    'after_load_seconds': round(after_seconds, 4),
+                    'before_group_count_seconds': round(count_before, 4),
+                    'after_group_count_seconds': round(count_after, 4),
+                    'columns': {
+                        column: {'before': before_columns[column], 'after': after_columns.get(column)}
+                        for column in before_columns
+                    }
+                })
+        finally:
+            os.chdir(cwd)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark the memory of cleaned headlines with object dtypes vs the compact schema')
+    parser.add_argument('--rows', type = int, nargs = '+', default = [10000, 100000])
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows), indent = 2))
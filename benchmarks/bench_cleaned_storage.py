@@ -0,0 +1,80 @@
+'''
+Compares loading the cleaned headlines from CSV (parsing entities with literal_eval)
+against loading them from the Parquet cache.
+
+Run from the project folder:
+    python benchmarks/bench_cleaned_storage.py --rows 1000 10000 100000
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+import storage
+
+def make_dataset(rows, sample_path = os.path.join('cache', 'cleaned_headlines_us.csv')):
+    '''
+    Builds a cleaned dataset with 'rows' rows by repeating the cached US sample
+    '''
+    sample = storage.read_cleaned_csv(sample_path)
+    repeats = rows // len(sample) + 1
+    df = pd.concat([sample] * repeats, ignore_index = True).head(rows)
+    df['url'] = df['url'].astype(str) + '#' + df.index.astype(str)
+    return df
+
+def measure(load):
+    '''
+    Runs a loader and returns (seconds, peak traced allocation in bytes, DataFrame memory in bytes)
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = load()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, int(df.memory_usage(deep = True).sum())
+
+def run(rows_list):
+    '''
+    Writes each dataset size in both formats and times loading it back
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in rows_list:
+            df = make_dataset(rows)
+
+            #The CSV path is what the dashboard did before: entities stored as the string form of a list
+            csv_path = os.path.join(tmp, f'cleaned_{rows}.csv')
+            df.to_csv(csv_path, index = False)
+
+            storage.CACHE_DIR = tmp
+            parquet_path = storage.write_cleaned(df, f'bench{rows}')
+
+            csv_seconds, csv_peak, csv_bytes = measure(lambda: storage.read_cleaned_csv(csv_path))
+            pq_seconds, pq_peak, pq_bytes = measure(lambda: storage.read_cleaned_parquet(parquet_path))
+
+            results.append({
+                'rows': rows,
+                'csv_load_seconds': round(csv_seconds, 4),
+                'parquet_load_seconds': round(pq_seconds, 4),
+                'speedup': round(csv_seconds / pq_seconds, 1) if pq_seconds else None,
+                'csv_peak_bytes': csv_peak,
+                'parquet_peak_bytes': pq_peak,
+                'csv_frame_bytes': csv_bytes,
+                'parquet_frame_bytes': pq_bytes,
+                'csv_file_bytes': os.path.getsize(csv_path),
+                'parquet_file_bytes': os.path.getsize(parquet_path)
+            })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark CSV vs Parquet loading of cleaned headlines')
+    parser.add_argument('--rows', type = int, nargs = '+', default = [1000, 10000, 100000])
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows), indent = 2))
@@ -0,0 +1,100 @@
+'''
+Times dashboard reruns with Streamlit's AppTest: the first load of a country and the
+reruns caused by switching the "Group Articles By" selectbox. The dashboard reads a
+fake cleaned cache written to a temporary folder, so no API calls are made.
+
+Run from the project folder:
+    python benchmarks/bench_dashboard_rerun.py --rows 20000 --reruns 6 --format csv
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code')
+sys.path.insert(0, CODE_DIR)
+import storage
+from transform import TIME_OF_DAY_BUCKETS
+
+TOPICS = ['politics', 'sports', 'finance', 'technology', 'health', 'science', 'entertainment', 'world']
+SOURCES = ['CBS', 'CNN', 'BBC News', 'Reuters', 'Fox News', 'NBC News', 'ABC News', 'Bloomberg']
+ENTITIES = ['NASA', 'Mars', 'Elon Musk', 'Nasdaq', 'United States', 'Congress', 'NFL', 'Apple', 'Google', 'Europe']
+GROUP_OPTIONS = ['Time of Day', 'Day of Week', 'Month Published']
+
+def write_cleaned_cache(rows, country_code = 'us', file_format = 'parquet', seed = 0):
+    '''
+    Writes 'rows' fake cleaned headlines for a country to the cache folder as Parquet or as an older CSV cache
+    '''
+    rng = random.Random(seed)
+    published = pd.to_datetime([rng.randint(1.7e9, 1.75e9) for _ in range(rows)], unit = 's', utc = True)
+    df = pd.DataFrame({
+        'author': [rng.choice([None, f'Author {rng.randint(0, 300)}']) for _ in range(rows)],
+        'title': [f'Headline {i} about the news' for i in range(rows)],
+        'description': ['A short description of the story'] * rows,
+        'url': [f'https://example.com/{i}' for i in range(rows)],
+        'publishedAt': published,
+        'content': ['Story content ' * 20] * rows,
+        'source_name': [rng.choice(SOURCES) for _ in range(rows)],
+        'short_title': [f'Headline {i} about' for i in range(rows)],
+        'sentiment': [rng.choice(['positive', 'neutral', 'negative']) for _ in range(rows)],
+        'entities': [rng.sample(ENTITIES, rng.randint(1, 4)) for _ in range(rows)],
+        'topic': [rng.choice(TOPICS) for _ in range(rows)],
+        'day_of_week_published': published.day_name(),
+        'month_published': published.month_name(),
+        'time_of_day_published': [TIME_OF_DAY_BUCKETS[h // 3] for h in published.hour]
+    })
+    os.makedirs(storage.CACHE_DIR, exist_ok = True)
+    if file_format == 'csv':
+        df.to_csv(storage.cleaned_csv_path(country_code), index = False)
+    else:
+        storage.write_cleaned(df, country_code)
+
+def run(rows, reruns, file_format = 'parquet'):
+    '''
+    Returns the first load time and the time of each "Group Articles By" rerun in seconds
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            write_cleaned_cache(rows, file_format = file_format)
+            at = AppTest.from_file(os.path.join(CODE_DIR, 'dashboard.py'), default_timeout = 600)
+            at.run()
+
+            start = time.perf_counter()
+            at.sidebar.selectbox[0].select('us').run()
+            first_load = time.perf_counter() - start
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+
+            group_by = [s for s in at.selectbox if s.label == 'Group Articles By:'][0]
+            rerun_seconds = []
+            for i in range(reruns):
+                start = time.perf_counter()
+                group_by.select(GROUP_OPTIONS[(i + 1) % len(GROUP_OPTIONS)]).run()
+                rerun_seconds.append(round(time.perf_counter() - start, 4))
+                group_by = [s for s in at.selectbox if s.label == 'Group Articles By:'][0]
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'rows': rows,
+        'format': file_format,
+        'first_load_seconds': round(first_load, 4),
+        'rerun_seconds': rerun_seconds,
+        'median_rerun_seconds': sorted(rerun_seconds)[len(rerun_seconds) // 2]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark dashboard rerun latency')
+    parser.add_argument('--rows', type = int, default = 20000)
+    parser.add_argument('--reruns', type = int, default = 6)
+    parser.add_argument('--format', choices = ['parquet', 'csv'], default = 'parquet', help = 'Format of the cleaned cache')
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.reruns, args.format), indent = 2))
@@ -0,0 +1,107 @@
+'''
+Times how long the dashboard takes to start, each in a fresh Python process so nothing is already imported:
+    -cold_start: the first run of dashboard.py with no country picked
+    -rerun: running the script again in the same process, as Streamlit does on every widget change
+    -country_load: picking a country with cached data, which draws the charts
+After each step it lists which of the slow optional modules (plotly, wordcloud, requests and the
+pipeline modules) have been imported, and import_seconds gives the cold import time of each of them
+on its own. The dashboard reads a fake cleaned cache written to a temporary folder, so no API calls are made.
+
+Run from the project folder:
+    python benchmarks/bench_dashboard_startup.py --rows 5000 --repeat 3
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_DIR = os.path.join(BENCH_DIR, '..', 'code')
+
+#Modules the dashboard should only import once they are needed
+WATCHED_MODULES = ['plotly.express', 'wordcloud', 'matplotlib', 'requests', 'jobs', 'extract', 'transform']
+
+#Modules whose cold import time is measured one at a time
+IMPORTED_MODULES = ['streamlit', 'pandas', 'pyarrow.parquet', 'plotly.express', 'wordcloud', 'requests', 'transform', 'jobs', 'dashboard_data']
+
+def run_child(directory):
+    '''
+    Runs inside the fresh process: times the dashboard steps with AppTest and prints them as JSON
+    '''
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(directory)
+    sys.path.insert(0, CODE_DIR)
+    at = AppTest.from_file(os.path.join(CODE_DIR, 'dashboard.py'), default_timeout = 600)
+    results = {}
+
+    def step(name, action):
+        start = time.perf_counter()
+        action()
+        results[f'{name}_seconds'] = round(time.perf_counter() - start, 4)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        results[f'{name}_modules'] = [m for m in WATCHED_MODULES if m in sys.modules]
+
+    step('cold_start', at.run)
+    step('rerun', at.run)
+    step('country_load', lambda: at.sidebar.selectbox[0].select('us').run())
+    print(json.dumps(results))
+
+def import_seconds(module):
+    '''
+    Returns the time a fresh process takes to import 'module' with the code folder on the path
+    '''
+    script = (
+        'import sys, time; sys.path.insert(0, sys.argv[1]); start = time.perf_counter(); '
+        f'import {module}; print(time.perf_counter() - start)'
+    )
+    output = subprocess.run([sys.executable, '-c', script, CODE_DIR], capture_output = True, text = True, check = True)
+    return round(float(output.stdout.strip().splitlines()[-1]), 4)
+
+def run(rows, repeat):
+    '''
+    Returns the startup timings (the median of 'repeat' fresh processes) and the import time of each slow module
+    '''
+    sys.path.insert(0, BENCH_DIR)
+    sys.path.insert(0, CODE_DIR)
+    from bench_dashboard_rerun import write_cleaned_cache
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            write_cleaned_cache(rows)
+        finally:
+            os.chdir(cwd)
+
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', directory],
+                capture_output = True, text = True, check = True
+            )
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    results = {'rows': rows, 'repeat': repeat}
+    for key in runs[0]:
+        if key.endswith('_seconds'):
+            results[key] = sorted(r[key] for r in runs)[len(runs) // 2]
+        else:
+            results[key] = runs[0][key]
+    results['import_seconds'] = {module: import_seconds(module) for module in IMPORTED_MODULES}
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark dashboard startup and import time')
+    parser.add_argument('--rows', type = int, default = 5000)
+    parser.add_argument('--repeat', type = int, default = 3, help = 'Fresh processes to take the median of')
+    parser.add_argument('--child', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child)
+    else:
+        print(json.dumps(run(args.rows, args.repeat), indent = 2))
@@ -0,0 +1,95 @@
+'''
+Times the local (non-API) stages of the transform: text cleaning, short titles,
+time of day bucketing and numeric entity removal, per row with .apply against the
+vectorized versions.
+
+Run from the project folder:
+    python benchmarks/bench_local_stages.py --rows 100000
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+import transform
+
+WORDS = ['NASA', 'Mars', 'stocks', 'election', 'rally', 'court', 'storm', 'season', 'trade', 'vote']
+ENTITIES = ['NASA', 'Mars', '2025', '1,500', '15.5', '50%', 'Elon Musk', 'Nasdaq', 'United States', '99.9%']
+
+def make_frame(rows, seed = 0):
+    '''
+    Builds 'rows' fake raw articles with messy whitespace, publish times and entity lists
+    '''
+    rng = random.Random(seed)
+
+    #Mostly single spaced like real headlines, with the odd double space and trailing newline
+    def text(words):
+        return ' '.join(rng.choice(WORDS) for _ in range(words)) + rng.choice(['', '  ', '\n', ' \r\n '])
+
+    return pd.DataFrame({
+        'title': [text(14) for _ in range(rows)],
+        'description': [text(25) for _ in range(rows)],
+        'content': [text(40) for _ in range(rows)],
+        'publishedAt': pd.to_datetime(np.random.default_rng(seed).integers(1.7e9, 1.75e9, rows), unit = 's', utc = True),
+        'entities': [rng.sample(ENTITIES, rng.randint(0, 6)) for _ in range(rows)]
+    })
+
+def timed(fn):
+    '''
+    Returns how many seconds 'fn' takes to run
+    '''
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def run(rows):
+    '''
+    Times every local stage both ways on the same data
+    '''
+    df = make_frame(rows)
+    hours = df['publishedAt'].dt.hour
+
+    #Short titles are made from the cleaned titles, like in clean_articles
+    titles = transform.clean_text_series(df['title'])
+
+    stages = {
+        'clean_text': (
+            lambda: [df[c].apply(transform.clean_text) for c in ['title', 'description', 'content']],
+            lambda: [transform.clean_text_series(df[c]) for c in ['title', 'description', 'content']]
+        ),
+        'short_title': (
+            lambda: titles.apply(transform.create_short_title),
+            lambda: transform.create_short_title_series(titles)
+        ),
+        'time_of_day': (
+            lambda: hours.apply(transform.categorize_time_of_day),
+            lambda: transform.categorize_time_of_day_series(hours)
+        ),
+        'numeric_entities': (
+            lambda: df['entities'].apply(transform.remove_numeric_entities),
+            lambda: transform.remove_numeric_entities_series(df['entities'])
+        )
+    }
+
+    results = {'rows': rows, 'stages': {}}
+    for name, (per_row, vectorized) in stages.items():
+        per_row_seconds = timed(per_row)
+        vectorized_seconds = timed(vectorized)
+        results['stages'][name] = {
+            'apply_seconds': round(per_row_seconds, 4),
+            'vectorized_seconds': round(vectorized_seconds, 4),
+            'speedup': round(per_row_seconds / vectorized_seconds, 1) if vectorized_seconds else None
+        }
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark the per-row and vectorized local transform stages')
+    parser.add_argument('--rows', type = int, default = 100000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows), indent = 2))
@@ -0,0 +1,148 @@
+'''
+End to end pipeline benchmark against the local stub servers in stub_servers.py, so runs
+are reproducible and can be compared between versions. For every fixture size it times:
+    -fetch: fetch_top_headlines following every page, plus saving the raw CSV
+    -transform: transform_articles with a fresh enrichment cache
+    -dashboard_load: load_cleaned, the dashboard aggregates and the search index
+Results (with the stub settings and the git commit) are printed as JSON and can be written to a file.
+
+Run from the project folder:
+    python benchmarks/bench_pipeline_offline.py --sizes 10 100 1000 10000 --output bench_results.json
+    python benchmarks/bench_pipeline_offline.py --sizes 100000 --latency 0.02 --error-rate 0.01 --rate-limit-rate 0.02
+    python benchmarks/bench_pipeline_offline.py --sizes 1000 --single-document
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'code'))
+import api_budget
+import dashboard_data
+import extract
+import http_client
+import search_index
+import storage
+import transform
+from enrichment_cache import EnrichmentCache
+from stub_servers import StubConfig, StubServer, generate_articles
+
+def git_commit():
+    '''
+    Returns the commit the benchmark ran on, or None outside a git checkout
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = BENCH_DIR, capture_output = True, text = True).stdout.strip() or None
+    except OSError:
+        return None
+
+def timed(fn):
+    '''
+    Runs 'fn' with its printed output hidden and returns (result, seconds)
+    '''
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn()
+    return result, round(time.perf_counter() - start, 4)
+
+def point_pipeline_at(stub):
+    '''
+    Sends every API call the pipeline makes to the stub server
+    '''
+    urls = stub.urls()
+    extract.NEWSAPI_URL = urls['NEWSAPI_URL']
+    transform.SENTIMENT_URL = urls['SENTIMENT_URL']
+    transform.ENTITY_URL = urls['ENTITY_URL']
+    transform.GENAI_URL = urls['GENAI_URL']
+
+def run_size(size, config, max_workers, country_code = 'zz'):
+    '''
+    Runs fetch, transform and dashboard loading for one fixture size in a fresh cache folder
+    '''
+    articles = generate_articles(size, seed = config.seed)
+    with StubServer(articles, config) as stub, tempfile.TemporaryDirectory() as directory:
+        point_pipeline_at(stub)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            os.makedirs('cache')
+            transform.get_default_cache = lambda: EnrichmentCache(os.path.join('cache', 'enrichment_cache.db'))
+            #The stub servers don't count against the real daily API budget
+            api_budget._default_budget = api_budget.BudgetTracker(os.path.join('cache', 'api_budget.db'), limits = {})
+
+            fetched, fetch_seconds = timed(lambda: extract.fetch_top_headlines(country_code, max_articles = None))
+            _, save_seconds = timed(lambda: extract.save_articles_to_csv(fetched, country_code))
+
+            summary, transform_seconds = timed(lambda: transform.transform_articles(
+                country_code, max_workers = max_workers, requests_per_second = None
+            ))
+
+            def load_dashboard_data():
+                df = storage.load_cleaned(country_code)
+                dashboard_data.compute_aggregates(df)
+                search_index.build_index(df)
+                return df
+
+            df, load_seconds = timed(load_dashboard_data)
+        finally:
+            os.chdir(cwd)
+
+    def rate(rows, seconds):
+        return round(rows / seconds, 1) if seconds else None
+
+    return {
+        'size': size,
+        'fetch': {'seconds': fetch_seconds, 'save_seconds': save_seconds, 'articles': len(fetched), 'articles_per_second': rate(len(fetched), fetch_seconds)},
+        'transform': {'seconds': transform_seconds, 'rows_enriched': summary['enriched'], 'rows_kept': len(df), 'rows_per_second': rate(summary['enriched'], transform_seconds)},
+        'dashboard_load': {'seconds': load_seconds, 'rows_per_second': rate(len(df), load_seconds)},
+        'requests': dict(sorted(stub.counts.items()))
+    }
+
+def run(sizes, config, max_workers, host_limit):
+    '''
+    Runs every size and returns the full report
+    '''
+    #The stubs are on localhost, which would otherwise get the default limit of requests in flight
+    http_client.set_host_limit('127.0.0.1', host_limit)
+    return {
+        'benchmark': 'pipeline_offline',
+        'commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'stub': config.as_dict(),
+        'max_workers': max_workers,
+        'host_limit': host_limit,
+        'results': [run_size(size, config, max_workers) for size in sizes]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark the pipeline end to end against local stub APIs')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10, 100, 1000, 10000], help = 'Fixture sizes, up to 100000')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'Seconds added to every stub response')
+    parser.add_argument('--jitter', type = float, default = 0.0, help = 'Up to this many extra seconds at random')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'Share of requests answered with a 500')
+    parser.add_argument('--rate-limit-rate', type = float, default = 0.0, help = 'Share of requests answered with a 429')
+    parser.add_argument('--retry-after', type = float, default = 0.05, help = 'Retry-After seconds sent with a 429')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--single-document', action = 'store_true', help = 'Answer only one text per sentiment or entity request')
+    parser.add_argument('--max-workers', type = int, default = 8, help = 'Enrichment threads')
+    parser.add_argument('--host-limit', type = int, default = 8, help = 'Requests in flight to the stub server')
+    parser.add_argument('--output', default = None, help = 'Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.retry_after, args.seed, args.single_document)
+    report = run(args.sizes, config, args.max_workers, args.host_limit)
+    text = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,106 @@
+'''
+Times the dashboard's word cloud for one topic: the old way (flatten the entity lists, join
+them into one string, re-tokenize it with WordCloud.generate and draw it through matplotlib)
+against drawing from the precomputed frequency table, reading the cached PNG from disk and
+the in-memory st.cache_data hit a topic switch gets.
+
+Run from the project folder:
+    python benchmarks/bench_word_cloud.py --rows 20000
+'''
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import streamlit as st
+from wordcloud import WordCloud
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'code'))
+import dashboard_data
+import storage
+from bench_dashboard_rerun import write_cleaned_cache
+
+def old_word_cloud(df, topic):
+    '''
+    The word cloud section as it was: a Python loop over the entity lists, generate() and matplotlib
+    '''
+    all_entities = []
+    for entities in df[df['topic'] == topic]['entities']:
+        if isinstance(entities, list):
+            all_entities.extend(entities)
+    wordcloud = WordCloud(width = 700, height = 300, background_color = '#f0f0f0', colormap = 'Set3').generate(" ".join(all_entities))
+    fig, ax = plt.subplots(figsize = (10, 5))
+    ax.imshow(wordcloud, interpolation = 'bilinear')
+    ax.axis('off')
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format = 'png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+def timed(fn, repeat = 5):
+    '''
+    Returns the fastest of 'repeat' runs of 'fn' in milliseconds
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2)
+
+def run(rows):
+    '''
+    Times every way of getting the word cloud for the most common topic
+    '''
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            write_cleaned_cache(rows)
+            df = storage.load_cleaned('us')
+            mtime = dashboard_data.cleaned_mtime('us')
+            version = dashboard_data.dataset_version(mtime)
+            aggregates = dashboard_data.compute_aggregates(df)
+            topic = aggregates['topic_counts']['Topic'].iloc[0]
+            frequencies = aggregates['entity_frequencies'][topic]
+
+            @st.cache_data(show_spinner = False)
+            def cached_word_cloud(country_code, topic, mtime):
+                return dashboard_data.word_cloud_png(country_code, topic, version, frequencies)
+
+            def first_render():
+                path = dashboard_data.word_cloud_path('us', topic, version)
+                if os.path.exists(path):
+                    os.remove(path)
+                dashboard_data.word_cloud_png('us', topic, version, frequencies)
+
+            results = {
+                'rows': rows,
+                'topic': topic,
+                'old_generate_ms': timed(lambda: old_word_cloud(df, topic)),
+                'frequency_table_ms': timed(lambda: dashboard_data.entity_frequencies(df)),
+                'from_frequencies_ms': timed(first_render),
+                'disk_cache_hit_ms': timed(lambda: dashboard_data.word_cloud_png('us', topic, version, frequencies)),
+            }
+            cached_word_cloud('us', topic, mtime)
+            results['memory_cache_hit_ms'] = timed(lambda: cached_word_cloud('us', topic, mtime))
+        finally:
+            os.chdir(cwd)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = 'Benchmark the dashboard word cloud')
+    parser.add_argument('--rows', type = int, default = 20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows), indent = 2))
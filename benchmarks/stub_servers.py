@@ -0,0 +1,226 @@
+'''
+Local stand-ins for the News API and the three iSchool endpoints, used to benchmark the
+pipeline without the network or API quotas. One threaded HTTP server answers:
+    -GET  /v2/top-headlines              paginated articles from a generated fixture
+    -POST /api/azure/sentiment           one sentiment document per 'text' field
+    -POST /api/azure/entityrecognition   one entities document per 'text' field
+    -POST /api/genai/generate            a JSON string topic
+Every response can be slowed down, and a share of them can be turned into 500 errors or
+429 responses with a Retry-After header. The Azure endpoints can also behave like ones that only
+read a single 'text' field per request. Results are deterministic for a given seed.
+'''
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+NEWSAPI_PATH = '/v2/top-headlines'
+SENTIMENT_PATH = '/api/azure/sentiment'
+ENTITY_PATH = '/api/azure/entityrecognition'
+GENAI_PATH = '/api/genai/generate'
+
+SENTIMENTS = ['positive', 'neutral', 'negative']
+TOPICS = ['politics', 'finance', 'sports', 'technology', 'health', 'science', 'entertainment', 'world']
+ENTITIES = [
+    'United States', 'NASA', 'Nasdaq', 'Congress', 'Elon Musk', 'Federal Reserve', 'NFL', 'Apple',
+    'Google', 'Europe', 'China', 'Supreme Court', 'White House', 'Mars', 'Wall Street', 'OpenAI',
+    'World Health Organization', 'Ukraine', 'Taylor Swift', 'Premier League', '2025', '15%'
+]
+WORDS = [
+    'the', 'a', 'new', 'report', 'says', 'after', 'market', 'vote', 'plan', 'game', 'study', 'storm',
+    'court', 'deal', 'season', 'launch', 'rally', 'talks', 'budget', 'record', 'week', 'officials'
+]
+SOURCES = ['CBS News', 'CNN', 'BBC News', 'Reuters', 'Fox News', 'NBC News', 'ABC News', 'Bloomberg']
+
+class StubConfig:
+    '''
+    How the stub servers behave.
+        -'latency' seconds are added to every response, plus up to 'jitter' more at random
+        -'error_rate' is the share of requests answered with a 500
+        -'rate_limit_rate' is the share answered with a 429 and a Retry-After of 'retry_after' seconds
+        -'single_document' makes the Azure endpoints answer only the last 'text' field of a request, as document 0
+    '''
+
+    def __init__(self, latency = 0.0, jitter = 0.0, error_rate = 0.0, rate_limit_rate = 0.0, retry_after = 0.05, seed = 0,
+                 single_document = False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.single_document = single_document
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def generate_articles(count, seed = 0):
+    '''
+    Generates 'count' raw News API articles with entity names mixed into their text
+    '''
+    rng = random.Random(seed)
+
+    def sentence(words):
+        parts = [rng.choice(WORDS) for _ in range(words)]
+        parts.insert(rng.randrange(len(parts)), rng.choice(ENTITIES))
+        text = ' '.join(parts)
+        return text[0].upper() + text[1:]
+
+    return [
+        {
+            'source': {'id': None, 'name': rng.choice(SOURCES)},
+            'author': rng.choice([None, f'Reporter {rng.randrange(200)}']),
+            'title': sentence(10),
+            'description': sentence(20),
+            'url': f'https://news.example.com/{seed}/{i}',
+            'urlToImage': None,
+            'publishedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1.74e9 + rng.randrange(30 * 86400))),
+            'content': sentence(40) + f' [+{rng.randrange(100, 5000)} chars]'
+        }
+        for i in range(count)
+    ]
+
+def _pick(text, options, count = 1):
+    '''
+    Picks 'count' options from the text's checksum, so the same text always gets the same answer
+    '''
+    rng = random.Random(zlib.crc32(text.encode('utf-8')))
+    return rng.sample(options, count)
+
+class StubServer:
+    '''
+    Runs the stub endpoints on a local port in a background thread.
+    Use as a context manager, or call start() and stop()
+    '''
+
+    def __init__(self, articles = (), config = None):
+        self.articles = list(articles)
+        self.config = config or StubConfig()
+        self.counts = Counter()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def urls(self):
+        '''
+        Returns the URL of every endpoint, keyed like the pipeline's URL constants
+        '''
+        return {
+            'NEWSAPI_URL': self.base_url + NEWSAPI_PATH,
+            'SENTIMENT_URL': self.base_url + SENTIMENT_PATH,
+            'ENTITY_URL': self.base_url + ENTITY_PATH,
+            'GENAI_URL': self.base_url + GENAI_PATH
+        }
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self, 'GET')
+
+            def do_POST(self):
+                stub._handle(self, 'POST')
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _fault(self):
+        '''
+        Returns 500, 429 or None for a request, drawn from the configured rates
+        '''
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.config.error_rate:
+            return 500
+        if roll < self.config.error_rate + self.config.rate_limit_rate:
+            return 429
+        return None
+
+    def _handle(self, request, method):
+        url = urlparse(request.path)
+        body = request.rfile.read(int(request.headers.get('Content-Length') or 0)).decode('utf-8')
+
+        delay = self.config.latency + (random.uniform(0, self.config.jitter) if self.config.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        routes = {
+            ('GET', NEWSAPI_PATH): lambda: self._top_headlines(parse_qs(url.query)),
+            ('POST', SENTIMENT_PATH): lambda: self._documents(parse_qs(body), lambda text: {'sentiment': _pick(text, SENTIMENTS)[0]}),
+            ('POST', ENTITY_PATH): lambda: self._documents(parse_qs(body), lambda text: {'entities': [{'text': e} for e in self._entities(text)]}),
+            ('POST', GENAI_PATH): lambda: _pick(parse_qs(body).get('query', [''])[0], TOPICS)[0]
+        }
+        route = routes.get((method, url.path))
+
+        fault = self._fault() if route is not None else None
+        status = 404 if route is None else (fault or 200)
+        with self._lock:
+            self.counts[f'{url.path} {status}'] += 1
+
+        headers = {}
+        if status == 200:
+            payload = route()
+        elif status == 429:
+            payload = {'error': 'Too many requests'}
+            headers['Retry-After'] = str(self.config.retry_after)
+        else:
+            payload = {'error': 'Stub error' if status == 500 else 'Not found'}
+
+        data = json.dumps(payload).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _top_headlines(self, params):
+        page_size = min(int(params.get('pageSize', ['20'])[0]), 100)
+        page = int(params.get('page', ['1'])[0])
+        start = (page - 1) * page_size
+        return {'status': 'ok', 'totalResults': len(self.articles), 'articles': self.articles[start:start + page_size]}
+
+    def _entities(self, text):
+        #Finds the fixture's entity names in the text, like a real recognizer would
+        return [entity for entity in ENTITIES if entity in text]
+
+    def _documents(self, form, analyze):
+        texts = form.get('text', [])
+
+        #A single-document endpoint keeps the last value of a repeated field, like most form parsers
+        if self.config.single_document:
+            texts = texts[-1:]
+        documents = [dict(id = str(i), **analyze(text)) for i, text in enumerate(texts)]
+        return {'results': {'documents': documents}}
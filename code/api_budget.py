@@ -0,0 +1,309 @@
+'''
+Tracks how many calls are made to the News API and the iSchool APIs each day, so the pipeline
+can stay inside the free tier limits instead of finding out from a failed request.
+
+The counts are kept in a small SQLite file, so the dashboard, the pipeline runner and a cron job
+all share them. install() registers the tracker as an http_client hook: every request attempt is
+counted, and a request that would go over the day's limit raises BudgetExceededError before it is sent.
+
+Work that plans its calls up front (EX: one country's enrichment) reserves them with reserve(), so
+several countries running at once can't each plan against the whole day's budget.
+'''
+import contextvars
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+try:
+    from . import http_client
+    from .http_client import QuotaExceededError
+except ImportError:
+    import http_client
+    from http_client import QuotaExceededError
+
+#SQLite file holding the number of calls made to each API per day
+BUDGET_PATH = os.path.join('cache', 'api_budget.db')
+
+#Calls allowed per day (UTC) on each API. Change these to match your keys, None means no limit
+DAILY_LIMITS = {
+    'newsapi': 100,
+    'ischool': 100
+}
+
+#Default cap on how many articles are fetched for a country, to keep the iSchool API usage per run low.
+#Kept here rather than in extract so the dashboard can plan a run without loading the fetch pipeline
+DEFAULT_MAX_ARTICLES = 15
+
+#Share of the planned calls reserved on top for retries, which the hook counts like any other request
+RETRY_HEADROOM = 0.1
+
+#Which API each host belongs to. Requests to other hosts aren't counted
+HOST_APIS = {
+    'newsapi.org': 'newsapi',
+    'cent.ischool-iot.net': 'ischool'
+}
+
+class BudgetExceededError(QuotaExceededError):
+    '''
+    Raised when a call would go over a call budget. Subclasses QuotaExceededError,
+    so everything that stops on a used up quota stops on this too
+    '''
+
+def today():
+    '''
+    Returns the day calls are counted under, as YYYY-MM-DD in UTC
+    '''
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+def document_calls_needed(texts, batch_size, batching = True):
+    '''
+    Returns the most calls one Azure endpoint (sentiment or entities) can take for 'texts' texts:
+    one per batch if it is known to batch (True), one per text if it is known to read only one text per
+    request (False), and both if that isn't known yet (None), since every batch may come back unmatched
+    and be sent again one text per request
+    '''
+    if batching is False:
+        return texts
+    batches = math.ceil(texts / batch_size)
+    return batches if batching else texts + batches
+
+def ischool_calls_needed(articles, batch_size, uncached = None, batching = (True, True)):
+    '''
+    Returns the most iSchool calls enriching 'articles' articles can take: the sentiment and entity
+    requests for the 'uncached' articles (all of them by default) plus one topic request per article.
+    'batching' is how the sentiment and entity endpoints are known to behave (see document_calls_needed).
+    Shared topics and cached topics only lower it
+    '''
+    uncached = articles if uncached is None else uncached
+    return sum(document_calls_needed(uncached, batch_size, known) for known in batching) + articles
+
+def with_retry_headroom(calls):
+    '''
+    Returns 'calls' plus RETRY_HEADROOM of them for retries, rounded up
+    '''
+    return calls + math.ceil(calls * RETRY_HEADROOM)
+
+def country_calls_needed(max_articles, batch_size, page_size = 100):
+    '''
+    Returns the calls one country's fetch and enrichment can take on each API, as {api: calls}
+    '''
+    return {
+        'newsapi': max(1, math.ceil(max_articles / page_size)),
+        'ischool': ischool_calls_needed(max_articles, batch_size)
+    }
+
+#The reservation requests made in this context are drawn from (see Reservation). Copied into worker threads with the context
+_current_reservation = contextvars.ContextVar('current_reservation', default = None)
+
+class Reservation:
+    '''
+    Calls set aside on one API for one piece of work, made by BudgetTracker.reserve. Used as a context manager:
+    requests made inside it, including from worker threads started with a copy of its context, are drawn
+    from it first, and the calls it didn't use are released at the end
+    '''
+
+    def __init__(self, tracker, api, calls):
+        self.tracker = tracker
+        self.api = api
+        self.calls = calls
+        self.left = calls
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_reservation.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_reservation.reset(self._token)
+        self.release()
+
+    def release(self):
+        '''
+        Gives the calls that weren't used back to the day's budget
+        '''
+        self.tracker._release(self)
+
+class BudgetTracker:
+    '''
+    Persistent per-day call counter for the tracked APIs. Safe to share between threads
+    '''
+
+    def __init__(self, path = BUDGET_PATH, limits = None):
+        self.path = path
+        self.limits = dict(DAILY_LIMITS if limits is None else limits)
+        self._lock = threading.Lock()
+
+        #Calls reserved and not used yet on each API, by this process
+        self._reserved = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        self._conn = sqlite3.connect(path, check_same_thread = False)
+        with self._conn:
+            self._conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS usage (
+                    day TEXT NOT NULL,
+                    api TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    PRIMARY KEY (day, api)
+                )
+                '''
+            )
+
+    def _used(self, api, day):
+        row = self._conn.execute('SELECT calls FROM usage WHERE day = ? AND api = ?', (day, api)).fetchone()
+        return row[0] if row else 0
+
+    def used(self, api):
+        '''
+        Returns how many calls were made to 'api' today
+        '''
+        with self._lock:
+            return self._used(api, today())
+
+    def remaining(self, api):
+        '''
+        Returns how many calls are left on 'api' today, or None if it has no limit
+        '''
+        limit = self.limits.get(api)
+        if limit is None:
+            return None
+        return max(0, limit - self.used(api))
+
+    def available(self, api):
+        '''
+        Returns how many calls are left on 'api' today once the reserved ones are taken out, or None if it has no limit
+        '''
+        limit = self.limits.get(api)
+        if limit is None:
+            return None
+        with self._lock:
+            return max(0, limit - self._used(api, today()) - self._reserved.get(api, 0))
+
+    def can_afford(self, calls):
+        '''
+        Returns True if every API in {api: calls} has that many unreserved calls left today
+        '''
+        for api, needed in calls.items():
+            available = self.available(api)
+            if available is not None and available < needed:
+                return False
+        return True
+
+    def reserve(self, api, calls):
+        '''
+        Sets 'calls' calls on 'api' aside for one piece of work, so other work can't spend or reserve them.
+        Returns a Reservation to run the work in. Raises BudgetExceededError if they aren't available
+        '''
+        limit = self.limits.get(api)
+        with self._lock:
+            reserved = self._reserved.get(api, 0)
+            if calls and limit is not None and self._used(api, today()) + reserved + calls > limit:
+                raise BudgetExceededError(f'Only {max(0, limit - self._used(api, today()) - reserved)} {api} calls are left to reserve')
+            self._reserved[api] = reserved + calls
+        return Reservation(self, api, calls)
+
+    def _release(self, reservation):
+        with self._lock:
+            self._reserved[reservation.api] = self._reserved.get(reservation.api, 0) - reservation.left
+            reservation.left = 0
+
+    def spend(self, api, calls = 1):
+        '''
+        Counts 'calls' calls to 'api' if they fit in today's limit. Calls made inside a Reservation
+        are drawn from it first, and other calls can't use the calls reserved for other work.
+        Raises BudgetExceededError, without counting them, if they don't fit
+        '''
+        day = today()
+        limit = self.limits.get(api)
+        reservation = _current_reservation.get()
+        with self._lock:
+            used = self._used(api, day)
+            reserved = self._reserved.get(api, 0)
+            drawn = 0
+            if reservation is not None and reservation.tracker is self and reservation.api == api:
+                drawn = min(calls, reservation.left)
+            if limit is not None and used + reserved - drawn + calls > limit:
+                raise BudgetExceededError(f'Daily budget of {limit} {api} calls is used up')
+            if drawn:
+                reservation.left -= drawn
+                self._reserved[api] = reserved - drawn
+            with self._conn:
+                self._conn.execute(
+                    'INSERT INTO usage (day, api, calls) VALUES (?, ?, ?) ON CONFLICT (day, api) DO UPDATE SET calls = calls + ?',
+                    (day, api, calls, calls)
+                )
+
+    def mark_used_up(self, api):
+        '''
+        Sets today's count for 'api' to its limit. Used when the API says its quota is gone before our count does
+        '''
+        limit = self.limits.get(api)
+        if limit is None:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT INTO usage (day, api, calls) VALUES (?, ?, ?) ON CONFLICT (day, api) DO UPDATE SET calls = MAX(calls, ?)',
+                    (today(), api, limit, limit)
+                )
+
+    def usage(self):
+        '''
+        Returns today's used, limit and remaining calls of every tracked API
+        '''
+        return {
+            api: {'used': self.used(api), 'limit': limit, 'remaining': self.remaining(api)}
+            for api, limit in self.limits.items()
+        }
+
+    def __call__(self, host):
+        #http_client hook: counts the request, or stops it if it would go over the limit
+        api = HOST_APIS.get(host)
+        if api is not None:
+            try:
+                self.spend(api)
+            except BudgetExceededError as e:
+                e.host = host
+                raise
+
+_default_budget = None
+_default_lock = threading.Lock()
+_installed = None
+
+def get_default_budget():
+    '''
+    Returns the shared tracker stored at BUDGET_PATH, opening it the first time it is needed
+    '''
+    global _default_budget
+    with _default_lock:
+        if _default_budget is None:
+            _default_budget = BudgetTracker()
+    return _default_budget
+
+def install():
+    '''
+    Registers the shared tracker as an http_client hook, once, so every request from this process is counted.
+    Returns the tracker
+    '''
+    global _installed
+    budget = get_default_budget()
+    with _default_lock:
+        if _installed is not budget:
+            if _installed is not None:
+                http_client.remove_before_request_hook(_installed)
+            http_client.add_before_request_hook(budget)
+            _installed = budget
+    return budget
+
+def record_quota_error(error):
+    '''
+    Marks an API as used up for the day when it reported its own quota as gone (see QuotaExceededError.used_up),
+    so later runs switch to cached data without trying it again
+    '''
+    api = HOST_APIS.get(error.host)
+    if api is not None and getattr(error, 'used_up', False):
+        get_default_budget().mark_used_up(api)
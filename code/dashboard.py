@@ -2,13 +2,20 @@ import streamlit as st
 import pandas as pd 
 import os
 import shutil
-import plotly.express as px
+import sys
 import random
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import ast
-from extract import fetch_top_headlines, save_articles_to_csv
-from transform import transform_articles
+from enrichment_cache import CACHE_PATH as ENRICHMENT_CACHE_PATH, get_default_cache
+from schema import ORDERED_COLUMNS
+from storage import cached_countries, load_cleaned
+from dashboard_data import (
+    AUTHOR_SORT_OPTIONS, AUTHORS_PER_PAGE, GROUP_BY_OPTIONS, cleaned_mtime, compute_aggregates, dataset_version,
+    page_of, search_authors, word_cloud_png
+)
+from search_index import load_index, search, top_entities
+from metrics import RUN_LOG_PATH, read_runs, run_summary
+from api_budget import BUDGET_PATH, DEFAULT_MAX_ARTICLES, country_calls_needed, get_default_budget
+from enrich import DEFAULT_BATCH_SIZE
+from history import HISTORY_DIR, entity_trends, sentiment_trends, snapshot_dates, topic_trends
 
 #Defines the webpage title
 st.set_page_config(page_title="News Headlines Dashboard", layout="wide")
@@ -30,31 +37,98 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+#Plotly and the pipeline modules (jobs, extract, transform) are slow to import, so they are only imported
+#when a chart is drawn or a country has to be fetched. A page without a country selected never loads them
+def find_job(country_code):
+    '''
+    Returns the pipeline job of a country, or None. No job can exist before the jobs module
+    is imported to start one, so it isn't imported just to look
+    '''
+    jobs = sys.modules.get('jobs')
+    return jobs.get_job(country_code) if jobs is not None else None
+
 #Function that returns the countries that have cleaned cache files
 def get_cached_countries():
     '''
     Returns a list of countries data that is stored in the cache
     '''
-    cached_files = os.listdir('cache')
-    cached_countries = [
-        filename.replace('cleaned_headlines_', '').replace('.csv', '')
-        for filename in cached_files
-        if filename.startswith('cleaned_headlines_')
-    ]
-
-    return cached_countries
-
-#Function to check for missing values in entities
-def safe_parse_entities(x):
-    if isinstance(x, str) and x.strip() not in ["", "[]"]:
-        try:
-            return ast.literal_eval(x)
-        except (ValueError, SyntaxError):
-            return []
-    elif isinstance(x, list):
-        return x
+    return cached_countries()
+
+#Streamlit reruns this whole script on every widget change, so loading and counting are cached.
+#The file's modification time is part of the key, so a rewritten cache file is read again
+@st.cache_data(show_spinner = False)
+def load_country_data(country_code, mtime):
+    '''
+    Loads the cleaned headlines for a country, with the compact column types in schema
+    '''
+    return load_cleaned(country_code)
+
+@st.cache_data(show_spinner = False)
+def load_country_aggregates(country_code, mtime, collapse = False):
+    '''
+    Computes the chart counts, author list and topic list for a country,
+    counting near-duplicate articles once if 'collapse' is set
+    '''
+    return compute_aggregates(load_country_data(country_code, mtime), collapse)
+
+#The index is only read, so one shared copy is kept instead of a copy per rerun
+@st.cache_resource(show_spinner = False)
+def load_search_index(country_code, mtime):
+    '''
+    Loads the saved search index for a country, building and saving it if the data changed
+    '''
+    return load_index(country_code, load_country_data(country_code, mtime), dataset_version(mtime))
+
+#Trends only read the snapshot partitions inside the chosen dates. A new run rewrites the cleaned file, so its mtime is the key
+@st.cache_data(show_spinner = False)
+def load_trends(country_code, start, end, mtime):
+    '''
+    Returns the topic and sentiment trends of a country between two fetch dates
+    '''
+    return {
+        'topics': topic_trends(country_code, start, end),
+        'sentiment': sentiment_trends(country_code, start, end)
+    }
+
+@st.cache_data(show_spinner = False)
+def load_entity_trends(country_code, entities, start, end, mtime):
+    '''
+    Returns the mentions per fetch date of the chosen entities, or of the most mentioned ones if none are chosen
+    '''
+    return entity_trends(country_code, list(entities) or None, start, end)
+
+@st.cache_data(show_spinner = False)
+def load_word_cloud(country_code, topic, mtime, collapse = False):
+    '''
+    Returns the word cloud PNG for a topic, drawn once per (country, topic, dataset version, collapse)
+    '''
+    frequencies = load_country_aggregates(country_code, mtime, collapse)['entity_frequencies'][topic]
+    return word_cloud_png(country_code, topic, dataset_version(mtime), frequencies, 'collapsed' if collapse else None)
+
+#Redraws only the progress section every second while the pipeline job runs, so the rest of the page stays usable
+@st.fragment(run_every = 1)
+def show_job_progress(country_code):
+    '''
+    Shows the rows enriched, API calls made and time left for a country's pipeline job.
+    Reruns the whole page once the job stops so the data (or the error) is shown
+    '''
+    job = find_job(country_code)
+    if job is None or not job.running:
+        st.rerun()
+
+    progress = job.progress()
+    if progress['status'] == 'fetching':
+        st.progress(0.0, text = "Fetching headlines...")
     else:
-        return []
+        total = progress['rows_total'] or 0
+        fraction = progress['rows_done'] / total if total else 0.0
+        st.progress(min(fraction, 1.0), text = f"Enriched {progress['rows_done']} of {total} articles")
+
+    eta = f"{progress['eta_seconds']:.0f}s" if progress['eta_seconds'] is not None else "estimating..."
+    col1, col2, col3 = st.columns(3)
+    col1.metric("API Calls", progress['api_calls'])
+    col2.metric("Elapsed", f"{progress['elapsed_seconds']:.0f}s")
+    col3.metric("Time Left", eta)
 
 if 'country_code' not in st.session_state:
     st.session_state.country_code = 'Select a Country...'
@@ -62,12 +136,21 @@ if 'country_code' not in st.session_state:
 #All the countries the news API supports
 all_country_codes = ['us', 'gb', 'ca', 'au']
 
-#Sets the API daily limit to false
-api_limit_exceeded = False
+#Checks today's API budget before anything is fetched: if it can't pay for a full country run,
+#the dashboard switches to cached data instead of waiting for a call to fail
+budget = get_default_budget()
+api_limit_exceeded = (
+    st.session_state.api_limit_exceeded or
+    not budget.can_afford(country_calls_needed(DEFAULT_MAX_ARTICLES, DEFAULT_BATCH_SIZE))
+)
 
 #If the API daily limit is exceeded only uses countries with data already in the cache
+#Countries with a job still running stay selectable so their progress can be followed
 if api_limit_exceeded:
-    dropdown_options = get_cached_countries()
+    running = [c for c in all_country_codes if find_job(c) is not None and find_job(c).running]
+    dropdown_options = sorted(set(get_cached_countries()) | set(running))
+    if st.session_state.country_code not in dropdown_options:
+        st.session_state.country_code = 'Select a Country...'
 else:
     dropdown_options = all_country_codes
 
@@ -81,18 +164,44 @@ country_code = st.sidebar.selectbox(
     key='country_code'
 )
 
+if api_limit_exceeded:
+    st.sidebar.warning("⚠️ Today's API budget is used up, only countries with cached data can be picked.")
+
 st.sidebar.markdown("### Admin Controls ⚙️")
 
+#Calls used today against each API's daily budget
+for api, usage in budget.usage().items():
+    limit = usage['limit'] if usage['limit'] is not None else '∞'
+    st.sidebar.caption(f"{'News API' if api == 'newsapi' else 'iSchool API'}: {usage['used']} of {limit} calls used today")
+
 # Add a clear cache button
 if st.sidebar.button("Clear Cache 🗑️"):
     cache_dir = 'cache'
     if os.path.exists(cache_dir):
         for filename in os.listdir(cache_dir):
             file_path = os.path.join(cache_dir, filename)
+
+            #Keeps the enrichment results so cleared articles don't have to be re-analyzed, the run log,
+            #the API usage counts and the snapshot history
+            if os.path.normpath(file_path) in (
+                os.path.normpath(ENRICHMENT_CACHE_PATH), os.path.normpath(RUN_LOG_PATH),
+                os.path.normpath(BUDGET_PATH), os.path.normpath(os.path.join(cache_dir, HISTORY_DIR))
+            ):
+                continue
             try:
-                os.remove(file_path)
+                if os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+                else:
+                    os.remove(file_path)
             except Exception as e:
                 st.error(f"Failed to delete {filename}: {e}")
+
+        #Only drops enrichment results that are past their expiry
+        get_default_cache().prune()
+
+        #Finished jobs are forgotten so the cleared countries are fetched again when picked
+        if 'jobs' in sys.modules:
+            sys.modules['jobs'].clear_finished_jobs()
         if 'country_code' in st.session_state:
             del st.session_state['country_code']
         st.session_state.cache_cleared = True
@@ -104,63 +213,98 @@ if st.session_state.get("cache_cleared", False):
     st.success("✅ Cache cleared successfully!")
     del st.session_state["cache_cleared"]
 
+#Latest pipeline runs from the run log, showing where the time of each run went
+with st.sidebar.expander("Recent Runs ⏱️"):
+    runs = read_runs(limit = 10)
+    if not runs:
+        st.caption("No pipeline runs logged yet.")
+    else:
+        st.dataframe(pd.DataFrame([run_summary(run) for run in runs]), hide_index = True)
+
+        selected_run = st.selectbox(
+            "Run Details",
+            range(len(runs)),
+            format_func = lambda i: f"{runs[i]['started_at'][:19].replace('T', ' ')} {runs[i]['country'].upper()} ({runs[i]['status']})"
+        )
+        run = runs[selected_run]
+
+        #Sentiment, entities and topic run side by side, so their times add up every call and can pass the run's wall time
+        stages = pd.DataFrame(
+            [{'Stage': name, 'Seconds': stage['seconds'], 'Calls': stage['calls']} for name, stage in run['stages'].items()],
+            columns = ['Stage', 'Seconds', 'Calls']
+        ).sort_values('Seconds', ascending = False)
+        st.markdown(f"**Stages** ({run['seconds']}s total)")
+        st.dataframe(stages, hide_index = True)
+
+        endpoints = pd.DataFrame(
+            [
+                {
+                    'Endpoint': name,
+                    'Calls': endpoint['calls'],
+                    'Retries': endpoint['retries'],
+                    'Errors': endpoint['errors'],
+                    'Avg ms': round(1000 * endpoint['seconds'] / endpoint['calls']) if endpoint['calls'] else 0,
+                    'Latency': ', '.join(f'{bucket}: {count}' for bucket, count in endpoint['latency'].items())
+                }
+                for name, endpoint in run['endpoints'].items()
+            ],
+            columns = ['Endpoint', 'Calls', 'Retries', 'Errors', 'Avg ms', 'Latency']
+        )
+        st.markdown("**API Calls**")
+        st.dataframe(endpoints, hide_index = True)
+
+        if run['dropped']:
+            st.markdown("**Rows Dropped**")
+            st.table(pd.DataFrame(list(run['dropped'].items()), columns = ['Reason', 'Rows']))
+        if run['error']:
+            st.error(run['error'])
+
 #When a country is selected run the following
 if country_code != 'Select a Country...':
     
-    if st.session_state.get('api_limit_exceeded', False):
-        st.error("❌ API limit was already exceeded. Please use cached data.")
-        st.stop()
-
-    #Gets the filepath name for the clean data (end result of pipeline)
-    cleaned_file_path = f'cache/cleaned_headlines_{country_code.lower()}.csv'
+    #Loads the clean data (end result of pipeline), reading Parquet or falling back to an older CSV cache
+    mtime = cleaned_mtime(country_code.lower())
+    df = load_country_data(country_code.lower(), mtime) if mtime is not None else None
 
     #If the selected countries clean data already exists...
-    if os.path.exists(cleaned_file_path):
+    if df is not None:
         st.success(f"✅ Loaded cached cleaned headlines for '{country_code.upper()}'") #Display loaded cache data
-        df = pd.read_csv(cleaned_file_path) #Sets the cleaned data to DF
-        if 'entities' in df.columns:
-            df['entities'] = df['entities'].apply(safe_parse_entities)
-        else:
-            df['entities'] = [[] for _ in range(len(df))]
     else: #If the selected countries clean data doesn't exist in cache
 
-        try:
-            st.info(f"🔄 Fetching fresh top headlines for '{country_code.upper()}'...")
-
-            #Extract raw headlines
-            articles = fetch_top_headlines(country_code.lower())
-            st.write(f"🔎 Articles fetched: {len(articles)}")
-
-            if len(articles) == 0:
-                st.error(f"❌ No news articles found for '{country_code.upper()}' at this time. Please select another country.")
+        #Starts the pipeline in the background, or re-attaches to the job already running for this country.
+        #A new job is only started if the budget can pay for it, otherwise only cached data can be used
+        from jobs import get_job, start_job
+        job = get_job(country_code.lower())
+        if job is None or job.status == 'done':
+            if api_limit_exceeded:
+                st.error("❌ API limit was already exceeded. Please use cached data.")
                 st.stop()
+            job = start_job(country_code.lower())
 
-            #Save raw headlines to CSV
-            save_articles_to_csv(articles, country_code.lower())
-            st.write(f"✅ Saved raw articles to cache/top_headlines_{country_code.lower()}.csv")
+        if job.running:
+            st.info(f"🔄 Fetching and analyzing fresh top headlines for '{country_code.upper()}' in the background...")
+            show_job_progress(country_code.lower())
+            st.stop()
 
-            st.info(f"⏰This step may take a minute. Please be patient")
-
-            #Transform raw headlines into cleaned DF
-            transform_articles(country_code.lower())
-            df = pd.read_csv(cleaned_file_path)
-            if 'entities' in df.columns:
-                df['entities'] = df['entities'].apply(safe_parse_entities)
-            else:
-                df['entities'] = [[] for _ in range(len(df))]
+        #The job stopped without writing the cleaned data
+        if job.status == 'quota_exceeded':
+            #If API error because of daily usage limit, switch to cached-only mode
+            st.session_state.api_limit_exceeded = True
+            st.error("❌ API daily usage limit exceeded. Please use a cached country or try again later.")
+        elif job.status == 'no_articles':
+            st.error(f"❌ No news articles found for '{country_code.upper()}' at this time. Please select another country.")
+        else:
+            st.error(f"❌ Error loading data: {job.error}")
 
-            #Displays success message when loaded
-            st.success(f"✅ Successfully cleaned and cached headlines for '{country_code.upper()}'")
+        if not st.session_state.api_limit_exceeded and st.button("🔁 Try Again"):
+            start_job(country_code.lower())
+            st.rerun()
+        st.stop()
 
-        except Exception as e:
-            #If API error because of daily usage limit, switch to cached-only mode
-            if "Daily API usage" in str(e):
-                st.session_state.api_limit_exceeded = True
-                st.error("❌ API daily usage limit exceeded. Please use a cached country or try again later.")
-                st.stop()
-            else:
-                st.error(f"❌ Error loading data: {e}")
-                st.stop()
+    #Stories carried by several outlets can be counted once in the charts and author list
+    collapse = 'cluster_id' in df.columns and st.toggle("Collapse near-duplicate stories", value = False,
+                                                          help = "Count a story carried by several outlets once")
+    aggregates = load_country_aggregates(country_code.lower(), mtime, collapse)
 
     st.subheader(f"Preview of 3 Top Headlines in {country_code.upper()} 🎥")
 
@@ -181,31 +325,55 @@ if country_code != 'Select a Country...':
         st.session_state.random_articles = get_random_articles(df)
         st.rerun()
 
-    st.subheader("Authors and Their Articles (Short Titles) ✍️")
+    ##SEARCH
+    st.subheader("Search Headlines 🔍")
+
+    # Searches go through the saved index, so only the matching rows are looked at
+    index = load_search_index(country_code.lower(), mtime)
+
+    search_col, entity_col, sentiment_col = st.columns([2, 2, 1])
+    query = search_col.text_input("Search titles and stories", placeholder = "EX: election results")
+    selected_entities = entity_col.multiselect("Mentions", top_entities(index))
+    selected_sentiment = sentiment_col.selectbox("Sentiment", ['Any'] + sorted(index['sentiment']))
 
-    # Drop rows with missing authors
-    authors = df.dropna(subset=['author'])
+    if query or selected_entities or selected_sentiment != 'Any':
+        matches = search(index, query, selected_entities, None if selected_sentiment == 'Any' else selected_sentiment)
+        st.write(f"🔎 {len(matches)} matching articles")
+        if len(matches):
+            results = df.iloc[matches[:100]][['short_title', 'source_name', 'sentiment', 'topic', 'publishedAt']]
+            st.dataframe(results, hide_index = True)
 
-    # Group titles under each author
-    grouped = authors.groupby('author')['short_title'].apply(list).reset_index()
+    st.subheader("Authors and Their Articles (Short Titles) ✍️")
 
-    # Display authors with expanders
-    for _, row in grouped.iterrows():
-        with st.expander(row['author']):
-            for title in row['short_title']:
+    # Authors with their article ids, indexed once per loaded file
+    author_col, sort_col, page_col = st.columns([2, 1, 1])
+    author_query = author_col.text_input("Search authors", placeholder = "EX: Smith")
+    author_sort = sort_col.selectbox("Sort authors by", AUTHOR_SORT_OPTIONS)
+    authors = search_authors(aggregates['authors'], author_query, author_sort)
+    page_count = max(1, -(-len(authors) // AUTHORS_PER_PAGE))
+
+    #The page goes back to 1 whenever the search or the order changes
+    page = page_col.number_input(f"Page (of {page_count})", min_value = 1, max_value = page_count, value = 1,
+                                 key = f"author_page_{author_query}_{author_sort}")
+    visible, page_count = page_of(authors, page)
+    st.caption(f"{len(authors)} authors")
+
+    # Only the authors on this page get expanders, and their titles are looked up when drawn
+    for _, row in visible.iterrows():
+        with st.expander(f"{row['author']} ({row['article_count']})"):
+            for title in df.loc[row['article_ids'], 'short_title']:
                 st.markdown(f"- {title}")
     
     st.subheader(f'{country_code.upper()} Top Headlines Analysis📈')
 
-    ##TOPIC BAR CHART / SENTIMENT BAR CHART
+    #Imported here so pages without charts don't pay for plotly
+    import plotly.express as px
 
-    #Gets the count of the topics in the data 
-    topic_counts = df['topic'].value_counts().reset_index()
-    topic_counts.columns = ['Topic', 'Article Count']
+    ##TOPIC BAR CHART / SENTIMENT BAR CHART
 
-    #Gets count of the sentiment in the data 
-    sentiment_counts = df['sentiment'].value_counts().reset_index()
-    sentiment_counts.columns = ['Sentiment', 'Count']
+    #Gets the count of the topics and the sentiment in the data
+    topic_counts = aggregates['topic_counts']
+    sentiment_counts = aggregates['sentiment_counts']
 
     #Create Streamlit columns
     col1, col2 = st.columns(2)
@@ -272,35 +440,12 @@ if country_code != 'Select a Country...':
     #Chooses the level of aggregation for chart
     group_by_option = st.selectbox(
     "Group Articles By:",
-    ("Time of Day", "Day of Week", "Month Published")
+    tuple(GROUP_BY_OPTIONS)
     )
 
-    #If time of day selected, order the time of day chronologically and count the values
-    if group_by_option == "Time of Day":
-        group_col = 'time_of_day_published'
-        time_order = [
-            "12AM-3AM", "3AM-6AM", "6AM-9AM", "9AM-12PM",
-            "12PM-3PM", "3PM-6PM", "6PM-9PM", "9PM-12AM"
-        ]
-        counts = df[group_col].value_counts().reindex(time_order).reset_index()
-        counts.columns = [group_col, 'Article Count']
-
-    #If day of week chosen, order the day of week chronologically and count the values
-    elif group_by_option == "Day of Week":
-        group_col = 'day_of_week_published'
-        day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        counts = df[group_col].value_counts().reindex(day_order).reset_index()
-        counts.columns = [group_col, 'Article Count']
-
-    #If niether of the other two are chosen, aggregate by month and sort in chronolical order
-    else:  # Month Published
-        group_col = 'month_published'
-        month_order = [
-            "January", "February", "March", "April", "May", "June",
-            "July", "August", "September", "October", "November", "December"
-        ]
-        counts = df[group_col].value_counts().reindex(month_order).dropna().reset_index()
-        counts.columns = [group_col, 'Article Count']
+    #Looks up the counts for the chosen grouping, already in chronological order
+    group_col = GROUP_BY_OPTIONS[group_by_option]
+    counts = aggregates['publication_counts'][group_by_option]
 
     #Creates the bar chart with same color scheme as other graphs
     fig_trends = px.bar(
@@ -309,6 +454,7 @@ if country_code != 'Select a Country...':
     y='Article Count',
     color=group_col,
     color_discrete_sequence=px.colors.qualitative.Set3,
+    category_orders={group_col: list(ORDERED_COLUMNS[group_col].categories)},
     title=f"Articles Published by {group_by_option}"
     )
 
@@ -323,31 +469,70 @@ if country_code != 'Select a Country...':
     #Displays the chart
     st.plotly_chart(fig_trends, use_container_width=True)
 
+    ##TRENDS OVER TIME
+    st.subheader("Trends Over Time 📅")
+
+    #Only the snapshot folder names are listed here, no data is read until dates are picked
+    dates = snapshot_dates(country_code.lower())
+    if len(dates) < 2:
+        st.info("Trends show up once headlines have been fetched on at least two different days.")
+    else:
+        start, end = st.select_slider("Fetch Dates", options = dates, value = (dates[max(0, len(dates) - 30)], dates[-1]))
+        trends = load_trends(country_code.lower(), start, end, mtime)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            fig_topics = px.line(
+                trends['topics'],
+                x = 'fetch_date',
+                y = 'share',
+                color = 'topic',
+                markers = True,
+                color_discrete_sequence = px.colors.qualitative.Set3,
+                title = 'Share of Articles by Topic'
+            )
+            fig_topics.update_layout(plot_bgcolor = '#f0f0f0', paper_bgcolor = '#f0f0f0', xaxis_title = 'Fetch Date', yaxis_title = 'Share of Articles', yaxis_tickformat = '.0%')
+            st.plotly_chart(fig_topics, use_container_width = True)
+
+        with col2:
+            fig_sentiment = px.area(
+                trends['sentiment'],
+                x = 'fetch_date',
+                y = 'share',
+                color = 'sentiment',
+                color_discrete_map = sentiment_color_map,
+                title = 'Sentiment Over Time'
+            )
+            fig_sentiment.update_layout(plot_bgcolor = '#f0f0f0', paper_bgcolor = '#f0f0f0', xaxis_title = 'Fetch Date', yaxis_title = 'Share of Articles', yaxis_tickformat = '.0%')
+            st.plotly_chart(fig_sentiment, use_container_width = True)
+
+        #Entity mentions over the same dates, the most mentioned ones unless others are picked
+        chosen_entities = st.multiselect("Entities to Follow", top_entities(index))
+        mentions = load_entity_trends(country_code.lower(), tuple(chosen_entities), start, end, mtime)
+        fig_entities = px.line(
+            mentions,
+            x = 'fetch_date',
+            y = 'count',
+            color = 'entity',
+            markers = True,
+            color_discrete_sequence = px.colors.qualitative.Set3,
+            title = 'Entity Mentions Over Time'
+        )
+        fig_entities.update_layout(plot_bgcolor = '#f0f0f0', paper_bgcolor = '#f0f0f0', xaxis_title = 'Fetch Date', yaxis_title = 'Articles Mentioning')
+        st.plotly_chart(fig_entities, use_container_width = True)
+
     ##WORD CLOUD
     st.subheader("☁️ Entity Word Cloud by Topic")
 
     # Dropdown to select a topic from articles
-    unique_topics = sorted(df['topic'].dropna().unique())
+    unique_topics = aggregates['topics']
     selected_topic = st.selectbox("Choose a Topic", unique_topics)
 
-    # Filter to rows that match selected topic
-    filtered_df = df[df['topic'] == selected_topic]
-
-    #Combines the list of entities into a single list
-    all_entities = []
-    for entities in filtered_df['entities']:
-        if isinstance(entities, list):
-            all_entities.extend(entities)
-
-    # Generate the word cloud only if there are entities, using same colors as other plots
-    if all_entities:
-        entity_text = " ".join(all_entities)
-        wordcloud = WordCloud(width=700, height=300, background_color='#f0f0f0', colormap='Set3').generate(entity_text)
-
-        # Display word cloud
-        fig_wc, ax = plt.subplots(figsize=(10, 5))
-        ax.imshow(wordcloud, interpolation='bilinear')
-        ax.axis('off')
-        st.pyplot(fig_wc)
+    # Entity counts for the topic, counted once per loaded file
+    frequencies = aggregates['entity_frequencies'].get(selected_topic, {})
+
+    # Show the word cloud only if there are entities, reusing the image drawn for this topic and data
+    if frequencies:
+        st.image(load_word_cloud(country_code.lower(), selected_topic, mtime, collapse))
     else:
         st.info("No entities available for this topic.")
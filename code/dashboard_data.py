@@ -0,0 +1,186 @@
+'''
+Loading and aggregate helpers for the dashboard. They don't call Streamlit, so the dashboard
+can wrap them in st.cache_data and they can be tested on their own.
+'''
+import glob
+import hashlib
+import io
+import os
+import re
+import pandas as pd
+
+try:
+    from . import schema, storage
+except ImportError:
+    import schema
+    import storage
+
+#Folder holding the rendered word cloud images
+WORD_CLOUD_DIR = 'wordclouds'
+
+#Word cloud size and colors, matching the other charts
+WORD_CLOUD_OPTIONS = {'width': 700, 'height': 300, 'background_color': '#f0f0f0', 'colormap': 'Set3'}
+
+#Authors shown on each page of the author browser, and the orders it can be sorted in
+AUTHORS_PER_PAGE = 20
+AUTHOR_SORT_OPTIONS = ["Most Articles", "Name (A-Z)"]
+
+#"Group Articles By" options with the column they count, whose ordered categorical (see schema) sets the order of the bars
+GROUP_BY_OPTIONS = {
+    "Time of Day": 'time_of_day_published',
+    "Day of Week": 'day_of_week_published',
+    "Month Published": 'month_published'
+}
+
+def cleaned_mtime(country_code):
+    '''
+    Returns the modification time of the cleaned file for a country, or None if there isn't one.
+    Used with the country code as the cache key, so a rewritten file is loaded again
+    '''
+    path = storage.cleaned_file_path(country_code)
+    if path is None:
+        return None
+    return os.path.getmtime(path)
+
+def label_counts(series, label, count_label):
+    '''
+    Counts each value of 'series', most common first, as a two column DF
+    '''
+    counts = series.value_counts().reset_index()
+    counts.columns = [label, count_label]
+    return counts
+
+def publication_counts(df, group_by_option):
+    '''
+    Counts the articles in each time group in chronological order.
+    Months without articles are left out
+    '''
+    group_col = GROUP_BY_OPTIONS[group_by_option]
+
+    #Counting an ordered categorical without sorting gives every group in its order, including empty ones
+    counts = schema.ordered(df[group_col], group_col).value_counts(sort = False)
+    if group_by_option == "Month Published":
+        counts = counts[counts > 0]
+    counts = counts.reset_index()
+    counts.columns = [group_col, 'Article Count']
+    return counts
+
+def author_index(df):
+    '''
+    Returns one row per author with their number of articles and the index labels of those articles
+    (so their titles can be looked up in 'df' only when they are shown), most articles first
+    '''
+    if 'author' not in df.columns:
+        return pd.DataFrame(columns = ['author', 'article_count', 'article_ids'])
+    authors = df['author'].dropna().astype(str).str.strip()
+    authors = authors[authors != '']
+    index = pd.DataFrame({'author': authors.to_numpy(), 'article_id': authors.index})
+    index = index.groupby('author', sort = False).agg(
+        article_count = ('article_id', 'size'),
+        article_ids = ('article_id', list)
+    ).reset_index()
+    return index.sort_values(['article_count', 'author'], ascending = [False, True], ignore_index = True)
+
+def search_authors(index, query = '', sort = AUTHOR_SORT_OPTIONS[0]):
+    '''
+    Returns the authors of an author index whose name contains 'query' (ignoring case),
+    in one of the AUTHOR_SORT_OPTIONS orders
+    '''
+    if query:
+        index = index[index['author'].str.contains(query, case = False, regex = False)]
+    if sort == "Name (A-Z)":
+        index = index.sort_values('author', key = lambda names: names.str.casefold(), kind = 'stable')
+    return index.reset_index(drop = True)
+
+def page_of(rows, page, per_page = AUTHORS_PER_PAGE):
+    '''
+    Returns page 'page' (counting from 1) of 'rows' and the number of pages, at least 1
+    '''
+    pages = max(1, -(-len(rows) // per_page))
+    page = min(max(1, page), pages)
+    return rows.iloc[(page - 1) * per_page:page * per_page], pages
+
+def entity_frequencies(df):
+    '''
+    Counts how many times each entity appears in the articles of each topic.
+    Returns {topic: {entity: count}}, keeping multi-word entities (EX: United States) whole
+    '''
+    exploded = df[['topic', 'entities']].dropna(subset = ['topic']).explode('entities').dropna(subset = ['entities'])
+    counts = exploded.groupby(['topic', 'entities'], observed = True).size()
+    frequencies = {}
+    for (topic, entity), count in counts.items():
+        frequencies.setdefault(topic, {})[entity] = int(count)
+    return frequencies
+
+def dataset_version(mtime):
+    '''
+    Turns the cleaned file's modification time into the version used to name cached images
+    '''
+    return str(int(mtime * 1e6))
+
+def word_cloud_path(country_code, topic, version, variant = None):
+    '''
+    Returns where the word cloud image of a country's topic is cached for a dataset version.
+    A 'variant' (EX: 'collapsed') gets its own image next to the default one
+    '''
+    slug = re.sub(r'[^a-z0-9]+', '-', str(topic).lower()).strip('-')
+    digest = hashlib.md5(str(topic).encode('utf-8')).hexdigest()[:8]
+    suffix = f'-{variant}' if variant else ''
+    return os.path.join(storage.CACHE_DIR, WORD_CLOUD_DIR, f'{country_code.lower()}_{slug}-{digest}{suffix}_{version}.png')
+
+def render_word_cloud(frequencies):
+    '''
+    Draws a word cloud from entity counts and returns it as PNG bytes
+    '''
+    #Imported here so the dashboard only pays for wordcloud when a cloud is drawn
+    from wordcloud import WordCloud
+
+    image = WordCloud(**WORD_CLOUD_OPTIONS).generate_from_frequencies(frequencies).to_image()
+    buffer = io.BytesIO()
+    image.save(buffer, format = 'PNG')
+    return buffer.getvalue()
+
+def word_cloud_png(country_code, topic, version, frequencies, variant = None):
+    '''
+    Returns the word cloud PNG for a country's topic, drawing it only if it isn't cached for
+    this dataset version yet. Images from older versions of the country's data are removed
+    '''
+    path = word_cloud_path(country_code, topic, version, variant)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    png = render_word_cloud(frequencies)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f'{country_code.lower()}_*.png')):
+        if not stale.endswith(f'_{version}.png'):
+            os.remove(stale)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(png)
+    os.replace(path + '.tmp', path)
+    return png
+
+def collapse_duplicates(df):
+    '''
+    Keeps the first article of each near-duplicate cluster (see dedupe), so a story carried by
+    several outlets is counted once. Rows without a cluster id (EX: from before clusters were stored) are all kept
+    '''
+    if 'cluster_id' not in df.columns:
+        return df
+    return df[df['cluster_id'].isna() | ~df['cluster_id'].duplicated()]
+
+def compute_aggregates(df, collapse = False):
+    '''
+    Computes every count the dashboard charts from the cleaned headlines of one country.
+    With 'collapse' set, near-duplicate articles are counted once (see collapse_duplicates)
+    '''
+    if collapse:
+        df = collapse_duplicates(df)
+    return {
+        'topic_counts': label_counts(df['topic'], 'Topic', 'Article Count'),
+        'sentiment_counts': label_counts(df['sentiment'], 'Sentiment', 'Count'),
+        'publication_counts': {option: publication_counts(df, option) for option in GROUP_BY_OPTIONS},
+        'authors': author_index(df),
+        'topics': sorted(df['topic'].dropna().unique()),
+        'entity_frequencies': entity_frequencies(df)
+    }
@@ -0,0 +1,136 @@
+'''
+Finds near-duplicate articles (EX: the same wire story carried by several outlets) so only one
+copy of each story has to be sent to the iSchool APIs.
+
+Every article is turned into a MinHash signature over the word shingles of its title and content.
+Locality sensitive hashing (the signature cut into bands) finds candidate pairs without comparing
+every article with every other one, and a candidate is only joined to a cluster if the estimated
+Jaccard similarity of the two articles is at least the threshold.
+'''
+import numpy as np
+import pandas as pd
+
+#Number of hash functions in a signature, split into BANDS bands of equal size for the candidate search
+NUM_HASHES = 64
+BANDS = 16
+
+#Words per shingle. Articles shorter than this get one shingle of all their words
+SHINGLE_SIZE = 3
+
+#Estimated Jaccard similarity two articles need to count as the same story
+DEFAULT_THRESHOLD = 0.8
+
+#Prime the shingle hashes are permuted modulo, and the seed of the permutations so signatures are the same every run
+_PRIME = (1 << 31) - 1
+_SEED = 356
+
+#Shingle hashes are expanded into signatures this many at a time to keep memory flat
+_SHINGLES_PER_STEP = 20000
+
+def shingle_texts(titles, contents, size = SHINGLE_SIZE):
+    '''
+    Returns the word shingles of every article as two aligned arrays: the article position and the shingle
+    '''
+    texts = (titles.fillna('').astype(str) + ' ' + contents.fillna('').astype(str)).str.casefold()
+    words = texts.str.findall(r'\w+').tolist()
+
+    rows = []
+    shingles = []
+    for position, tokens in enumerate(words):
+        if not tokens:
+            continue
+        count = max(1, len(tokens) - size + 1)
+        rows.extend([position] * count)
+        shingles.extend(' '.join(tokens[i:i + size]) for i in range(count))
+    return np.array(rows, dtype = np.int64), np.array(shingles, dtype = object)
+
+def minhash_signatures(rows, shingles, count, num_hashes = NUM_HASHES):
+    '''
+    Returns a (count, num_hashes) array of MinHash signatures. 'rows' must be sorted.
+    Articles without shingles get a signature of -1s, which never matches another article
+    '''
+    signatures = np.full((count, num_hashes), -1, dtype = np.int64)
+    if not len(rows):
+        return signatures
+
+    rng = np.random.default_rng(_SEED)
+    a = rng.integers(1, _PRIME, num_hashes, dtype = np.int64)
+    b = rng.integers(0, _PRIME, num_hashes, dtype = np.int64)
+    hashes = (pd.util.hash_array(shingles) & 0x7FFFFFFF).astype(np.int64)
+
+    #Steps end on article boundaries so each article's minimum is taken in one step
+    boundaries = np.r_[np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]), len(rows)]
+    i = 0
+    while i < len(boundaries) - 1:
+        j = max(i + 1, np.searchsorted(boundaries, boundaries[i] + _SHINGLES_PER_STEP, side = 'right') - 1)
+        start, end = boundaries[i], boundaries[j]
+        permuted = (hashes[start:end, None] * a[None, :] + b[None, :]) % _PRIME
+        signatures[rows[boundaries[i:j]]] = np.minimum.reduceat(permuted, boundaries[i:j] - start, axis = 0)
+        i = j
+    return signatures
+
+def _find(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+def cluster_signatures(signatures, threshold = DEFAULT_THRESHOLD, bands = BANDS):
+    '''
+    Groups articles whose signatures agree on at least 'threshold' of their hashes.
+    Returns an array with the cluster label (the smallest position in the cluster) of every article
+    '''
+    count = len(signatures)
+    parents = np.arange(count)
+    has_shingles = signatures[:, 0] >= 0 if count else np.zeros(0, dtype = bool)
+
+    #Articles that land in the same bucket of any band are candidates
+    for band in np.array_split(np.arange(signatures.shape[1]), bands):
+        keys = pd.util.hash_pandas_object(pd.DataFrame(signatures[:, band]), index = False).to_numpy()
+        order = np.argsort(keys, kind = 'stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], count]):
+            if end - start < 2:
+                continue
+            members = order[start:end]
+            members = members[has_shingles[members]]
+            if len(members) < 2:
+                continue
+
+            #Each candidate is checked against the first member of the bucket before being joined to it
+            first = members[0]
+            similarity = (signatures[members[1:]] == signatures[first]).mean(axis = 1)
+            for other in members[1:][similarity >= threshold]:
+                root_a, root_b = _find(parents, first), _find(parents, other)
+                if root_a != root_b:
+                    parents[max(root_a, root_b)] = min(root_a, root_b)
+
+    return np.array([_find(parents, i) for i in range(count)], dtype = np.int64)
+
+def find_near_duplicates(df, threshold = DEFAULT_THRESHOLD):
+    '''
+    Clusters the near-duplicate articles of a cleaned DF by their title and content.
+    Returns (cluster label of every row, positions of the representative of each cluster).
+    The representative is the member with the longest content, since it gives the APIs the most to go on
+    '''
+    rows, shingles = shingle_texts(df['title'], df['content'])
+    labels = cluster_signatures(minhash_signatures(rows, shingles, len(df)), threshold)
+
+    lengths = df['content'].fillna('').astype(str).str.len().to_numpy()
+    order = np.lexsort((np.arange(len(df)), -lengths, labels))
+    representatives = order[np.r_[True, labels[order][1:] != labels[order][:-1]]] if len(df) else order
+    return labels, np.sort(representatives)
+
+def cluster_ids(df, labels):
+    '''
+    Turns cluster labels into ids stored with the articles: a hash of the smallest url in the cluster,
+    so the id doesn't depend on where the rows sit in the DF or which of them comes first
+    '''
+    urls = df['url'].fillna('').astype(str).replace('', np.nan)
+    smallest = urls.groupby(np.asarray(labels)).transform('min').to_numpy()
+
+    #Clusters without any url fall back to their cluster label so they don't all share one id
+    keys = np.array([url if isinstance(url, str) else f'#{label}' for url, label in zip(smallest, labels)], dtype = object)
+    hashes = pd.util.hash_array(keys)
+    return pd.Series([f'{h:016x}' for h in hashes], index = df.index)
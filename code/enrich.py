@@ -0,0 +1,195 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+#Default number of API calls allowed in flight at once
+DEFAULT_MAX_WORKERS = 8
+
+#Default number of API calls allowed to start each second (None means no limit)
+DEFAULT_REQUESTS_PER_SECOND = 5
+
+#Default number of articles sent to the sentiment and entity endpoints in one request
+DEFAULT_BATCH_SIZE = 10
+
+#Default limit on the size of the text sent in one request, in bytes
+DEFAULT_MAX_BATCH_BYTES = 100000
+
+class RateLimiter:
+    '''
+    Spaces out calls so no more than 'requests_per_second' start in any one second.
+    Safe to share between threads. A value of None or 0 turns the limit off
+    '''
+
+    def __init__(self, requests_per_second = None):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self):
+        '''
+        Blocks until the caller is allowed to make its next call
+        '''
+
+        #No limit set, nothing to wait for
+        if not self.interval:
+            return
+
+        #Reserves the next open time slot while holding the lock, then sleeps outside of it
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+def make_batches(texts, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES):
+    '''
+    Splits texts into batches of positions with at most 'batch_size' texts and 'max_batch_bytes'
+    bytes of text in each. A single text larger than the byte limit gets a batch of its own
+    '''
+    batches = []
+    batch = []
+    batch_bytes = 0
+
+    for i, text in enumerate(texts):
+        text_bytes = len(text.encode('utf-8')) if isinstance(text, str) else 0
+
+        #Starts a new batch when adding this text would go over either limit
+        if batch and (len(batch) >= batch_size or batch_bytes + text_bytes > max_batch_bytes):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+
+        batch.append(i)
+        batch_bytes += text_bytes
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+def enrich_articles(texts, sentiment_fn, entity_fn, topic_fn, entity_filter = None, topic_key = None,
+                    batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES,
+                    max_workers = DEFAULT_MAX_WORKERS, requests_per_second = DEFAULT_REQUESTS_PER_SECOND, limiter = None,
+                    progress = None):
+    '''
+    Runs the sentiment, entity and topic calls for every text concurrently on a bounded thread pool.
+        -'sentiment_fn' and 'entity_fn' take a list of texts and return a list of results in the same order
+        -Texts are sent to them in batches (see make_batches), and the two calls for a batch run side by side
+        -Each topic call is started as soon as that article's entities come back
+        -'entity_filter' (optional) takes the entity lists of one batch and returns them cleaned,
+         before they are stored and sent for a topic
+        -'topic_key' (optional) maps an entity list to a grouping key. Rows with the same key share
+         one topic call, and rows whose key is already in flight wait for that call instead
+        -'limiter' (optional) is a RateLimiter shared with other runs, used instead of 'requests_per_second'
+        -'progress' (optional) is called with (rows finished, total rows) whenever more rows are finished.
+         A row is finished once its sentiment, entities and topic are all known
+    Returns three lists (sentiments, entities, topics) in the same order as 'texts', plus a dict
+    with the number of topic calls made and saved by grouping
+    '''
+
+    texts = list(texts)
+    count = len(texts)
+
+    sentiments = [None] * count
+    entities = [[] for _ in range(count)]
+    topics = ['Unknown'] * count
+
+    #Rows waiting on each topic key, and the topic for every key that has come back
+    topic_rows = {}
+    topic_results = {}
+    stats = {'topic_calls': 0, 'topic_calls_saved': 0}
+
+    #Each row waits on two parts: its sentiment, and its entities together with the topic for them
+    parts_left = [2] * count
+    finished = 0
+
+    def part_done(i):
+        nonlocal finished
+        parts_left[i] -= 1
+        if not parts_left[i]:
+            finished += 1
+
+    if progress is not None:
+        progress(0, count)
+
+    if limiter is None:
+        limiter = RateLimiter(requests_per_second)
+
+    #Wraps every API function so each call waits for its turn under the rate limit
+    def limited(fn, arg):
+        limiter.wait()
+        return fn(arg)
+
+    #Each call runs in a copy of the caller's context, so the calls are recorded on the caller's run (see metrics)
+    def submit(fn, arg):
+        return pool.submit(contextvars.copy_context().run, limited, fn, arg)
+
+    with ThreadPoolExecutor(max_workers = max_workers) as pool:
+
+        #Maps each running future to the kind of call it is and the rows it belongs to
+        pending = {}
+        for batch in make_batches(texts, batch_size, max_batch_bytes):
+            batch_texts = [texts[i] for i in batch]
+            pending[submit(sentiment_fn, batch_texts)] = ('sentiment', batch)
+            pending[submit(entity_fn, batch_texts)] = ('entities', batch)
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when = FIRST_COMPLETED)
+                finished_before = finished
+                for future in done:
+                    kind, rows = pending.pop(future)
+                    result = future.result()
+
+                    if kind == 'sentiment':
+                        for i, sentiment in zip(rows, result):
+                            sentiments[i] = sentiment
+                            part_done(i)
+
+                    elif kind == 'entities':
+                        entity_lists = [entity_list or [] for entity_list in result]
+                        if entity_filter is not None:
+                            entity_lists = entity_filter(entity_lists)
+
+                        for i, entity_list in zip(rows, entity_lists):
+                            entities[i] = entity_list
+
+                            #Rows without entities keep the 'Unknown' topic
+                            if not entity_list:
+                                part_done(i)
+                                continue
+
+                            #Reuses the topic for this key if it was already asked for
+                            key = topic_key(entity_list) if topic_key is not None else i
+                            if key in topic_results:
+                                topics[i] = topic_results[key]
+                                stats['topic_calls_saved'] += 1
+                                part_done(i)
+                            elif key in topic_rows:
+                                topic_rows[key].append(i)
+                                stats['topic_calls_saved'] += 1
+                            else:
+                                #Entities are ready so the topic call for this row can start right away
+                                topic_rows[key] = [i]
+                                pending[submit(topic_fn, entity_list)] = ('topic', key)
+                                stats['topic_calls'] += 1
+
+                    else:
+                        #Fans the topic out to every row that shares this key
+                        topic_results[rows] = result
+                        for i in topic_rows.pop(rows):
+                            topics[i] = result
+                            part_done(i)
+
+                if progress is not None and finished != finished_before:
+                    progress(finished, count)
+        except BaseException:
+            #Stops queued calls from running if one of the calls raised
+            for future in pending:
+                future.cancel()
+            raise
+
+    return sentiments, entities, topics, stats
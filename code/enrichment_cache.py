@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+#SQLite file that holds the sentiment, entity and topic results between runs
+CACHE_PATH = os.path.join('cache', 'enrichment_cache.db')
+
+#Results older than this are treated as missing and fetched again
+DEFAULT_MAX_AGE_DAYS = 30
+
+#Once the store holds more results than this, the least recently used ones are removed
+DEFAULT_MAX_ENTRIES = 50000
+
+#A trim removes this share of max_entries on top of the overflow, so the store isn't trimmed again on every insert
+TRIM_FRACTION = 0.1
+
+#Hits are written to last_used this many at a time instead of one commit per lookup
+TOUCH_BATCH_SIZE = 500
+
+def make_key(endpoint, text):
+    '''
+    Returns the content hash used to store a result: sha256 of the endpoint name and the cleaned text
+    '''
+    return hashlib.sha256(f'{endpoint}\n{text}'.encode('utf-8')).hexdigest()
+
+class EnrichmentCache:
+    '''
+    Persistent, content-addressed store for the iSchool API results.
+    Every result is keyed by a hash of the endpoint name and the text that was sent,
+    so the same article text is only ever enriched once until its result expires.
+    '''
+
+    def __init__(self, path = CACHE_PATH, max_age_days = DEFAULT_MAX_AGE_DAYS, max_entries = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_age_seconds = max_age_days * 24 * 60 * 60 if max_age_days else None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        #Keys read since the last flush with the time they were read, written to last_used in one go
+        self._touched = {}
+
+        #One connection is shared by the enrichment worker threads, guarded by a lock
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        self._conn = sqlite3.connect(path, check_same_thread = False)
+        with self._conn:
+            self._conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                '''
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_last_used ON results (last_used)')
+
+        #Counted once here and kept up to date by set, so inserts only trim when the store is actually over its limit
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def get(self, endpoint, text):
+        '''
+        Returns the stored result for this endpoint and text, or None if it is missing or expired
+        '''
+        key = make_key(endpoint, text)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, created_at FROM results WHERE key = ?', (key,)).fetchone()
+
+            #Expired results are deleted and counted as a miss
+            if row is not None and self.max_age_seconds and now - row[1] > self.max_age_seconds:
+                with self._conn:
+                    self._conn.execute('DELETE FROM results WHERE key = ?', (key,))
+                self._touched.pop(key, None)
+                self._entries -= 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH_SIZE:
+                self._flush_touched()
+        return json.loads(row[0])
+
+    def _flush_touched(self):
+        #Called with the lock held
+        if not self._touched:
+            return
+        with self._conn:
+            self._conn.executemany('UPDATE results SET last_used = ? WHERE key = ?', [(t, k) for k, t in self._touched.items()])
+        self._touched = {}
+
+    def flush(self):
+        '''
+        Writes the last used times of the results read since the last flush
+        '''
+        with self._lock:
+            self._flush_touched()
+
+    def contains(self, endpoint, texts):
+        '''
+        Returns a list of whether each text has an unexpired stored result for this endpoint.
+        Unlike get, it doesn't count hits and misses or mark the results as used
+        '''
+        keys = [make_key(endpoint, text) for text in texts]
+        oldest = time.time() - self.max_age_seconds if self.max_age_seconds else 0
+        stored = set()
+        with self._lock:
+            #SQLite limits the number of parameters in one query, so the keys are looked up in slices
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key FROM results WHERE created_at >= ? AND key IN ({', '.join('?' * len(batch))})",
+                    [oldest] + batch
+                ).fetchall()
+                stored.update(row[0] for row in rows)
+        return [key in stored for key in keys]
+
+    def set(self, endpoint, text, value):
+        '''
+        Stores a result for this endpoint and text. Once the store is over its size limit, the least
+        recently used results are removed down to TRIM_FRACTION below the limit
+        '''
+        key = make_key(endpoint, text)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    '''
+                    INSERT INTO results (key, endpoint, value, created_at, last_used) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO NOTHING
+                    ''',
+                    (key, endpoint, json.dumps(value), now, now)
+                )
+                if cursor.rowcount:
+                    self._entries += 1
+                else:
+                    self._conn.execute(
+                        'UPDATE results SET value = ?, created_at = ?, last_used = ? WHERE key = ?',
+                        (json.dumps(value), now, now, key)
+                    )
+            self._touched.pop(key, None)
+            if self.max_entries and self._entries > self.max_entries:
+                self._trim()
+
+    def _trim(self):
+        #Called with the lock held. Last used times are written first so recently read results are kept
+        self._flush_touched()
+        keep = self.max_entries - int(self.max_entries * TRIM_FRACTION)
+        with self._conn:
+            self._conn.execute(
+                '''
+                DELETE FROM results WHERE key IN (
+                    SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                ''',
+                (keep,)
+            )
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def prune(self):
+        '''
+        Deletes every expired result and returns how many were removed
+        '''
+        if not self.max_age_seconds:
+            return 0
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute('DELETE FROM results WHERE created_at < ?', (time.time() - self.max_age_seconds,))
+            self._entries -= cursor.rowcount
+        return cursor.rowcount
+
+    def clear(self):
+        '''
+        Deletes every stored result
+        '''
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM results')
+            self._touched = {}
+            self._entries = 0
+
+    def stats(self):
+        '''
+        Returns the hit and miss counters along with how many results are stored
+        '''
+        with self._lock:
+            self._flush_touched()
+            entries = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def reset_stats(self):
+        '''
+        Sets the hit and miss counters back to zero
+        '''
+        self.hits = 0
+        self.misses = 0
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_default_cache():
+    '''
+    Returns the shared cache stored at CACHE_PATH, opening it the first time it is needed
+    '''
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = EnrichmentCache()
+    return _default_cache
@@ -1,73 +1,174 @@
-import requests
 import pandas as pd
 import os
 
+try:
+    from . import http_client, metrics
+    from .api_budget import DEFAULT_MAX_ARTICLES
+except ImportError:
+    import http_client
+    import metrics
+    from api_budget import DEFAULT_MAX_ARTICLES
+
 NEWSAPI_KEY = 'SEE EMAIL FOR API KEY'
+NEWSAPI_URL = 'https://newsapi.org/v2/top-headlines'
+
+#Most articles the News API returns per page
+MAX_PAGE_SIZE = 100
 
-def fetch_top_headlines(country_code, page_size = 100, language = 'en'):
+#Columns of the raw article cache, in the order they are written
+ARTICLE_COLUMNS = ['author', 'title', 'description', 'url', 'urlToImage', 'publishedAt', 'content', 'source_id', 'source_name']
+
+def iter_top_headlines(country_code, page_size = MAX_PAGE_SIZE, language = 'en', max_articles = None):
+    '''
+    Generator version of fetch_top_headlines. Follows the 'page' parameter and yields
+    articles one at a time as each page arrives, stopping after 'max_articles' articles
+    (None means no cap), when the API runs out of results, or when a page request fails
+    '''
+    url = NEWSAPI_URL
+    headers = {'X-API-Key': NEWSAPI_KEY}
+
+    #No point asking for a bigger page than the number of articles wanted
+    if max_articles is not None:
+        if max_articles <= 0:
+            return
+        page_size = min(page_size, max_articles)
+
+    yielded = 0
+    page = 1
+    while True:
+        params = {
+            'country': country_code.lower(), #Converts country code to lower for API requirement
+            'pageSize': page_size, #Restrictred to 100 due to API limits
+            'page': page,
+            'language': language #Specifies to pull files only in English
+        }
+
+        #Makes request to API based on parameters, retrying temporary failures
+        #Raises QuotaExceededError if the daily request limit is used up
+        #Only the page requests are timed, not the time the caller spends on the articles in between
+        with metrics.stage('fetch'):
+            response = http_client.get(url, headers = headers, params = params)
+
+            #If the status code wasn't 200 display the status code and the reason for error
+            if response.status_code != 200:
+                print(f"Error fetching data: {response.status_code} - {response.text}")
+                return
+
+            data = response.json()
+        articles = data.get('articles', [])
+        metrics.count('articles_fetched', len(articles))
+        for article in articles:
+            yield article
+            yielded += 1
+            if max_articles is not None and yielded >= max_articles:
+                return
+
+        #Stops once the last page has been read
+        total_results = data.get('totalResults', 0)
+        if len(articles) < page_size or page * page_size >= total_results:
+            return
+        page += 1
+
+def fetch_top_headlines(country_code, page_size = MAX_PAGE_SIZE, language = 'en', max_articles = DEFAULT_MAX_ARTICLES):
     '''
     Retrieves the top headline articles for inputed country. 
     Enter the country code for desired country. EX: us
     Page_size restricted to 100 because the free API access only allows pulling 100 articles at a time.
+    Pages are followed until 'max_articles' articles are fetched (None fetches every page).
     Specifies to pull articles only in eEglish
     '''
-    url = "https://newsapi.org/v2/top-headlines"
-    headers = {'X-API-Key': NEWSAPI_KEY}
-    params = {
-        'country': country_code.lower(), #Converts country code to lower for API requirement
-        'pageSize': page_size, #Restrictred to 100 due to API limits
-        'language': language #Specifies to pull files only in English
-    }
-
-    #Makes request to API based on parameters
-    response = requests.get(url, headers = headers, params = params)
-
-    #If the status code was 200 return the json, if not display the status code and the reason for error
-    if response.status_code == 200:
-        data = response.json()
-        articles = data.get('articles', [])
-        return articles
-    else:
-        print(f"Error fetching data: {response.status_code} - {response.text}")
-        return []
+    return list(iter_top_headlines(country_code, page_size, language, max_articles))
     
-def save_articles_to_csv(articles, country_code):
+def merge_articles(existing, new):
     '''
-    Saves 10 articles from API request to cache, avoiding unnecesary API requests
+    Merges newly fetched articles into the cached ones using url as the key.
+    New versions of a known url replace the cached row.
+    Returns the merged DF and a count of added, updated and unchanged articles
     '''
-    #Runs code if articles exist
-    if articles:
+    compare_cols = [c for c in new.columns if c in existing.columns and c != 'url']
+    known = existing.drop_duplicates(subset = ['url'], keep = 'last').set_index('url')
 
-        limited_articles = articles[:15]
+    #Lines up the cached version of every known url with its new version and compares them as text
+    is_known = new['url'].isin(known.index)
+    old_values = known.reindex(new.loc[is_known, 'url'])[compare_cols].fillna('').astype(str).values
+    new_values = new.loc[is_known, compare_cols].fillna('').astype(str).values
+    changed = int((old_values != new_values).any(axis = 1).sum())
 
-        #Converts articles to DF
-        df = pd.json_normalize(
-            limited_articles,
-            record_path= None,
-            meta = ['source.id', 'source.name', 'author', 'title', 'description', 'url', 'urlToImage',
-                    'publishedAt', 'content'],
-            sep = '_'
-        )
+    merged = pd.concat([existing[~existing['url'].isin(new['url'])], new], ignore_index = True)
+    counts = {'added': int((~is_known).sum()), 'updated': changed, 'unchanged': int(is_known.sum()) - changed}
+    return merged, counts
 
-        #Specifies the filename for creating CSV
-        filename = f'top_headlines_{country_code.lower()}.csv'
+def articles_to_frame(articles):
+    '''
+    Flattens a list of article dicts into a DF with the raw cache columns
+    '''
+    df = pd.json_normalize(articles, sep = '_')
+    return df.reindex(columns = ARTICLE_COLUMNS)
 
-        #Joining the cache directory with the filename
-        cache_path = os.path.join('cache', filename)
+def save_articles_to_csv(articles, country_code, merge = False, batch_size = 100):
+    '''
+    Saves articles from API request to cache, avoiding unnecesary API requests.
+    'articles' can be a list or a generator (EX: iter_top_headlines), and is written
+    'batch_size' articles at a time so the whole feed never has to be held in memory.
+    With 'merge' set, the articles are merged into the existing cache file by url instead of replacing it.
+    Returns the number of articles saved from 'articles'
+    '''
 
-        #Exporting df to CSV and ignoring the index's
-        df.to_csv(cache_path, index = False)
+    #Specifies the filename for creating CSV
+    filename = f'top_headlines_{country_code.lower()}.csv'
 
-        #Print how many articles where succesfully saved
-        print(f'Saved {len(df)} articles to {cache_path}')
-    else:
+    #Joining the cache directory with the filename
+    cache_path = os.path.join('cache', filename)
 
-        #If no articles exist to be saved, state it
+    #A fresh checkout has no cache folder yet
+    os.makedirs(os.path.dirname(cache_path), exist_ok = True)
+
+    #Streams the articles into a temporary file so a failed fetch never leaves a half written cache
+    temp_path = cache_path + '.tmp'
+    saved = 0
+    batch = []
+
+    def write_batch(batch):
+        with metrics.stage('save'):
+            articles_to_frame(batch).to_csv(temp_path, mode = 'a' if saved else 'w', header = not saved, index = False)
+
+    try:
+        for article in articles:
+            batch.append(article)
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                saved += len(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+            saved += len(batch)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    #If no articles exist to be saved, state it
+    if not saved:
         print('No articles to save.')
+        return 0
+
+    #Merges with the articles already in the cache so earlier headlines are kept
+    if merge and os.path.exists(cache_path):
+        with metrics.stage('save'):
+            df, counts = merge_articles(pd.read_csv(cache_path), pd.read_csv(temp_path))
+            df.to_csv(cache_path, index = False)
+            os.remove(temp_path)
+        print(f"Merged articles: {counts['added']} added, {counts['updated']} updated, {counts['unchanged']} unchanged")
+    else:
+        os.replace(temp_path, cache_path)
+
+    #Print how many articles where succesfully saved
+    print(f'Saved {saved} articles to {cache_path}')
+    return saved
 
 
 if __name__ == "__main__":
     
     country_code = 'us'
-    articles = fetch_top_headlines(country_code)
-    save_articles_to_csv(articles, country_code)
+    articles = iter_top_headlines(country_code, max_articles = DEFAULT_MAX_ARTICLES)
+    save_articles_to_csv(articles, country_code, merge = True)
@@ -0,0 +1,167 @@
+'''
+Keeps every cleaned run instead of only the latest one, so topic, sentiment and entity trends
+can be followed over time. Snapshots are stored as one file per partition:
+    cache/history/country=us/fetch_date=2025-04-28/cleaned.parquet
+Each partition holds every article of that day's run, so an article still in the headlines the
+next day is stored again under that day and each day's trends reflect that day's headline mix.
+Saving only reads the partition of its own day. Queries for a date range only list the partition
+folders and read the files inside the range, and only the columns they need, so they don't slow
+down as the history grows. read_history can keep only each article's first fetch instead.
+'''
+import os
+from datetime import datetime, timezone
+import pandas as pd
+
+try:
+    from . import storage
+except ImportError:
+    import storage
+
+#Folder inside the cache holding the snapshots
+HISTORY_DIR = 'history'
+
+def history_dir(country_code):
+    '''
+    Returns the folder holding every snapshot of a country
+    '''
+    return os.path.join(storage.CACHE_DIR, HISTORY_DIR, f'country={country_code.lower()}')
+
+def _partition_paths(country_code, fetch_date):
+    '''
+    Returns the (Parquet, CSV) paths of a country's snapshot for a fetch date
+    '''
+    name = os.path.join(history_dir(country_code), f'fetch_date={fetch_date}', 'cleaned')
+    return name + '.parquet', name + '.csv'
+
+def snapshot_dates(country_code):
+    '''
+    Returns the fetch dates (YYYY-MM-DD) a country has snapshots for, oldest first
+    '''
+    directory = history_dir(country_code)
+    if not os.path.exists(directory):
+        return []
+    dates = []
+    for name in os.listdir(directory):
+        if name.startswith('fetch_date=') and _partition_file(country_code, name[len('fetch_date='):]) is not None:
+            dates.append(name[len('fetch_date='):])
+    return sorted(dates)
+
+def _partition_file(country_code, fetch_date):
+    '''
+    Returns the snapshot file of a fetch date, or None if there isn't one
+    '''
+    for path in _partition_paths(country_code, fetch_date):
+        if os.path.exists(path) and (path.endswith('.csv') or storage.pq is not None):
+            return path
+    return None
+
+def _read_partition(path, columns = None):
+    '''
+    Reads a snapshot file, only the 'columns' asked for (all of them by default)
+    '''
+    if path.endswith('.csv'):
+        df = pd.read_csv(path, usecols = lambda c: columns is None or c in columns)
+        if 'entities' in df.columns:
+            df['entities'] = df['entities'].apply(storage.safe_parse_entities)
+        return storage.apply_cleaned_dtypes(df)
+
+    if columns is not None:
+        schema = storage.pq.read_schema(path)
+        columns = [c for c in columns if c in schema.names]
+    return storage.cleaned_frame(storage.pq.read_table(path, columns = columns))
+
+def save_snapshot(country_code, fetch_date = None, df = None):
+    '''
+    Stores the articles of the country's cleaned data (or 'df') as the snapshot of 'fetch_date' (today in UTC by default).
+    Articles stored under earlier dates are stored again, since they were part of this day's headlines too.
+    Rows of an earlier run on the same day are replaced by the new version of the same url and kept otherwise.
+    Returns the path written, or None if there was nothing to store
+    '''
+    fetch_date = fetch_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    if df is None:
+        df = storage.load_cleaned(country_code)
+    if df is None or df.empty or 'url' not in df.columns:
+        return None
+
+    current = _partition_file(country_code, fetch_date)
+    if current is not None:
+        earlier = _read_partition(current)
+        df = pd.concat([earlier[~earlier['url'].isin(df['url'])], df], ignore_index = True)
+
+    parquet_path, csv_path = _partition_paths(country_code, fetch_date)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok = True)
+    return storage._write_frame(df, parquet_path, csv_path)
+
+def read_history(country_code, start = None, end = None, columns = None, first_fetch_only = False):
+    '''
+    Reads the snapshots with a fetch date from 'start' to 'end' (inclusive, YYYY-MM-DD, open ended if None).
+    Only the partitions in the range and the 'columns' asked for are read.
+    With 'first_fetch_only' set, an article fetched on several days in the range is only kept on the first.
+    Returns one DF with a 'fetch_date' column added
+    '''
+    read_columns = columns
+    if first_fetch_only and columns is not None and 'url' not in columns:
+        read_columns = list(columns) + ['url']
+
+    frames = []
+    for date in snapshot_dates(country_code):
+        if (start is not None and date < start) or (end is not None and date > end):
+            continue
+        df = _read_partition(_partition_file(country_code, date), read_columns)
+        df['fetch_date'] = pd.Timestamp(date)
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns = (list(columns) if columns else []) + ['fetch_date'])
+    df = pd.concat(frames, ignore_index = True)
+
+    #Partitions are read oldest first, so the first row of each url is its first fetch
+    if first_fetch_only:
+        df = df[~df['url'].duplicated()].reset_index(drop = True)
+        if read_columns is not columns:
+            df = df.drop(columns = 'url')
+    return df
+
+def _label_trends(country_code, column, start, end):
+    '''
+    Counts each value of a label column per fetch date, with its share of that day's articles
+    (every article of that day's run, including ones also fetched on earlier days)
+    '''
+    df = read_history(country_code, start, end, [column])
+    if df.empty:
+        return pd.DataFrame(columns = ['fetch_date', column, 'count', 'share'])
+    counts = df.groupby(['fetch_date', column], observed = True).size().rename('count').reset_index()
+    counts['share'] = counts['count'] / counts.groupby('fetch_date')['count'].transform('sum')
+    return counts.sort_values(['fetch_date', 'count'], ascending = [True, False], ignore_index = True)
+
+def topic_trends(country_code, start = None, end = None, top = 10):
+    '''
+    Returns the article count and share of the 'top' most common topics on each fetch date
+    '''
+    counts = _label_trends(country_code, 'topic', start, end)
+    top_topics = counts.groupby('topic', observed = True)['count'].sum().nlargest(top).index
+    return counts[counts['topic'].isin(top_topics)].reset_index(drop = True)
+
+def sentiment_trends(country_code, start = None, end = None):
+    '''
+    Returns the article count and share of each sentiment on each fetch date
+    '''
+    return _label_trends(country_code, 'sentiment', start, end)
+
+def entity_trends(country_code, entities = None, start = None, end = None, top = 10):
+    '''
+    Returns how many articles mention each entity on each fetch date, for the given 'entities'
+    or the 'top' most mentioned ones in the range
+    '''
+    df = read_history(country_code, start, end, ['entities'])
+    exploded = df.explode('entities').dropna(subset = ['entities'])
+    if exploded.empty:
+        return pd.DataFrame(columns = ['fetch_date', 'entity', 'count'])
+
+    #An article that names an entity twice still counts once
+    exploded = exploded.reset_index().drop_duplicates(['index', 'entities'])
+    if entities is None:
+        entities = exploded['entities'].value_counts().head(top).index
+    counts = exploded[exploded['entities'].isin(entities)].groupby(['fetch_date', 'entities']).size()
+    counts = counts.rename('count').reset_index().rename(columns = {'entities': 'entity'})
+    return counts.sort_values(['fetch_date', 'count'], ascending = [True, False], ignore_index = True)
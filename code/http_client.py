@@ -0,0 +1,219 @@
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+#Seconds to wait for a response before giving up on a request
+DEFAULT_TIMEOUT = 120
+
+#How many times a failed request is retried before the failure is returned or raised
+DEFAULT_RETRIES = 3
+
+#Base and cap (in seconds) for the exponential backoff between retries
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+#A Retry-After longer than this means the API won't serve us again any time soon
+MAX_RETRY_AFTER = 120
+
+#Number of keep-alive connections kept open per host
+POOL_SIZE = 16
+
+#How many requests may be in flight to one host at the same time
+DEFAULT_HOST_LIMIT = 4
+HOST_LIMITS = {
+    'cent.ischool-iot.net': 8,
+    'newsapi.org': 2
+}
+
+#Status codes worth retrying: rate limits and temporary server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+#Text the APIs put in a response when the usage quota for the day is used up
+QUOTA_MESSAGES = ('daily api usage', 'ratelimited', 'quota')
+
+class QuotaExceededError(Exception):
+    '''
+    Raised when an API reports that its usage quota is used up.
+    Retrying won't help until the quota resets, so callers should stop making calls.
+    'used_up' is True when the API said its quota is gone, rather than it only rate limiting us
+    '''
+
+    def __init__(self, message, host = None, retry_after = None, used_up = False):
+        super().__init__(message)
+        self.host = host
+        self.retry_after = retry_after
+        self.used_up = used_up
+
+_session = None
+_session_lock = threading.Lock()
+_host_semaphores = {}
+
+#Functions called with the host name before every request attempt. A hook can raise to stop the request
+_before_request_hooks = []
+
+def add_before_request_hook(hook):
+    '''
+    Registers a function that is called with the host name before every request attempt (retries included).
+    Raising from the hook (EX: QuotaExceededError when a budget is used up) stops the request
+    '''
+    with _session_lock:
+        _before_request_hooks.append(hook)
+
+def remove_before_request_hook(hook):
+    '''
+    Unregisters a hook added with add_before_request_hook
+    '''
+    with _session_lock:
+        if hook in _before_request_hooks:
+            _before_request_hooks.remove(hook)
+
+def get_session():
+    '''
+    Returns the shared requests session, which keeps connections alive between calls
+    '''
+    #requests is imported on first use, so modules that only need QuotaExceededError (EX: the dashboard) don't load it
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections = POOL_SIZE, pool_maxsize = POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+def set_host_limit(host, limit):
+    '''
+    Sets how many requests may be in flight to 'host' at the same time, or back to the default if 'limit' is None.
+    Requests already holding the old semaphore finish under the old limit, so callers should only change it
+    while nothing is being sent to 'host' (EX: before and after a run). Returns the limit it replaced, or None
+    '''
+    with _session_lock:
+        previous = HOST_LIMITS.get(host)
+        if limit == previous:
+            return previous
+        if limit is None:
+            del HOST_LIMITS[host]
+        else:
+            HOST_LIMITS[host] = limit
+        _host_semaphores[host] = threading.BoundedSemaphore(HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT))
+        return previous
+
+def _host_semaphore(host):
+    '''
+    Returns the semaphore that limits concurrent requests to 'host'
+    '''
+    with _session_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT))
+        return _host_semaphores[host]
+
+def backoff_delay(attempt, backoff = DEFAULT_BACKOFF, cap = MAX_BACKOFF):
+    '''
+    Returns how long to sleep before retry number 'attempt' (starting at 0).
+    Uses exponential backoff with full jitter so parallel callers don't retry in lockstep
+    '''
+    return random.uniform(0, min(cap, backoff * (2 ** attempt)))
+
+def retry_after_seconds(response):
+    '''
+    Reads the Retry-After header as a number of seconds. The header can be a number of seconds
+    or an HTTP date. Returns None if the header is missing or can't be read
+    '''
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_quota_exhausted(response):
+    '''
+    Returns True if the response says the API's usage quota is used up
+    '''
+    if response.status_code not in (403, 429):
+        return False
+    text = response.text.lower()
+    return any(message in text for message in QUOTA_MESSAGES)
+
+def request(method, url, retries = DEFAULT_RETRIES, backoff = DEFAULT_BACKOFF, timeout = DEFAULT_TIMEOUT, **kwargs):
+    '''
+    Makes an HTTP request through the shared session.
+        -Connection errors, timeouts and 429/5xx responses are retried with exponential backoff and jitter
+        -429 and 503 responses wait for the Retry-After header when the API sends one
+        -Raises QuotaExceededError when the API says the quota is used up or keeps rate limiting us
+    Any other response is returned as is, so callers still check the status code
+    '''
+    import requests
+
+    parsed = urlparse(url)
+    host = parsed.hostname
+    endpoint = f'{host}{parsed.path}'
+
+    for attempt in range(retries + 1):
+        last_attempt = attempt == retries
+
+        for hook in list(_before_request_hooks):
+            hook(host)
+
+        #Every attempt is recorded on the current run, if there is one (see metrics.recording).
+        #The latency is timed once the host has a free slot, so waiting for one doesn't count
+        try:
+            with _host_semaphore(host):
+                start = time.perf_counter()
+                response = get_session().request(method, url, timeout = timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.record_call(endpoint, time.perf_counter() - start, retry = attempt > 0, error = type(e).__name__)
+            if last_attempt:
+                raise
+            time.sleep(backoff_delay(attempt, backoff))
+            continue
+
+        metrics.record_call(endpoint, time.perf_counter() - start, response.status_code, retry = attempt > 0)
+
+        if is_quota_exhausted(response):
+            raise QuotaExceededError(f'API usage quota exceeded for {host}: {response.text}', host = host, used_up = True)
+
+        if response.status_code not in RETRY_STATUSES:
+            return response
+
+        retry_after = retry_after_seconds(response) if response.status_code in (429, 503) else None
+
+        if last_attempt:
+            if response.status_code == 429:
+                raise QuotaExceededError(f'{host} is still rate limiting after {retries} retries', host = host, retry_after = retry_after)
+            return response
+
+        #Waiting this long would stall the whole run, so treat it as the quota being used up
+        if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+            raise QuotaExceededError(f'{host} asked us to wait {retry_after:.0f} seconds', host = host, retry_after = retry_after)
+
+        time.sleep(retry_after if retry_after is not None else backoff_delay(attempt, backoff))
+
+def get(url, **kwargs):
+    '''
+    Makes a GET request through request()
+    '''
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    '''
+    Makes a POST request through request()
+    '''
+    return request('POST', url, **kwargs)
@@ -0,0 +1,186 @@
+'''
+Runs the extract and transform steps for a country as a background job, so the dashboard
+can keep responding while the articles are enriched and show how far along the job is.
+
+Jobs live in this module rather than in a Streamlit session, so a page rerun (or another
+browser tab) finds the job that is already running for a country instead of starting a new one.
+'''
+import threading
+import time
+
+try:
+    from . import api_budget, http_client, metrics
+    from .extract import iter_top_headlines, save_articles_to_csv, DEFAULT_MAX_ARTICLES
+    from .http_client import QuotaExceededError
+    from .transform import has_unfinished_chunks, transform_articles
+except ImportError:
+    import api_budget
+    import http_client
+    import metrics
+    from extract import iter_top_headlines, save_articles_to_csv, DEFAULT_MAX_ARTICLES
+    from http_client import QuotaExceededError
+    from transform import has_unfinished_chunks, transform_articles
+
+#Statuses of a job that has stopped
+FINISHED_STATUSES = ('done', 'no_articles', 'quota_exceeded', 'failed')
+
+class PipelineJob:
+    '''
+    Fetches, saves and transforms the top headlines for one country on a worker thread.
+    Call start() to run it and progress() to read how far along it is
+    '''
+
+    def __init__(self, country_code, max_articles = DEFAULT_MAX_ARTICLES, **transform_options):
+        self.country_code = country_code.lower()
+        self.max_articles = max_articles
+        self.transform_options = transform_options
+        self.status = 'queued'
+        self.articles_fetched = 0
+        self.rows_done = 0
+        self.rows_total = None
+        self.api_calls = 0
+        self.summary = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._enrich_started_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        '''
+        True until the job has stopped, whether it succeeded or not
+        '''
+        return self.status not in FINISHED_STATUSES
+
+    def start(self):
+        '''
+        Starts the job on a daemon thread and returns the job
+        '''
+        self.started_at = time.time()
+        self._thread = threading.Thread(target = self._run, name = f'pipeline-{self.country_code}', daemon = True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout = None):
+        '''
+        Waits for the job to finish
+        '''
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _count_request(self, host):
+        #Called by http_client before every request attempt, retries included
+        with self._lock:
+            self.api_calls += 1
+
+    def _on_progress(self, done, total):
+        with self._lock:
+            if self._enrich_started_at is None:
+                self._enrich_started_at = time.time()
+            self.rows_done = done
+            self.rows_total = total
+
+    def _run(self):
+        #The job's stage timings and API calls are recorded as one run in the run log
+        with metrics.recording(self.country_code, 'dashboard') as run:
+            self._run_pipeline()
+            run.finish(self.status, self.error)
+
+    def _run_pipeline(self):
+        #API calls are counted while the job runs. Requests made by other jobs at the same time are counted too
+        api_budget.install()
+        http_client.add_before_request_hook(self._count_request)
+        try:
+            #An unfinished chunked transform is finished from its raw articles instead of fetching new ones over them
+            options = self.transform_options
+            resumed = has_unfinished_chunks(
+                self.country_code, options.get('chunk_size'), options.get('incremental', False), options.get('backend', 'remote')
+            )
+            if not resumed:
+                self.status = 'fetching'
+                articles = iter_top_headlines(self.country_code, max_articles = self.max_articles)
+                self.articles_fetched = save_articles_to_csv(articles, self.country_code)
+
+            if not self.articles_fetched and not resumed:
+                self.status = 'no_articles'
+                return
+
+            self.status = 'enriching'
+            self.summary = transform_articles(self.country_code, progress = self._on_progress, **self.transform_options)
+            self.status = 'done'
+        except QuotaExceededError as e:
+            self.error = str(e)
+            self.status = 'quota_exceeded'
+            api_budget.record_quota_error(e)
+        except Exception as e:
+            self.error = f'{type(e).__name__}: {e}'
+            self.status = 'failed'
+        finally:
+            http_client.remove_before_request_hook(self._count_request)
+            self.finished_at = time.time()
+
+    def eta_seconds(self):
+        '''
+        Estimates the seconds left from the rate rows have been enriched at so far.
+        Returns None until there is enough to go on
+        '''
+        with self._lock:
+            done, total, started = self.rows_done, self.rows_total, self._enrich_started_at
+        if not done or total is None or started is None:
+            return None
+        rate = done / max(time.time() - started, 1e-6)
+        return max(0.0, (total - done) / rate)
+
+    def progress(self):
+        '''
+        Returns a snapshot of the job's status, row counts, API calls, elapsed time and ETA
+        '''
+        with self._lock:
+            snapshot = {
+                'country': self.country_code,
+                'status': self.status,
+                'articles_fetched': self.articles_fetched,
+                'rows_done': self.rows_done,
+                'rows_total': self.rows_total,
+                'api_calls': self.api_calls,
+                'error': self.error,
+                'summary': self.summary
+            }
+        end = self.finished_at or time.time()
+        snapshot['elapsed_seconds'] = round(end - self.started_at, 1) if self.started_at else 0.0
+        eta = self.eta_seconds() if self.running else None
+        snapshot['eta_seconds'] = round(eta, 1) if eta is not None else None
+        return snapshot
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def get_job(country_code):
+    '''
+    Returns the latest job for a country, or None if none was started
+    '''
+    with _jobs_lock:
+        return _jobs.get(country_code.lower())
+
+def start_job(country_code, **options):
+    '''
+    Starts a pipeline job for a country and returns it.
+    If a job for the country is already running, that job is returned instead of starting another
+    '''
+    with _jobs_lock:
+        job = _jobs.get(country_code.lower())
+        if job is not None and job.running:
+            return job
+        job = PipelineJob(country_code, **options)
+        _jobs[job.country_code] = job
+        return job.start()
+
+def clear_finished_jobs():
+    '''
+    Forgets every job that has stopped, so the next start_job for that country runs again
+    '''
+    with _jobs_lock:
+        for country_code in [c for c, job in _jobs.items() if not job.running]:
+            del _jobs[country_code]
@@ -0,0 +1,242 @@
+'''
+Local enrichment backend: works out the sentiment, entities and topic of articles on this machine
+instead of calling the iSchool APIs, so articles can be enriched with no network calls and no quota.
+get_sentiment_batch, get_entities_batch and get_topic_from_entities take and return the same things
+as the functions with the same names in transform, so enrich_articles can run either backend.
+    -Sentiment adds up the scores of the words found in a lexicon (nltk's VADER lexicon when it is
+     downloaded, a small built-in one otherwise), flipping words that follow a negation
+    -Entities are runs of capitalized words and acronyms (EX: United States, NASA). A single word that is
+     only capitalized because it starts a sentence is dropped unless it is a known topic keyword
+    -Topics come from keywords in the entities (EX: Nasdaq -> finance)
+Sentiment and entities are worked out for a whole batch of texts at once with pandas string methods.
+The score_* functions also return how sure the rules are, so the 'local_first' backend in transform
+can send only the rows the rules aren't sure about to the APIs.
+'''
+import numpy as np
+import pandas as pd
+
+#Compound scores at or above / at or below these are positive / negative, the same cut offs VADER uses
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+#Sentiments with a confidence (the size of the compound score) below this are sent to the API by 'local_first'
+MIN_SENTIMENT_CONFIDENCE = 0.3
+
+#Topics with a confidence (the share of keyword hits the topic got) below this are sent to the API by 'local_first'
+MIN_TOPIC_CONFIDENCE = 0.6
+
+#Normalizes the summed word scores into -1 to 1, as VADER does
+_ALPHA = 15
+
+#Scales the score of a word that follows a negation, as VADER does
+_NEGATION_SCALE = -0.74
+
+#Words that flip the sentiment of the next two words (EX: not good)
+NEGATIONS = {
+    "not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without",
+    "isn't", "aren't", "wasn't", "weren't", "don't", "doesn't", "didn't", "won't", "can't", "cannot", "couldn't"
+}
+
+#Used when nltk or its VADER lexicon isn't installed. Scores use VADER's -4 to 4 scale
+_BUILTIN_LEXICON = {
+    **{word: 2.0 for word in [
+        "good", "great", "win", "wins", "won", "success", "successful", "growth", "gain", "gains", "rise", "rises",
+        "rally", "rallies", "best", "improve", "improved", "improves", "boost", "boosts", "strong", "hope", "hopes",
+        "celebrate", "celebrates", "praise", "praised", "agree", "agreement", "deal", "safe", "safely", "recover",
+        "recovery", "benefit", "benefits", "love", "happy", "peace", "support", "approve", "approved", "profit",
+        "profits", "breakthrough", "victory", "help", "helps", "positive", "optimistic", "surge", "surges", "soar",
+        "soars", "record", "award", "thrilled", "welcome", "welcomed", "free", "rescue", "rescued"
+    ]},
+    **{word: -2.0 for word in [
+        "bad", "worse", "loss", "losses", "lose", "lost", "fall", "falls", "fell", "drop", "drops", "decline",
+        "declines", "fear", "fears", "threat", "threats", "warn", "warns", "warning", "fail", "failed", "failure",
+        "cut", "cuts", "layoffs", "lawsuit", "sue", "sued", "arrest", "arrested", "charged", "storm", "protest",
+        "conflict", "recession", "inflation", "slump", "concern", "concerns", "risk", "risks", "damage", "negative",
+        "ban", "banned", "accused", "delay", "delayed", "debt", "strike", "tariffs", "sanctions", "outage", "problem"
+    ]},
+    **{word: -3.0 for word in [
+        "worst", "crash", "crisis", "war", "attack", "attacks", "kill", "killed", "killing", "death", "deaths",
+        "dead", "die", "dies", "died", "injured", "fraud", "scandal", "shooting", "disaster", "collapse", "violence",
+        "plunge", "plunges", "victims", "murder", "terror", "bomb", "explosion", "flood", "fire", "wildfire"
+    ]}
+}
+
+#Capitalized words that start sentences or name days and months rather than people, places or organizations
+STOPWORDS = {
+    "The", "A", "An", "He", "She", "It", "They", "We", "I", "You", "This", "That", "These", "Those", "In", "On",
+    "At", "But", "And", "Or", "If", "As", "After", "Before", "When", "While", "His", "Her", "Their", "Our", "Its",
+    "There", "Here", "What", "Who", "Why", "How", "Where", "For", "From", "With", "By", "To", "Of", "Is", "Are",
+    "Was", "Were", "Has", "Have", "Had", "Will", "Would", "Can", "Could", "Should", "May", "Mr", "Mrs", "Ms", "Dr",
+    "New", "More", "Some", "All", "One", "Two", "Three", "So", "Now", "Then", "Also", "Just", "Still", "Yet",
+    "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday",
+    "January", "February", "March", "April", "June", "July", "August", "September", "October", "November", "December"
+}
+
+#Runs of capitalized words or dotted acronyms (EX: U.S.), allowing 'of' or 'the' inside a name (EX: Bank of England)
+ENTITY_PATTERN = r"(?:(?:[A-Z]\.){2,}|[A-Z][\w'&-]*)(?: (?:(?:of|the|for|de) )?(?:(?:[A-Z]\.){2,}|[A-Z][\w'&-]*))*"
+
+#Acronyms, with or without dots (EX: NASA, U.S.)
+ACRONYM_PATTERN = r"(?:[A-Z]\.){2,}|[A-Z][A-Z0-9&]+"
+
+#Where a sentence starts: the start of the text, after a line break or after a full stop, question or exclamation mark
+_SENTENCE_START = r"(^|\n\s*|[.!?][\"'’”)]*\s+)"
+
+#Marks sentence starts before the entities are found, so capitalization that only comes from the start of a sentence can be told apart
+_MARK = '\x00'
+
+#Broad topics with the words in entities that point to them, matching the labels the GenAI prompt asks for
+TOPIC_KEYWORDS = {
+    'finance': {
+        "nasdaq", "dow", "s&p", "stock", "stocks", "wall street", "federal reserve", "fed", "bank", "treasury",
+        "bitcoin", "crypto", "inflation", "imf", "nyse", "ftse", "tariff", "tariffs", "earnings", "investors"
+    },
+    'politics': {
+        "congress", "senate", "house", "white house", "trump", "biden", "harris", "republican", "republicans",
+        "democrat", "democrats", "parliament", "labour", "conservative", "conservatives", "election", "supreme court",
+        "government", "minister", "prime minister", "president", "governor", "campaign", "gop", "nato", "un"
+    },
+    'sports': {
+        "nfl", "nba", "mlb", "nhl", "fifa", "uefa", "premier league", "olympics", "world cup", "super bowl",
+        "lakers", "yankees", "celtics", "warriors", "cowboys", "chiefs", "wimbledon", "pga", "ufc", "espn"
+    },
+    'technology': {
+        "apple", "google", "microsoft", "amazon", "meta", "openai", "ai", "chatgpt", "tesla", "nvidia", "intel",
+        "iphone", "android", "samsung", "tiktok", "x", "twitter", "spacex", "software", "silicon valley"
+    },
+    'health': {
+        "who", "cdc", "fda", "covid", "covid-19", "nih", "medicare", "medicaid", "cancer", "vaccine", "hospital",
+        "measles", "flu", "pfizer", "moderna", "health", "nhs"
+    },
+    'science': {
+        "nasa", "mars", "moon", "esa", "space", "climate", "earth", "noaa", "scientists", "university", "asteroid"
+    },
+    'entertainment': {
+        "hollywood", "netflix", "disney", "oscars", "oscar", "grammy", "grammys", "emmy", "emmys", "marvel",
+        "broadway", "taylor swift", "beyonce", "hbo", "spotify", "billboard"
+    },
+    'weather': {
+        "national weather service", "hurricane", "tornado", "storm", "met office", "blizzard"
+    }
+}
+
+#Every keyword of TOPIC_KEYWORDS, the words a sentence-starting single word is kept for
+_KNOWN_WORDS = set().union(*TOPIC_KEYWORDS.values())
+
+_lexicon = None
+
+def sentiment_lexicon():
+    '''
+    Returns the {word: score} lexicon, loading nltk's VADER lexicon the first time if it is installed
+    (python -m nltk.downloader vader_lexicon) and the built-in one otherwise
+    '''
+    global _lexicon
+    if _lexicon is None:
+        try:
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+            _lexicon = dict(SentimentIntensityAnalyzer().lexicon)
+        except (ImportError, LookupError):
+            _lexicon = dict(_BUILTIN_LEXICON)
+    return _lexicon
+
+def score_sentiment(texts):
+    '''
+    Scores a batch of texts at once. Returns a DF with a row per text holding the 'sentiment'
+    (positive, neutral or negative, None for empty texts), the 'compound' score from -1 to 1 and the
+    'confidence' from 0 to 1 (the size of the compound score, so a neutral label is never confident)
+    '''
+    texts = pd.Series(list(texts), dtype = object)
+    tokens = texts.fillna('').astype(str).str.casefold().str.findall(r"[a-z][a-z']*").explode()
+
+    #A word within two words after a negation counts the other way, at a lower weight
+    previous = tokens.groupby(level = 0)
+    negated = previous.shift(1).isin(NEGATIONS) | previous.shift(2).isin(NEGATIONS)
+    scores = tokens.map(sentiment_lexicon()).fillna(0.0).astype(float).to_numpy()
+    scores = pd.Series(np.where(negated.to_numpy(), scores * _NEGATION_SCALE, scores), index = tokens.index)
+
+    totals = scores.groupby(level = 0).sum().reindex(range(len(texts)), fill_value = 0.0).to_numpy()
+    compound = totals / np.sqrt(totals * totals + _ALPHA)
+    sentiments = np.select(
+        [compound >= POSITIVE_THRESHOLD, compound <= NEGATIVE_THRESHOLD],
+        ['positive', 'negative'],
+        'neutral'
+    ).astype(object)
+
+    #Empty texts get no sentiment, like the API
+    empty = (texts.fillna('').astype(str) == '').to_numpy()
+    sentiments[empty] = None
+    #An object Series keeps None, which the default str dtype would turn into NaN
+    return pd.DataFrame({'sentiment': pd.Series(sentiments, dtype = object), 'compound': compound, 'confidence': np.abs(compound)})
+
+def get_sentiment_batch(texts):
+    '''
+    Returns the sentiment of every text in the same order (None for empty texts)
+    '''
+    return score_sentiment(texts)['sentiment'].tolist()
+
+def score_entities(texts):
+    '''
+    Finds the entities of a batch of texts at once. Returns a DF with a row per text holding the
+    'entities' (each once in the order it first appears, None for empty texts) and whether the rules are
+    'confident' about them: only when at least one is a multi-word name or an acronym, since a lone
+    capitalized word (EX: Stocks, Officials) is often just a capitalized common word
+    '''
+    texts = pd.Series(list(texts), dtype = object).fillna('').astype(str)
+    marked = texts.str.replace(_SENTENCE_START, r'\1' + _MARK, regex = True)
+    found = marked.str.findall(f'({_MARK}?)({ENTITY_PATTERN})').explode().dropna()
+    at_start = found.str[0].eq(_MARK).to_numpy()
+    matches = found.str[1].str.replace(r"['’]s$", '', regex = True)
+
+    #Drops a sentence-starting word from the front of a name (EX: The White House -> White House)
+    first_words = matches.str.split(' ', n = 1)
+    leading = (first_words.str[0].isin(STOPWORDS) & (first_words.str.len() > 1)).to_numpy()
+    matches = pd.Series(np.where(leading, first_words.str[-1], matches), index = matches.index)
+    at_start = at_start & ~leading
+
+    #A single word at the start of a sentence is only kept if it is a known keyword or an acronym
+    single = ~matches.str.contains(' ', regex = False)
+    acronym = matches.str.fullmatch(ACRONYM_PATTERN).fillna(False).astype(bool)
+    known = matches.str.casefold().isin(_KNOWN_WORDS)
+    keep = ~matches.isin(STOPWORDS) & (matches.str.len() > 1) & ~(pd.Series(at_start, index = matches.index) & single & ~acronym & ~known)
+    strong = (~single | acronym)[keep]
+    matches = matches[keep]
+
+    grouped = matches.groupby(level = 0).unique()
+    confident = strong.groupby(level = 0).any().reindex(range(len(texts)), fill_value = False).to_numpy()
+    return pd.DataFrame({
+        'entities': [None if not text else list(grouped.get(i, [])) for i, text in enumerate(texts)],
+        'confident': confident
+    })
+
+def get_entities_batch(texts):
+    '''
+    Returns a list of entities for every text in the same order (None for empty texts),
+    each entity once in the order it first appears
+    '''
+    return score_entities(texts)['entities'].tolist()
+
+def score_topic(entities):
+    '''
+    Picks a broad topic from the keywords in a list of entities.
+    Returns (topic, confidence), where the confidence is the share of keyword hits the topic got,
+    or ('Unknown', 0.0) if no entity points to a topic
+    '''
+    words = set()
+    for entity in entities or []:
+        phrase = str(entity).casefold()
+        words.add(phrase)
+        words.update(phrase.split())
+
+    hits = {topic: len(words & keywords) for topic, keywords in TOPIC_KEYWORDS.items()}
+    total = sum(hits.values())
+    if not total:
+        return 'Unknown', 0.0
+
+    #Ties go to the topic listed first in TOPIC_KEYWORDS
+    topic = max(hits, key = hits.get)
+    return topic, hits[topic] / total
+
+def get_topic_from_entities(entities):
+    '''
+    Returns a 1-2 word topic label for a list of entities, or "Unknown"
+    '''
+    return score_topic(entities)[0]
@@ -0,0 +1,291 @@
+'''
+Instrumentation for pipeline runs: the wall time of every stage, the calls, latency histogram,
+retries and errors of every API endpoint, and the rows the final filter dropped with the reason.
+
+A run is recorded by wrapping it in recording(). The run is kept in a context variable, so the
+stage() and record_call() helpers used by extract, transform and http_client find it without it
+being passed around, and runs for different countries on different threads don't mix.
+Finished runs are appended to a JSON lines run log in the cache folder, which the dashboard reads.
+'''
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+#JSON lines file holding one entry per finished run, oldest first
+RUN_LOG_PATH = os.path.join('cache', 'run_log.jsonl')
+
+#Most runs kept in the run log, older ones are dropped when a new run is written
+MAX_LOGGED_RUNS = 200
+
+#Upper bounds (in seconds) of the latency histogram buckets. Slower calls go in a last '+inf' bucket
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+_current_run = contextvars.ContextVar('current_run', default = None)
+_log_lock = threading.Lock()
+
+def latency_bucket(seconds):
+    '''
+    Returns the label of the histogram bucket a call that took 'seconds' falls in
+    '''
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            return f'<={bound}s'
+    return '+inf'
+
+class RunMetrics:
+    '''
+    Collects the timings and counts of one pipeline run. Safe to update from several threads
+    '''
+
+    def __init__(self, country_code, kind = 'transform'):
+        self.country_code = country_code.lower()
+        self.kind = kind
+        self.status = 'ok'
+        self.error = None
+        self.started_at = datetime.now(timezone.utc)
+        self.seconds = None
+        self.stages = {}
+        self.endpoints = {}
+        self.dropped = {}
+        self.counts = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_stage_time(self, name, seconds):
+        '''
+        Adds 'seconds' to a stage. A stage that runs several times (EX: once per chunk or page) adds up.
+        Stages that run on several threads at once (sentiment, entities, topic) add up the time of every call
+        '''
+        with self._lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Times the block it wraps as stage 'name'
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start)
+
+    def record_call(self, endpoint, seconds, status_code = None, retry = False, error = None):
+        '''
+        Records one request attempt to an endpoint: its latency, status code (or the name of the
+        exception for a connection error), and whether it was a retry
+        '''
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'calls': 0, 'retries': 0, 'errors': 0, 'seconds': 0.0, 'statuses': {}, 'latency': {}
+            })
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            if retry:
+                stats['retries'] += 1
+            outcome = str(status_code) if status_code is not None else error
+            stats['statuses'][outcome] = stats['statuses'].get(outcome, 0) + 1
+            if error is not None or status_code >= 400:
+                stats['errors'] += 1
+            bucket = latency_bucket(seconds)
+            stats['latency'][bucket] = stats['latency'].get(bucket, 0) + 1
+
+    def record_dropped(self, reason, count):
+        '''
+        Adds 'count' rows dropped for 'reason'
+        '''
+        if not count:
+            return
+        with self._lock:
+            self.dropped[reason] = self.dropped.get(reason, 0) + int(count)
+
+    def count(self, name, value = 1):
+        '''
+        Adds to a named counter (EX: rows_loaded)
+        '''
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def finish(self, status = None, error = None):
+        '''
+        Stops the run clock and sets the final status
+        '''
+        self.seconds = time.perf_counter() - self._start
+        if status is not None:
+            self.status = status
+        if error is not None:
+            self.error = error
+
+    def to_dict(self):
+        '''
+        Returns the run as a JSON ready dict
+        '''
+        with self._lock:
+            seconds = self.seconds if self.seconds is not None else time.perf_counter() - self._start
+            bucket_order = [latency_bucket(bound) for bound in LATENCY_BUCKETS] + ['+inf']
+            return {
+                'country': self.country_code,
+                'kind': self.kind,
+                'status': self.status,
+                'error': self.error,
+                'started_at': self.started_at.isoformat(),
+                'seconds': round(seconds, 3),
+                'stages': {name: {'seconds': round(s['seconds'], 3), 'calls': s['calls']} for name, s in self.stages.items()},
+                'endpoints': {
+                    name: dict(
+                        e,
+                        seconds = round(e['seconds'], 3),
+                        statuses = dict(e['statuses']),
+                        latency = {bucket: e['latency'][bucket] for bucket in bucket_order if bucket in e['latency']}
+                    )
+                    for name, e in self.endpoints.items()
+                },
+                'api_calls': sum(e['calls'] for e in self.endpoints.values()),
+                'dropped': dict(self.dropped),
+                'counts': dict(self.counts)
+            }
+
+def current():
+    '''
+    Returns the run being recorded in this context, or None
+    '''
+    return _current_run.get()
+
+@contextmanager
+def stage(name):
+    '''
+    Times the block it wraps as a stage of the current run. Does nothing if no run is being recorded
+    '''
+    run = current()
+    if run is None:
+        yield
+        return
+    with run.stage(name):
+        yield
+
+def timed(name, fn):
+    '''
+    Wraps 'fn' so every call is timed as stage 'name' of the run current when it is called
+    '''
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def record_call(endpoint, seconds, status_code = None, retry = False, error = None):
+    '''
+    Records a request attempt on the current run, if one is being recorded
+    '''
+    run = current()
+    if run is not None:
+        run.record_call(endpoint, seconds, status_code, retry, error)
+
+def record_dropped(reason, count):
+    '''
+    Records dropped rows on the current run, if one is being recorded
+    '''
+    run = current()
+    if run is not None:
+        run.record_dropped(reason, count)
+
+def count(name, value = 1):
+    '''
+    Adds to a counter of the current run, if one is being recorded
+    '''
+    run = current()
+    if run is not None:
+        run.count(name, value)
+
+@contextmanager
+def recording(country_code, kind = 'transform', path = None):
+    '''
+    Records the block it wraps as a run and appends it to the run log when the block ends.
+    If a run is already being recorded (EX: transform_articles called from the pipeline),
+    the block is part of that run and nothing extra is written.
+    An exception marks the run 'failed' unless the block already set another status
+    '''
+    run = current()
+    if run is not None:
+        yield run
+        return
+
+    run = RunMetrics(country_code, kind)
+    token = _current_run.set(run)
+    try:
+        yield run
+    except BaseException as e:
+        if run.status == 'ok':
+            run.finish('failed', f'{type(e).__name__}: {e}')
+        raise
+    finally:
+        _current_run.reset(token)
+        run.finish()
+        write_run(run, path)
+
+def write_run(run, path = None):
+    '''
+    Appends a finished run to the run log, keeping only the latest MAX_LOGGED_RUNS
+    '''
+    path = path or RUN_LOG_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+
+    with _log_lock:
+        lines = []
+        if os.path.exists(path):
+            with open(path) as f:
+                lines = [line for line in f if line.strip()]
+        lines.append(json.dumps(run.to_dict()) + '\n')
+        with open(path + '.tmp', 'w') as f:
+            f.writelines(lines[-MAX_LOGGED_RUNS:])
+        os.replace(path + '.tmp', path)
+
+def read_runs(limit = 20, path = None):
+    '''
+    Returns the latest 'limit' runs from the run log, newest first
+    '''
+    path = path or RUN_LOG_PATH
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+
+    runs = []
+    for line in reversed(lines[-limit:] if limit else lines):
+        try:
+            runs.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return runs
+
+def run_summary(run):
+    '''
+    Flattens a logged run into one row for a table: when it ran, how long it took,
+    the slowest stage, the API calls made, the rows dropped and the topics answered without GenAI
+    '''
+    stages = run.get('stages', {})
+    endpoints = run.get('endpoints', {}).values()
+    slowest = max(stages, key = lambda name: stages[name]['seconds']) if stages else None
+    counts = run.get('counts', {})
+    asked = counts.get('topic_model_hits', 0) + counts.get('topic_model_misses', 0)
+    return {
+        'started_at': run.get('started_at', '')[:19].replace('T', ' '),
+        'country': run.get('country'),
+        'kind': run.get('kind'),
+        'status': run.get('status'),
+        'seconds': run.get('seconds'),
+        'slowest_stage': slowest,
+        'api_calls': run.get('api_calls', 0),
+        'retries': sum(e['retries'] for e in endpoints),
+        'errors': sum(e['errors'] for e in endpoints),
+        'rows_dropped': sum(run.get('dropped', {}).values()),
+        'genai_calls_avoided': counts.get('topic_model_hits', 0),
+        'topic_model_hit_rate': round(counts.get('topic_model_hits', 0) / asked, 3) if asked else None
+    }
@@ -0,0 +1,228 @@
+'''
+Runs the extract and transform steps for several countries at once, so every cache can be
+warmed ahead of time (EX: from a cron job) instead of while a user waits on the dashboard.
+
+Run from the project folder:
+    python code/pipeline.py --countries us gb ca au --report cache/pipeline_report.json
+'''
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+try:
+    from . import api_budget, http_client, metrics, topic_model
+    from .api_budget import BudgetExceededError
+    from .enrich import RateLimiter, DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND
+    from .extract import iter_top_headlines, save_articles_to_csv, DEFAULT_MAX_ARTICLES
+    from .http_client import QuotaExceededError
+    from .transform import has_unfinished_chunks, transform_articles, ENRICHMENT_BACKENDS, SENTIMENT_URL
+except ImportError:
+    import api_budget
+    import http_client
+    import metrics
+    import topic_model
+    from api_budget import BudgetExceededError
+    from enrich import RateLimiter, DEFAULT_BATCH_SIZE, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND
+    from extract import iter_top_headlines, save_articles_to_csv, DEFAULT_MAX_ARTICLES
+    from http_client import QuotaExceededError
+    from transform import has_unfinished_chunks, transform_articles, ENRICHMENT_BACKENDS, SENTIMENT_URL
+
+#The countries the free News API tier supports (same list the dashboard offers)
+DEFAULT_COUNTRIES = ['us', 'gb', 'ca', 'au']
+
+#Where the run report is written unless another path is given
+DEFAULT_REPORT_PATH = os.path.join('cache', 'pipeline_report.json')
+
+class ApiBudget:
+    '''
+    Caps the number of API requests one pipeline run may make, shared by every country.
+    Registered as an http_client hook, so it counts every request attempt including retries
+    '''
+
+    def __init__(self, max_calls = None):
+        self.max_calls = max_calls
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, host):
+        with self._lock:
+            if self.max_calls is not None and self.used >= self.max_calls:
+                raise BudgetExceededError(f'Pipeline budget of {self.max_calls} API calls is used up', host = host)
+            self.used += 1
+
+def run_country(country_code, max_workers = DEFAULT_MAX_WORKERS, limiter = None, incremental = False,
+                max_articles = DEFAULT_MAX_ARTICLES, chunk_size = None, backend = 'remote'):
+    '''
+    Runs extract and transform for one country and returns its status.
+    Headlines are streamed page by page straight into the raw cache, up to 'max_articles' (None for every page).
+    With 'chunk_size' set the transform is checkpointed, so a country that fails can resume on the next run.
+    A country with an unfinished chunked transform isn't fetched again, its raw articles are finished first.
+    'backend' picks where the enrichment comes from (see transform.ENRICHMENT_BACKENDS)
+        -'ok' when the cleaned cache was written
+        -'no_articles' when the News API had no headlines for the country
+        -'deferred' when today's API budget can't pay for even one article, so nothing was fetched
+        -'quota_exceeded' when an API quota or the run budget was used up
+        -'error' for any other failure
+    '''
+    status = {'country': country_code, 'status': 'ok', 'articles_fetched': 0, 'resumed': False, 'summary': None, 'error': None}
+    start = time.perf_counter()
+
+    #The country's stage timings and API calls are recorded as one run in the run log
+    with metrics.recording(country_code, 'pipeline') as run:
+        try:
+            #Fetching is pointless if the day's budget can't pay for enriching a single article
+            ischool_calls = 0 if backend == 'local' else api_budget.ischool_calls_needed(1, DEFAULT_BATCH_SIZE)
+            if not api_budget.get_default_budget().can_afford({'newsapi': 1, 'ischool': ischool_calls}):
+                raise BudgetExceededError(f'Daily API budget is used up, {country_code} is deferred until it resets')
+
+            #Fetching would replace the raw articles the unfinished chunks were made from
+            status['resumed'] = has_unfinished_chunks(country_code, chunk_size, incremental, backend)
+            if not status['resumed']:
+                articles = iter_top_headlines(country_code, max_articles = max_articles)
+                status['articles_fetched'] = save_articles_to_csv(articles, country_code, merge = incremental)
+
+            if not status['articles_fetched'] and not status['resumed']:
+                status['status'] = 'no_articles'
+            else:
+                status['summary'] = transform_articles(
+                    country_code,
+                    max_workers = max_workers,
+                    incremental = incremental,
+                    limiter = limiter,
+                    chunk_size = chunk_size,
+                    backend = backend
+                )
+        except QuotaExceededError as e:
+            status['status'] = 'deferred' if isinstance(e, BudgetExceededError) and not status['articles_fetched'] and not status['resumed'] else 'quota_exceeded'
+            status['error'] = str(e)
+            api_budget.record_quota_error(e)
+        except Exception as e:
+            status['status'] = 'error'
+            status['error'] = f'{type(e).__name__}: {e}'
+
+        run.finish(status['status'], status['error'])
+        logged = run.to_dict()
+        status['stages'] = logged['stages']
+        status['topic_model'] = topic_model.hit_rate(logged['counts'])
+
+    status['seconds'] = round(time.perf_counter() - start, 3)
+    return status
+
+def run_pipeline(countries = DEFAULT_COUNTRIES, parallel_countries = 4, max_workers = DEFAULT_MAX_WORKERS,
+                 requests_per_second = DEFAULT_REQUESTS_PER_SECOND, max_concurrency = None,
+                 max_api_calls = None, incremental = False, stop_on_error = False, max_articles = DEFAULT_MAX_ARTICLES,
+                 chunk_size = None, backend = 'remote'):
+    '''
+    Runs every country concurrently and returns a run report.
+        -'requests_per_second' is one rate limit shared by all countries
+        -'max_concurrency' caps the iSchool requests in flight across all countries
+        -'max_api_calls' caps the requests the whole run may make
+        -'max_articles' caps the headlines fetched per country
+        -'chunk_size' processes each country in checkpointed chunks of that many articles
+        -'backend' picks where the enrichment comes from: 'remote', 'local' or 'local_first'
+        -A failing country doesn't stop the others unless 'stop_on_error' is set
+    '''
+    #Every request is counted against the daily API budget as well as the run's own budget
+    api_budget.install()
+    budget = ApiBudget(max_api_calls)
+    limiter = RateLimiter(requests_per_second)
+    http_client.add_before_request_hook(budget)
+
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    results = {}
+
+    #The iSchool limit is only changed for this run and put back once every country is done
+    ischool_host = urlparse(SENTIMENT_URL).hostname
+    previous_limit = http_client.set_host_limit(ischool_host, max_concurrency) if max_concurrency else None
+
+    try:
+        with ThreadPoolExecutor(max_workers = max(1, parallel_countries)) as pool:
+            futures = {
+                pool.submit(run_country, country_code.lower(), max_workers, limiter, incremental, max_articles, chunk_size, backend): country_code.lower()
+                for country_code in countries
+            }
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                status = future.result()
+                results[status['country']] = status
+                print(f"[{status['country']}] {status['status']} in {status['seconds']}s" + (f" - {status['error']}" if status['error'] else ''))
+
+                #Cancels the countries that haven't started yet
+                if stop_on_error and status['status'] in ('error', 'quota_exceeded'):
+                    for other in futures:
+                        other.cancel()
+    finally:
+        http_client.remove_before_request_hook(budget)
+        if max_concurrency:
+            http_client.set_host_limit(ischool_host, previous_limit)
+
+    #Countries cancelled by stop_on_error are reported as skipped
+    for country_code in countries:
+        results.setdefault(country_code.lower(), {'country': country_code.lower(), 'status': 'skipped'})
+
+    return {
+        'started_at': started_at.isoformat(),
+        'finished_at': datetime.now(timezone.utc).isoformat(),
+        'seconds': round(time.perf_counter() - start, 3),
+        'api_calls': budget.used,
+        'max_api_calls': max_api_calls,
+        'ok': all(r['status'] in ('ok', 'no_articles') for r in results.values()),
+        'countries': [results[c.lower()] for c in countries]
+    }
+
+def write_report(report, path = DEFAULT_REPORT_PATH):
+    '''
+    Writes the run report as JSON
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent = 2)
+
+def main(argv = None):
+    '''
+    Command line entry point. Returns 0 when every country succeeded, 1 otherwise
+    '''
+    parser = argparse.ArgumentParser(description = 'Fetch and enrich top headlines for several countries at once')
+    parser.add_argument('--countries', nargs = '+', default = DEFAULT_COUNTRIES, help = 'Country codes to run (default: us gb ca au)')
+    parser.add_argument('--parallel-countries', type = int, default = 4, help = 'Countries run at the same time')
+    parser.add_argument('--max-workers', type = int, default = DEFAULT_MAX_WORKERS, help = 'Enrichment threads per country')
+    parser.add_argument('--requests-per-second', type = float, default = DEFAULT_REQUESTS_PER_SECOND, help = 'Shared iSchool rate limit')
+    parser.add_argument('--max-concurrency', type = int, default = None, help = 'iSchool requests in flight across all countries')
+    parser.add_argument('--max-api-calls', type = int, default = None, help = 'Budget of API requests for the whole run')
+    parser.add_argument('--max-articles', type = int, default = DEFAULT_MAX_ARTICLES, help = 'Headlines fetched per country (0 for no cap)')
+    parser.add_argument('--chunk-size', type = int, default = None, help = 'Transform in checkpointed chunks of this many articles')
+    parser.add_argument('--backend', choices = ENRICHMENT_BACKENDS, default = 'remote', help = 'Where sentiment, entities and topics come from')
+    parser.add_argument('--incremental', action = 'store_true', help = 'Only enrich new or changed articles')
+    parser.add_argument('--stop-on-error', action = 'store_true', help = 'Skip the remaining countries after a failure')
+    parser.add_argument('--report', default = DEFAULT_REPORT_PATH, help = 'Where to write the JSON run report')
+    args = parser.parse_args(argv)
+
+    report = run_pipeline(
+        args.countries,
+        parallel_countries = args.parallel_countries,
+        max_workers = args.max_workers,
+        requests_per_second = args.requests_per_second,
+        max_concurrency = args.max_concurrency,
+        max_api_calls = args.max_api_calls,
+        incremental = args.incremental,
+        stop_on_error = args.stop_on_error,
+        max_articles = args.max_articles or None,
+        chunk_size = args.chunk_size,
+        backend = args.backend
+    )
+    write_report(report, args.report)
+    print(f"Wrote run report to {args.report}")
+    return 0 if report['ok'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+'''
+The column types of the cleaned headlines, shared by transform (which builds them), storage (which
+writes and reads them) and the dashboard (which charts them), so every copy of the data in memory
+has the same compact layout:
+    -Label columns repeated on every row (source, sentiment, topic) are categoricals
+    -The day, month and time of day columns are ordered categoricals, so sorting and counting
+     them follows the calendar instead of the alphabet
+    -Free text columns are Arrow-backed strings instead of Python objects, when pyarrow is installed
+'''
+import pandas as pd
+
+#pyarrow backs the text columns, without it they stay Python objects
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+#3-hour blocks an article's publish time is grouped into, in chronological order
+TIME_OF_DAY_BUCKETS = [
+    "12AM-3AM", "3AM-6AM", "6AM-9AM", "9AM-12PM",
+    "12PM-3PM", "3PM-6PM", "6PM-9PM", "9PM-12AM"
+]
+
+DAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MONTH_ORDER = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+]
+
+#Low-cardinality text columns that are stored as (unordered) categoricals
+LABEL_COLUMNS = ['source_name', 'sentiment', 'topic', 'topic_source']
+
+#Date columns with a fixed order of values
+ORDERED_COLUMNS = {
+    'day_of_week_published': pd.CategoricalDtype(DAY_ORDER, ordered = True),
+    'month_published': pd.CategoricalDtype(MONTH_ORDER, ordered = True),
+    'time_of_day_published': pd.CategoricalDtype(TIME_OF_DAY_BUCKETS, ordered = True)
+}
+
+#Free text columns, mostly different on every row
+TEXT_COLUMNS = ['author', 'title', 'description', 'url', 'urlToImage', 'content', 'source_id', 'short_title', 'cluster_id']
+
+#Arrow-backed strings keep the text in one buffer instead of one Python object per value
+STRING_DTYPE = pd.StringDtype('pyarrow') if pa is not None else object
+
+def ordered(series, column):
+    '''
+    Returns a day, month or time of day column as its ordered categorical.
+    Values outside the order (EX: a misspelt month) become missing
+    '''
+    return series.astype(ORDERED_COLUMNS[column])
+
+def arrow_types_mapper():
+    '''
+    Returns the types_mapper for Table.to_pandas that turns Arrow strings straight into STRING_DTYPE,
+    skipping the Python object step. None if pyarrow isn't installed
+    '''
+    if pa is None:
+        return None
+    return {pa.string(): STRING_DTYPE, pa.large_string(): STRING_DTYPE}.get
+
+def apply_schema(df):
+    '''
+    Converts publishedAt to a UTC timestamp and the label, date and text columns to their compact dtypes.
+    Columns the frame doesn't have are skipped. Changes 'df' in place and returns it
+    '''
+    if 'publishedAt' in df.columns:
+        df['publishedAt'] = pd.to_datetime(df['publishedAt'], errors = 'coerce', utc = True)
+    for column in LABEL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in ORDERED_COLUMNS:
+        if column in df.columns:
+            df[column] = ordered(df[column], column)
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(STRING_DTYPE)
+    return df
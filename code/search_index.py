@@ -0,0 +1,199 @@
+'''
+Inverted indexes over the cleaned headlines of a country, so searches and filters only touch
+the articles that match instead of scanning every row.
+    -'entity': normalized entity -> articles that mention it
+    -'token': word from the title, description or content -> articles that contain it
+    -'sentiment' and 'topic': label -> articles with that label
+Articles are identified by their row position in the cleaned file. The index is saved next to
+the cleaned file and tagged with the file's version, so it is only rebuilt when the data changes.
+'''
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    from . import storage
+except ImportError:
+    import storage
+
+#Kinds of postings kept in the index
+INDEX_KINDS = ['entity', 'token', 'sentiment', 'topic']
+
+#Words are runs of letters and digits. Single characters are too common to be worth indexing
+TOKEN_PATTERN = r'\w{2,}'
+
+#Text columns covered by the token index
+TEXT_COLUMNS = ['title', 'description', 'content']
+
+def search_index_path(country_code):
+    '''
+    Returns the path of the saved search index for a country
+    '''
+    return os.path.join(storage.CACHE_DIR, f'search_index_{country_code.lower()}.parquet')
+
+def normalize_entity(entity):
+    '''
+    Normalizes an entity for lookups: trimmed, single spaced and case-folded (EX: ' NASA ' -> 'nasa')
+    '''
+    return ' '.join(str(entity).split()).casefold()
+
+def tokenize(text):
+    '''
+    Splits a search query into the same case-folded words the token index holds
+    '''
+    if not text:
+        return []
+    return pd.Series([text]).str.casefold().str.findall(TOKEN_PATTERN).iloc[0]
+
+def _postings(rows, terms):
+    '''
+    Groups row positions by term, returning {term: sorted unique row positions}
+    '''
+    pairs = pd.DataFrame({'term': terms, 'row': rows}).dropna().drop_duplicates()
+    if pairs.empty:
+        return {}
+    pairs = pairs.sort_values(['term', 'row'])
+
+    #Slices one sorted array of rows at the term boundaries instead of grouping into Python lists
+    row_values = pairs['row'].to_numpy(dtype = np.int32)
+    term_values = pairs['term'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, term_values[1:] != term_values[:-1]])
+    ends = np.r_[starts[1:], len(term_values)]
+    return {term_values[s]: row_values[s:e] for s, e in zip(starts, ends)}
+
+def build_index(df):
+    '''
+    Builds the entity, token and label postings for cleaned headlines.
+    Also keeps the most used spelling of every entity to show in the dashboard
+    '''
+    positions = np.arange(len(df))
+    index = {'rows': len(df), 'names': {}}
+
+    #Entities: one row per (article, entity)
+    entities = pd.Series(list(df['entities']) if 'entities' in df.columns else [[]] * len(df), index = positions, dtype = object)
+    exploded = entities.explode().dropna()
+    exploded = exploded[exploded.astype(str).str.strip() != '']
+    normalized = exploded.astype(str).str.split().str.join(' ').str.casefold()
+    index['entity'] = _postings(exploded.index.to_numpy(), normalized.to_numpy())
+    if len(exploded):
+        spellings = pd.DataFrame({'term': normalized.to_numpy(), 'name': exploded.astype(str).str.strip().to_numpy()})
+        index['names'] = spellings.groupby('term')['name'].agg(lambda names: names.value_counts().index[0]).to_dict()
+
+    #Tokens: one row per (article, word) across the text columns
+    text = pd.Series([''] * len(df), index = positions)
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            text = text + ' ' + df[column].fillna('').astype(str).to_numpy()
+    tokens = text.str.casefold().str.findall(TOKEN_PATTERN).explode().dropna()
+    index['token'] = _postings(tokens.index.to_numpy(), tokens.to_numpy())
+
+    #Labels, so filtering by sentiment or topic is a lookup as well
+    for kind in ['sentiment', 'topic']:
+        labels = df[kind].astype(object).to_numpy() if kind in df.columns else np.array([None] * len(df), dtype = object)
+        index[kind] = _postings(positions, labels)
+    return index
+
+def save_index(index, country_code, version):
+    '''
+    Saves an index as Parquet, tagged with the version of the data it was built from.
+    Does nothing when pyarrow isn't installed
+    '''
+    if storage.pa is None:
+        return None
+    pa = storage.pa
+
+    kinds, terms, names, offsets, values = [], [], [], [0], []
+    for kind in INDEX_KINDS:
+        for term, rows in index[kind].items():
+            kinds.append(kind)
+            terms.append(str(term))
+            names.append(index['names'].get(term) if kind == 'entity' else None)
+            values.append(rows)
+            offsets.append(offsets[-1] + len(rows))
+
+    flat = np.concatenate(values).astype(np.int32) if values else np.array([], dtype = np.int32)
+    table = pa.table({
+        'kind': pa.array(kinds, pa.string()),
+        'term': pa.array(terms, pa.string()),
+        'name': pa.array(names, pa.string()),
+        'rows': pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), pa.array(flat, pa.int32()))
+    })
+    table = table.replace_schema_metadata({'version': str(version), 'rows': str(index['rows'])})
+
+    path = search_index_path(country_code)
+    storage.pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+def read_index(country_code, version):
+    '''
+    Reads the saved index for a country. Returns None if there isn't one or it was built from other data
+    '''
+    path = search_index_path(country_code)
+    if storage.pq is None or not os.path.exists(path):
+        return None
+    table = storage.pq.read_table(path)
+    metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    if metadata.get('version') != str(version):
+        return None
+
+    #Every posting list is a view into one flat array of rows
+    rows = table.column('rows').combine_chunks()
+    flat = rows.values.to_numpy(zero_copy_only = False)
+    offsets = rows.offsets.to_numpy(zero_copy_only = False)
+    index = {'rows': int(metadata.get('rows', 0)), 'names': {}}
+    for kind in INDEX_KINDS:
+        index[kind] = {}
+    for i, (kind, term, name) in enumerate(zip(table.column('kind').to_pylist(), table.column('term').to_pylist(), table.column('name').to_pylist())):
+        index[kind][term] = flat[offsets[i]:offsets[i + 1]]
+        if name is not None:
+            index['names'][term] = name
+    return index
+
+def load_index(country_code, df, version):
+    '''
+    Returns the index for a country's cleaned headlines, reading the saved one when it matches
+    'version' and otherwise building it from 'df' and saving it
+    '''
+    index = read_index(country_code, version)
+    if index is None:
+        index = build_index(df)
+        save_index(index, country_code, version)
+    return index
+
+def search(index, text = '', entities = (), sentiment = None, topic = None):
+    '''
+    Returns the sorted row positions of the articles that match every part of the query:
+    all the words in 'text', all of 'entities', and the 'sentiment' and 'topic' if given.
+    An empty query matches every article
+    '''
+    postings = []
+    for token in tokenize(text):
+        postings.append(index['token'].get(token))
+    for entity in entities:
+        postings.append(index['entity'].get(normalize_entity(entity)))
+    if sentiment:
+        postings.append(index['sentiment'].get(sentiment))
+    if topic:
+        postings.append(index['topic'].get(topic))
+
+    if not postings:
+        return np.arange(index['rows'])
+    if any(p is None for p in postings):
+        return np.array([], dtype = np.int32)
+
+    #Intersects from the shortest list so every step works on as few rows as possible
+    postings.sort(key = len)
+    matches = postings[0]
+    for rows in postings[1:]:
+        if not len(matches):
+            break
+        matches = np.intersect1d(matches, rows, assume_unique = True)
+    return matches
+
+def top_entities(index, limit = 200):
+    '''
+    Returns the display names of the entities found in the most articles, most common first
+    '''
+    counts = sorted(index['entity'].items(), key = lambda item: len(item[1]), reverse = True)[:limit]
+    return [index['names'].get(term, term) for term, _ in counts]
@@ -0,0 +1,314 @@
+import ast
+import json
+import os
+import shutil
+import pandas as pd
+
+#pyarrow is needed for the Parquet cache, without it the cleaned data is stored as CSV
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+
+try:
+    from . import schema
+except ImportError:
+    import schema
+
+CACHE_DIR = 'cache'
+
+def cleaned_parquet_path(country_code):
+    '''
+    Returns the path of the Parquet file holding the cleaned headlines for a country
+    '''
+    return os.path.join(CACHE_DIR, f'cleaned_headlines_{country_code.lower()}.parquet')
+
+def cleaned_csv_path(country_code):
+    '''
+    Returns the path of the older CSV file holding the cleaned headlines for a country
+    '''
+    return os.path.join(CACHE_DIR, f'cleaned_headlines_{country_code.lower()}.csv')
+
+def cleaned_file_path(country_code):
+    '''
+    Returns the path of the cleaned file that load_cleaned would read, or None if there isn't one.
+    The Parquet file is preferred over the CSV file when both exist
+    '''
+    paths = [cleaned_csv_path(country_code)]
+    if pq is not None:
+        paths.insert(0, cleaned_parquet_path(country_code))
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+def cached_countries():
+    '''
+    Returns a sorted list of the country codes that have a cleaned file in the cache
+    '''
+    if not os.path.exists(CACHE_DIR):
+        return []
+    countries = set()
+    for filename in os.listdir(CACHE_DIR):
+        name, extension = os.path.splitext(filename)
+        if name.startswith('cleaned_headlines_') and extension in ('.parquet', '.csv'):
+            countries.add(name.replace('cleaned_headlines_', ''))
+    return sorted(countries)
+
+#Function to check for missing values in entities
+def safe_parse_entities(x):
+    '''
+    Turns an entities value from the CSV cache (the string form of a list) back into a list
+    '''
+    if isinstance(x, str) and x.strip() not in ["", "[]"]:
+        try:
+            return ast.literal_eval(x)
+        except (ValueError, SyntaxError):
+            return []
+    elif isinstance(x, (list, tuple)):
+        return list(x)
+    else:
+        return []
+
+def apply_cleaned_dtypes(df):
+    '''
+    Converts publishedAt to a UTC timestamp and the other columns to the compact dtypes in schema
+    '''
+    return schema.apply_schema(df)
+
+def cleaned_frame(table):
+    '''
+    Converts a cleaned Arrow table to a DF with the schema dtypes, returning entities as Python lists
+    '''
+    if 'entities' not in table.column_names:
+        return apply_cleaned_dtypes(table.to_pandas(types_mapper = schema.arrow_types_mapper()))
+
+    #Converting the list column straight to Python lists skips the numpy array step in to_pandas
+    position = table.column_names.index('entities')
+    entities = table.column('entities').to_pylist()
+    df = table.drop_columns(['entities']).to_pandas(types_mapper = schema.arrow_types_mapper())
+    df.insert(position, 'entities', [e if e is not None else [] for e in entities])
+    return apply_cleaned_dtypes(df)
+
+def _prepare_cleaned(df):
+    '''
+    Applies the cleaned dtypes and returns the frame with entities parsed back into lists
+    '''
+    df = apply_cleaned_dtypes(df.copy())
+    if 'entities' not in df.columns:
+        df['entities'] = [[] for _ in range(len(df))]
+    df['entities'] = [safe_parse_entities(x) for x in df['entities']]
+    return df
+
+def cleaned_table(df):
+    '''
+    Converts cleaned headlines to an Arrow table with entities as a list of strings
+    '''
+    df = _prepare_cleaned(df)
+
+    #Builds the entities column directly as a list of strings so Arrow doesn't have to guess the type
+    columns = list(df.columns)
+    table = pa.Table.from_pandas(df.drop(columns = ['entities']), preserve_index = False)
+    table = table.append_column('entities', pa.array(df['entities'].tolist(), type = pa.list_(pa.string())))
+    return table.select(columns)
+
+def _write_frame(df, parquet_path, csv_path):
+    '''
+    Writes cleaned headlines to 'parquet_path', or to 'csv_path' if pyarrow isn't installed.
+    The file is written under a temporary name first, so a crash never leaves half a file behind.
+    Returns the path that was written
+    '''
+    if pa is None:
+        path = csv_path
+        _prepare_cleaned(df).to_csv(path + '.tmp', index = False)
+    else:
+        path = parquet_path
+        pq.write_table(cleaned_table(df), path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+def write_cleaned(df, country_code):
+    '''
+    Writes cleaned headlines to the cache as Parquet, keeping entities as a list column,
+    publishedAt as a timestamp and the label columns as categoricals.
+    Falls back to CSV if pyarrow isn't installed. Returns the path that was written
+    '''
+    return _write_frame(df, cleaned_parquet_path(country_code), cleaned_csv_path(country_code))
+
+def read_cleaned_parquet(path):
+    '''
+    Reads a cleaned Parquet file, returning entities as Python lists
+    '''
+    return cleaned_frame(pq.read_table(path))
+
+def read_cleaned_csv(path):
+    '''
+    Reads a cleaned CSV file, parsing entities with literal_eval and applying the same dtypes as Parquet
+    '''
+    df = pd.read_csv(path)
+    if 'entities' in df.columns:
+        df['entities'] = df['entities'].apply(safe_parse_entities)
+    else:
+        df['entities'] = [[] for _ in range(len(df))]
+    return apply_cleaned_dtypes(df)
+
+def load_cleaned(country_code):
+    '''
+    Loads the cleaned headlines for a country, reading Parquet when it exists and
+    falling back to an older CSV cache. Returns None if neither exists
+    '''
+    path = cleaned_file_path(country_code)
+    if path is None:
+        return None
+    if path.endswith('.parquet'):
+        return read_cleaned_parquet(path)
+    return read_cleaned_csv(path)
+
+def checkpoint_dir(country_code):
+    '''
+    Returns the folder holding the chunk checkpoints of an unfinished chunked transform
+    '''
+    return os.path.join(CACHE_DIR, 'checkpoints', country_code.lower())
+
+def _checkpoint_paths(country_code, index):
+    '''
+    Returns the (Parquet, CSV) paths of chunk number 'index'
+    '''
+    name = os.path.join(checkpoint_dir(country_code), f'chunk_{index:05d}')
+    return name + '.parquet', name + '.csv'
+
+def read_checkpoint_state(country_code):
+    '''
+    Returns the saved state of a chunked transform (EX: which raw file and chunk size it was started with
+    and the row counts of every finished chunk), or None if there isn't one
+    '''
+    path = os.path.join(checkpoint_dir(country_code), 'state.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_checkpoint_state(country_code, state):
+    '''
+    Saves the state of a chunked transform next to its checkpoints
+    '''
+    path = os.path.join(checkpoint_dir(country_code), 'state.json')
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent = 2)
+    os.replace(path + '.tmp', path)
+
+def write_checkpoint(df, country_code, index):
+    '''
+    Writes a finished chunk of cleaned headlines. Returns the path that was written
+    '''
+    os.makedirs(checkpoint_dir(country_code), exist_ok = True)
+    return _write_frame(df, *_checkpoint_paths(country_code, index))
+
+def checkpoint_files(country_code):
+    '''
+    Returns the paths of the finished chunks in chunk order
+    '''
+    directory = checkpoint_dir(country_code)
+    if not os.path.exists(directory):
+        return []
+    extension = '.csv' if pq is None else '.parquet'
+    return [
+        os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+        if filename.startswith('chunk_') and filename.endswith(extension)
+    ]
+
+def clear_checkpoints(country_code):
+    '''
+    Deletes the checkpoints of a chunked transform
+    '''
+    shutil.rmtree(checkpoint_dir(country_code), ignore_errors = True)
+
+def _read_file_urls(path):
+    '''
+    Returns the set of urls in a cleaned Parquet or CSV file, reading only the url column
+    '''
+    if path.endswith('.parquet'):
+        return set(pq.read_table(path, columns = ['url']).column('url').to_pylist())
+    return set(pd.read_csv(path, usecols = ['url'])['url'])
+
+def _conform_table(table, schema):
+    '''
+    Casts a table to 'schema', adding any column it doesn't have as nulls
+    '''
+    for field in schema:
+        if field.name not in table.column_names:
+            table = table.append_column(field.name, pa.nulls(len(table), field.type))
+    return table.select(schema.names).cast(schema)
+
+def combine_checkpoints(country_code, keep_existing = False, rows_per_batch = 10000):
+    '''
+    Builds the cleaned file for a country from its finished chunks, one batch of rows at a time,
+    so the whole data set is never held in memory at once. With 'keep_existing' set, rows of the
+    current cleaned file whose url isn't in any chunk are kept ahead of the chunk rows.
+    Returns the path that was written
+    '''
+    chunks = checkpoint_files(country_code)
+    existing = cleaned_file_path(country_code) if keep_existing else None
+    replaced = set()
+    if existing is not None:
+        for path in chunks:
+            replaced |= _read_file_urls(path)
+
+    if pq is None:
+        path = cleaned_csv_path(country_code)
+        columns = None
+        sources = ([existing] if existing is not None else []) + chunks
+        with open(path + '.tmp', 'w', newline = '') as f:
+            for source in sources:
+                for batch in pd.read_csv(source, chunksize = rows_per_batch):
+                    if source == existing:
+                        batch = batch[~batch['url'].isin(replaced)]
+                    batch.reindex(columns = columns).to_csv(f, header = columns is None, index = False)
+                    columns = list(batch.columns) if columns is None else columns
+        os.replace(path + '.tmp', path)
+        return path
+
+    #An older CSV cache is converted on the way through so it can be written with the chunks
+    sources = [(pq.ParquetFile(p), False) for p in chunks]
+    if existing is not None and existing.endswith('.csv'):
+        sources.insert(0, (cleaned_table(read_cleaned_csv(existing)), True))
+    elif existing is not None:
+        sources.insert(0, (pq.ParquetFile(existing), True))
+
+    #Chunks with no rows left (EX: every article was already enriched) have no useful column types
+    sources = [(s, is_existing) for s, is_existing in sources if (s.num_rows if isinstance(s, pa.Table) else s.metadata.num_rows) > 0]
+    if not sources:
+        return write_cleaned(pd.DataFrame(), country_code)
+
+    #Chunks can disagree on column types (EX: a column that is empty in one chunk), so they are cast to one schema
+    schemas = [s.schema if isinstance(s, pa.Table) else s.schema_arrow for s, _ in sources]
+    try:
+        unified = pa.unify_schemas(schemas, promote_options = 'permissive')
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        #A cleaned file written before the ordered date columns (see schema) is converted on the way through
+        sources = [
+            (cleaned_table(read_cleaned_parquet(existing)), True) if is_existing and not isinstance(s, pa.Table) else (s, is_existing)
+            for s, is_existing in sources
+        ]
+        schemas = [s.schema if isinstance(s, pa.Table) else s.schema_arrow for s, _ in sources]
+        unified = pa.unify_schemas(schemas, promote_options = 'permissive')
+    replaced = pa.array(list(replaced), pa.string())
+
+    path = cleaned_parquet_path(country_code)
+    with pq.ParquetWriter(path + '.tmp', unified) as writer:
+        for source, is_existing in sources:
+            batches = source.to_batches(rows_per_batch) if isinstance(source, pa.Table) else source.iter_batches(rows_per_batch)
+            for batch in batches:
+                table = pa.Table.from_batches([batch])
+                if is_existing:
+                    #Arrow-backed string columns (see schema) can be written as large_string
+                    urls = table.column('url')
+                    table = table.filter(pc.invert(pc.is_in(urls, replaced.cast(urls.type))))
+                writer.write_table(_conform_table(table, unified))
+    os.replace(path + '.tmp', path)
+    return path
@@ -0,0 +1,172 @@
+'''
+Learns which topic the GenAI endpoint gives each entity from the (entities, topic) pairs already in
+the cleaned headlines, so articles whose entities clearly point to one topic don't need a GenAI call.
+
+Every entity votes for the topics it has been seen with, in proportion to how often it was seen with
+each, and entities seen more often get a bigger say. The topic with the most votes is only used if it
+won a clear share of the votes, the entities were seen enough times between them, and most of the
+article's entities are known. Every new GenAI answer is fed back in with learn().
+
+Only GenAI answers are learned from: rows whose topic_source says the topic came from the model itself
+or from the local keyword rules are skipped, and near-duplicate articles (which share one answer) count once.
+Rows without a topic_source (EX: cleaned files written before it was stored, when every topic came from
+GenAI) count as GenAI answers.
+'''
+import math
+import threading
+from collections import Counter
+
+try:
+    from . import storage
+except ImportError:
+    import storage
+
+#Share of the votes the winning topic needs before it is used instead of asking GenAI
+MIN_CONFIDENCE = 0.7
+
+#Times the article's entities must have been seen with a topic between them
+MIN_SUPPORT = 3
+
+#Where an article's topic came from (the topic_source column): a new GenAI answer, a GenAI answer stored
+#in the enrichment cache, the topic model, or the local keyword rules
+TOPIC_SOURCES = ('genai', 'cache', 'model', 'local')
+
+#The sources the model is trained on, so it never learns from its own guesses or from the keyword rules
+TRAINING_SOURCES = ('genai', 'cache')
+
+def entity_keys(entities):
+    '''
+    Returns the distinct entities of a list, casefolded and stripped, ignoring empty ones
+    '''
+    return {str(e).strip().casefold() for e in entities or [] if e and str(e).strip()}
+
+class TopicModel:
+    '''
+    Weighted entity-topic voting. Safe to share between threads
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entity_topics = {}
+        self.spellings = {}
+        self.pairs = 0
+
+    def learn(self, entities, topic):
+        '''
+        Adds one article's (entities, topic) pair. 'Unknown' and empty topics are ignored
+        '''
+        topic = str(topic).strip() if topic is not None else ''
+        keys = entity_keys(entities)
+        if not topic or topic == 'Unknown' or not keys:
+            return
+
+        #Topics are counted without case, and answered with the spelling they were first seen with
+        topic_key = topic.casefold()
+        with self._lock:
+            self.spellings.setdefault(topic_key, topic)
+            for key in keys:
+                self.entity_topics.setdefault(key, Counter())[topic_key] += 1
+            self.pairs += 1
+
+    def learn_frame(self, df):
+        '''
+        Adds the (entities, topic) pairs of a cleaned DF at once: only rows whose topic came from GenAI
+        (including rows without a topic_source), and one row per near-duplicate cluster
+        '''
+        if df is None or df.empty or not {'entities', 'topic'} <= set(df.columns):
+            return
+        pairs = df
+        if 'topic_source' in pairs.columns:
+            pairs = pairs[pairs['topic_source'].isna() | pairs['topic_source'].isin(TRAINING_SOURCES)]
+        if 'cluster_id' in pairs.columns:
+            pairs = pairs[pairs['cluster_id'].isna() | ~pairs['cluster_id'].duplicated()]
+        pairs = pairs[['entities', 'topic']].dropna(subset = ['topic'])
+        pairs = pairs[pairs['topic'].astype(str).str.strip().ne('') & pairs['topic'].ne('Unknown')]
+        exploded = pairs.explode('entities').dropna(subset = ['entities'])
+        exploded['entities'] = exploded['entities'].astype(str).str.strip().str.casefold()
+        exploded['topic'] = exploded['topic'].astype(str).str.strip()
+        exploded = exploded[exploded['entities'] != ''].rename_axis('row').reset_index().drop_duplicates(['row', 'entities'])
+        exploded['topic_key'] = exploded['topic'].str.casefold()
+
+        counts = exploded.groupby(['entities', 'topic_key']).size()
+        with self._lock:
+            for topic_key, topic in exploded.drop_duplicates('topic_key')[['topic_key', 'topic']].itertuples(index = False):
+                self.spellings.setdefault(topic_key, topic)
+            for (key, topic_key), count in counts.items():
+                self.entity_topics.setdefault(key, Counter())[topic_key] += int(count)
+            self.pairs += exploded['row'].nunique()
+
+    def predict(self, entities):
+        '''
+        Returns (topic, confidence, support) for a list of entities, or (None, 0.0, 0) if none of them is known.
+        The confidence is the winning topic's share of the votes times the share of the entities that are known
+        '''
+        keys = entity_keys(entities)
+        votes = Counter()
+        support = 0
+        known = 0
+        with self._lock:
+            for key in keys:
+                counts = self.entity_topics.get(key)
+                if not counts:
+                    continue
+                known += 1
+                total = sum(counts.values())
+                support += total
+
+                #An entity seen more often is trusted more, without letting very common ones drown out the rest
+                weight = math.log1p(total)
+                for topic_key, count in counts.items():
+                    votes[topic_key] += weight * count / total
+
+            if not votes:
+                return None, 0.0, 0
+            topic_key, best = votes.most_common(1)[0]
+            confidence = best / sum(votes.values()) * known / len(keys)
+            return self.spellings[topic_key], confidence, support
+
+    def answer(self, entities, min_confidence = MIN_CONFIDENCE, min_support = MIN_SUPPORT):
+        '''
+        Returns the predicted topic if the model is sure enough about it, otherwise None
+        '''
+        topic, confidence, support = self.predict(entities)
+        if topic is None or confidence < min_confidence or support < min_support:
+            return None
+        return topic
+
+def train_from_cleaned(model = None, countries = None):
+    '''
+    Trains a model (a new one by default) from the cleaned headlines of every cached country, or of 'countries'.
+    Returns the model
+    '''
+    model = model or TopicModel()
+    for country_code in countries if countries is not None else storage.cached_countries():
+        model.learn_frame(storage.load_cleaned(country_code))
+    return model
+
+_default_model = None
+_default_lock = threading.Lock()
+
+def get_default_model():
+    '''
+    Returns the shared model, trained from the cleaned headlines the first time it is needed
+    '''
+    global _default_model
+    with _default_lock:
+        if _default_model is None:
+            _default_model = train_from_cleaned()
+    return _default_model
+
+def hit_rate(counts):
+    '''
+    Turns a run's counts (see metrics) into how often the topic model answered instead of GenAI:
+    its hits, misses, hit rate (None if it was never asked) and the GenAI calls avoided
+    '''
+    hits = counts.get('topic_model_hits', 0)
+    misses = counts.get('topic_model_misses', 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        'genai_calls_avoided': hits
+    }
@@ -1,11 +1,71 @@
 import pandas as pd
-import requests
+import numpy as np
 import os
+import contextlib
+import hashlib
+import itertools
 import re
 from datetime import datetime
 
+try:
+    from .enrich import (
+        enrich_articles, make_batches, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND,
+        DEFAULT_BATCH_SIZE, DEFAULT_MAX_BATCH_BYTES
+    )
+except ImportError:
+    from enrich import (
+        enrich_articles, make_batches, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND,
+        DEFAULT_BATCH_SIZE, DEFAULT_MAX_BATCH_BYTES
+    )
+
+try:
+    from .enrichment_cache import get_default_cache
+except ImportError:
+    from enrichment_cache import get_default_cache
+
+try:
+    from . import dedupe, history, local_enrich, schema, storage, topic_model
+    from .schema import TIME_OF_DAY_BUCKETS
+except ImportError:
+    import dedupe
+    import history
+    import local_enrich
+    import schema
+    import storage
+    import topic_model
+    from schema import TIME_OF_DAY_BUCKETS
+
+try:
+    from . import api_budget, http_client, metrics
+    from .api_budget import BudgetExceededError
+    from .http_client import QuotaExceededError
+except ImportError:
+    import api_budget
+    import http_client
+    import metrics
+    from api_budget import BudgetExceededError
+    from http_client import QuotaExceededError
+
 APIKEY = 'ADD YOUR API KEY'
 
+#iSchool API endpoints used for enrichment
+SENTIMENT_URL = 'https://cent.ischool-iot.net/api/azure/sentiment'
+ENTITY_URL = 'https://cent.ischool-iot.net/api/azure/entityrecognition'
+GENAI_URL = 'https://cent.ischool-iot.net/api/genai/generate'
+
+#Entities that are only a number, decimal or percentage (EX: 1,500 or 15.5 or 50%)
+NUMERIC_ENTITY_PATTERN = r'[\d,]+(\.\d+)?%?'
+
+#Where sentiment, entities and topics come from:
+#   -'remote' asks the iSchool APIs for everything
+#   -'local' works everything out on this machine (see local_enrich), with no API calls
+#   -'local_first' works everything out locally and only asks the APIs about the rows the local rules aren't sure about
+ENRICHMENT_BACKENDS = ('remote', 'local', 'local_first')
+
+#The local backend has no request size limits, so it scores this many articles at once
+LOCAL_BATCH_SIZE = 1000
+LOCAL_MAX_BATCH_BYTES = 10000000
+
 ##HELPER FUNCTIONS
 
 def clean_text(text):
@@ -29,6 +89,28 @@ def clean_text(text):
     #Strips and returns text
     return text.strip()
 
+def _replace_regex(texts, pattern, replacement):
+    '''
+    Runs one regex replacement over a column of strings in Arrow's C++ kernels, which (unlike the .str
+    methods of pandas 2) also handle group references. Needs pyarrow. Returns Arrow-backed strings
+    '''
+    values = storage.pa.array(texts.astype(schema.STRING_DTYPE))
+    return pd.Series(storage.pc.replace_substring_regex(values, pattern, replacement), index = texts.index, dtype = schema.STRING_DTYPE)
+
+def clean_text_series(texts):
+    '''
+    Vectorized clean_text for a whole column: collapses whitespace (including newlines)
+    into single spaces and strips the ends. Missing values become ""
+    '''
+
+    #Without pyarrow the .str methods loop in Python anyway, and str.split is quicker than a regex there
+    if storage.pc is None:
+        return pd.Series([' '.join(text.split()) if isinstance(text, str) else '' for text in texts.tolist()], index = texts.index)
+
+    #Only matches whitespace that actually needs replacing (runs of 2+, or a single newline/tab),
+    #so text that is already single spaced passes through without any replacements
+    return _replace_regex(texts.fillna(''), r'\s{2,}|[^\S ]', ' ').str.strip()
+
 def create_short_title(title, num_words = 10):
     '''
     Returns the first 'num_words' from a title string
@@ -45,31 +127,176 @@ def create_short_title(title, num_words = 10):
     shortened_title = ' '.join(words[:num_words])
     return shortened_title
 
-def get_sentiment(text):
+def create_short_title_series(titles, num_words = 10):
     '''
-    Sends text to the sentiment analysis API and returns the sentiment
+    Vectorized create_short_title for titles already cleaned by clean_text_series:
+    keeps the first 'num_words' words of every title
     '''
+    if num_words <= 0:
+        return pd.Series('', index = titles.index)
+    if storage.pc is None:
+        return pd.Series([' '.join(title.split(maxsplit = num_words)[:num_words]) for title in titles.tolist()], index = titles.index)
 
-    #Ensures text is not empty to avoid errors
-    if not text:
+    #Cleaned titles are single spaced, so everything after word 'num_words' can be cut off with one regex
+    return _replace_regex(titles, rf'^((?:\S+ ){{{num_words - 1}}}\S+) .*$', r'\1')
+
+#Name the enrichment cache keeps what was learned about each Azure endpoint's batching under, keyed by url
+BATCHING_CACHE_ENDPOINT = 'endpoint_batching'
+
+def endpoint_batching(url):
+    '''
+    Returns True if the Azure endpoint at 'url' has answered a batch with one document per text,
+    False if it has answered a batch with a single document (it only reads one 'text' field per request),
+    or None if neither has been seen yet. Kept in the enrichment cache, so later runs know it too
+    '''
+    return get_default_cache().get(BATCHING_CACHE_ENDPOINT, url)
+
+def _learn_batching(url, batching):
+    '''
+    Stores whether the endpoint at 'url' batches, if it changed
+    '''
+    if endpoint_batching(url) != batching:
+        get_default_cache().set(BATCHING_CACHE_ENDPOINT, url, batching)
+
+def _documents_by_position(documents, count):
+    '''
+    Matches the documents returned by an Azure endpoint to the texts that were sent.
+    Documents are matched by their id (the position of the text in the request).
+    Returns the documents in the order of the texts, or None if there isn't exactly one document
+    with a valid id per text (EX: the endpoint only read one of the 'text' fields)
+    '''
+    if len(documents) != count:
         return None
-    
-    #Specifying API URL, headers and data 
-    url = 'https://cent.ischool-iot.net/api/azure/sentiment'
+
+    #A single text can only be answered by the single document that came back
+    if count == 1:
+        return list(documents)
+
+    by_id = {}
+    for doc in documents:
+        doc_id = str(doc.get('id', ''))
+        if doc_id.isdigit() and int(doc_id) < count:
+            by_id[int(doc_id)] = doc
+    if len(by_id) != count:
+        return None
+    return [by_id[position] for position in range(count)]
+
+def _request_documents(url, label, texts):
+    '''
+    Sends texts to an Azure endpoint in one request, each as its own 'text' field.
+    Returns one document per text in the same order, or None if the request failed
+    or its documents couldn't be matched to the texts
+    '''
     headers = {'X-API-KEY': APIKEY}
-    data = {'text': text}
+    data = [('text', text) for text in texts]
 
     #Wraps API call in try accept statement to avoid crashes
     try:
-        response = requests.post(url, headers= headers, data = data, timeout= 120) #Makes call to the API
-        if response.status_code == 200: #Only returns result if success code is returned
-            result = response.json()
-            return result['results']['documents'][0]['sentiment']
-        else: #If API call is unsuccesful print the reasons
-            print(f"Sentiment API error {response.status_code} - {response.text}")
+        response = http_client.post(url, headers = headers, data = data) #Makes call to the API
+        if response.status_code != 200: #If API call is unsuccesful print the reasons
+            print(f'{label} API error {response.status_code} - {response.text}')
+            return None
+        documents = response.json()['results']['documents']
+    except QuotaExceededError:
+        raise #Out of quota, so there is no point sending the remaining batches
     except Exception as e:
-        print(f"Sentiment API exception: {e}") #If there is an exception in the API call returns reason instead of crashing
+        print(f'{label} API exception: {e}') #If there is an exception in the API call returns reason instead of crashing
         return None
+
+    matched = _documents_by_position(documents, len(texts))
+    if matched is None:
+        print(f'{label} API returned {len(documents)} documents that don\'t match the {len(texts)} texts sent')
+
+    #What a batch came back with tells whether the endpoint reads more than one text per request
+    if len(texts) > 1 and matched is not None:
+        _learn_batching(url, True)
+    elif len(texts) > 1 and len(documents) == 1:
+        _learn_batching(url, False)
+    return matched
+
+def _analyze_documents(endpoint, url, label, texts, parse, batch_size, max_batch_bytes):
+    '''
+    Sends texts to an Azure endpoint several documents per request and parses each returned document.
+    Texts with a stored result in the enrichment cache are not sent again.
+    A batch whose documents can't be matched to its texts by id is sent again one text per request,
+    so a result is never given to (or cached for) the wrong text. Once the endpoint is known to read
+    only one text per request (see endpoint_batching), texts are sent to it one at a time from the start.
+    Returns a list of results in the same order as 'texts' (None where no result came back)
+    '''
+    results = [None] * len(texts)
+
+    #Looks up every non-empty text in the enrichment cache first
+    cache = get_default_cache()
+    missing = []
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        cached = cache_lookup(cache, endpoint, text)
+        if cached is not None:
+            results[i] = cached
+        else:
+            missing.append(i)
+
+    missing_texts = [texts[i] for i in missing]
+
+    for batch in make_batches(missing_texts, batch_size, max_batch_bytes):
+        batch_texts = [missing_texts[j] for j in batch]
+        single = len(batch_texts) > 1 and endpoint_batching(url) is False
+        documents = None if single else _request_documents(url, label, batch_texts)
+        if documents is None and len(batch_texts) > 1:
+            if not single:
+                metrics.count(f'{endpoint}_batches_unmatched')
+            documents = [(_request_documents(url, label, [text]) or [None])[0] for text in batch_texts]
+        if documents is None:
+            continue
+
+        #Maps every document back to its row and stores it for next time
+        for position, doc in enumerate(documents):
+            if doc is None:
+                continue
+            i = missing[batch[position]]
+            result = parse(doc)
+            results[i] = result
+            if result:
+                cache.set(endpoint, texts[i], result)
+
+    return results
+
+def get_sentiment_batch(texts, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES):
+    '''
+    Sends a list of texts to the sentiment analysis API, up to 'batch_size' per request,
+    and returns a list of sentiments in the same order (None for empty texts or failed requests)
+    '''
+    return _analyze_documents(
+        'sentiment', SENTIMENT_URL, 'Sentiment', list(texts),
+        lambda doc: doc['sentiment'],
+        batch_size, max_batch_bytes
+    )
+
+def get_entities_batch(texts, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES):
+    '''
+    Sends a list of texts to the entity recognition API, up to 'batch_size' per request,
+    and returns a list of entity lists in the same order
+    '''
+    texts = list(texts)
+    results = _analyze_documents(
+        'entities', ENTITY_URL, 'Entity', texts,
+        lambda doc: [entity['text'] for entity in doc['entities']],
+        batch_size, max_batch_bytes
+    )
+
+    #Empty texts stay None, failed requests become an empty list
+    return [result if result is not None or not text else [] for text, result in zip(texts, results)]
+
+def get_sentiment(text):
+    '''
+    Sends text to the sentiment analysis API and returns the sentiment
+    '''
+
+    #Ensures text is not empty to avoid errors
+    if not text:
+        return None
+    return get_sentiment_batch([text])[0]
     
 def get_entities(text):
     '''
@@ -79,45 +306,43 @@ def get_entities(text):
     #Ensures text is not empty to avoid crashes
     if not text:
         return None
-    
-    #Specifies URL, headers, and data for call to API
-    url = 'https://cent.ischool-iot.net/api/azure/entityrecognition'
-    headers = {'X-API-KEY': APIKEY}
-    data = {'text': text}
-
-    #Wraps API call in try statement to avoid crashing
-    try:
-        #Calls to API
-        response = requests.post(url, headers = headers, data = data, timeout= 120)
-        if response.status_code == 200: #Only runs if success code is returned
-            result = response.json()
-            documents = result['results']['documents'] #Stores a list of documents
-            if documents: #Only runs if documents exist
-                entity_list = []
-                for entity in documents[0]['entities']: #Iteratres over each document and extracts the entity
-                    entity_list.append(entity['text'])
-                return entity_list
-            else:
-                return []
-        else: #If API call is unsuccesful print the reasons
-            print(f'Entitiy API error {response.status_code} - {response.text}')
-            return []
-    except Exception as e:
-        print(f'Entity API exception: {e}') #If there is an exception in the API call returns reason instead of crashing
-        return []
+    return get_entities_batch([text])[0]
     
 def get_topic_from_entities(entities):
     '''
     Sends a list of entities to the GenAI APi to generate 1-2 word topic label
     '''
+    return answer_topic(entities)[0]
+
+def answer_topic(entities):
+    '''
+    get_topic_from_entities that also says where the topic came from (see topic_model.TOPIC_SOURCES):
+    'cache' for a stored GenAI answer, 'model' for the topic model and 'genai' for a new GenAI answer.
+    Returns (topic, source), with None as the source when no topic was found
+    '''
 
     #Ensures entities is not empty to avoid crashes
     if not entities:
-        return "Unknown"
+        return "Unknown", None
     
     #Joins all the elements of the entities list together into one string
     entities_text = ', '.join(entities)
 
+    #Returns the stored topic if the same set of entities was already labeled
+    cache = get_default_cache()
+    entity_key = canonical_entity_key(entities)
+    cached = cache_lookup(cache, 'topic', entity_key)
+    if cached is not None:
+        return cached, 'cache'
+
+    #Answers from the topic model learned from earlier runs when it is sure, without a GenAI call
+    model = topic_model.get_default_model()
+    learned = model.answer(entities)
+    if learned is not None:
+        metrics.count('topic_model_hits')
+        return learned, 'model'
+    metrics.count('topic_model_misses')
+
     #Defines what the GenAI should do
     query = (
     f"Given these entities: {entities_text}."
@@ -128,7 +353,6 @@ def get_topic_from_entities(entities):
     )
 
     #Specifying URL, headers, and data 
-    url = 'https://cent.ischool-iot.net/api/genai/generate'
     headers = {'X-API-KEY': APIKEY}
     data = {
         'query': query,
@@ -138,38 +362,129 @@ def get_topic_from_entities(entities):
     #Wraps API call in try except statement to avoid crashes
     try:
         #Calls to API
-        response = requests.post(url, headers = headers, data = data, timeout= 120)
+        response = http_client.post(GENAI_URL, headers = headers, data = data)
         if response.status_code == 200: #Only runs of API status code is succesfukl
             topic = response.json().strip() #Strips response
-            return topic if topic else "Unknown" #Return topci if it exists otherwise returns unknown
+            if topic:
+                cache.set('topic', entity_key, topic)
+                model.learn(entities, topic) #Feeds the new answer back into the topic model
+                return topic, 'genai'
+            return "Unknown", None #Otherwise returns unknown
         else: #If API call is unsuccesful print the reasons
             print(f'GenAI API error {response.status_code} - {response.text}')
-            return 'Unknown'
+            return 'Unknown', None
+    except QuotaExceededError:
+        raise #Out of quota, so the caller needs to stop instead of labeling every article 'Unknown'
     except Exception as e:
         print(f'GenAI API exception: {e}') #If there is an exception in the API call returns reason instead of crashing
-        return "Unknown"
+        return "Unknown", None
     
+def local_first_sentiment_batch(texts, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES):
+    '''
+    Scores texts with the local lexicon and sends only the ones it isn't sure about to the sentiment API.
+    Returns a list of sentiments in the same order, keeping the local label where the API gave no answer
+    '''
+    texts = list(texts)
+    scored = local_enrich.score_sentiment(texts)
+    sentiments = scored['sentiment'].tolist()
+    unsure = [i for i, (text, confidence) in enumerate(zip(texts, scored['confidence']))
+              if text and confidence < local_enrich.MIN_SENTIMENT_CONFIDENCE]
+    metrics.count('sentiment_sent_remote', len(unsure))
+
+    if unsure:
+        remote = get_sentiment_batch([texts[i] for i in unsure], batch_size, max_batch_bytes)
+        for i, sentiment in zip(unsure, remote):
+            if sentiment is not None:
+                sentiments[i] = sentiment
+    return sentiments
+
+def local_first_entities_batch(texts, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES):
+    '''
+    Finds entities with the local rules and sends the texts they aren't confident about (no multi-word
+    name or acronym found, see local_enrich.score_entities) to the entity API.
+    Returns a list of entity lists in the same order, keeping the local entities where the API found none
+    '''
+    texts = list(texts)
+    scored = local_enrich.score_entities(texts)
+    entities = scored['entities'].tolist()
+    unsure = [i for i, (text, confident) in enumerate(zip(texts, scored['confident'])) if text and not confident]
+    metrics.count('entities_sent_remote', len(unsure))
+
+    if unsure:
+        remote = get_entities_batch([texts[i] for i in unsure], batch_size, max_batch_bytes)
+        for i, found in zip(unsure, remote):
+            if found:
+                entities[i] = found
+    return entities
+
+def local_first_topic_from_entities(entities):
+    '''
+    Picks a topic from the entity keywords, asking the GenAI API only when no keyword matched
+    or the keywords point to more than one topic. Returns (topic, source) like answer_topic
+    '''
+    topic, confidence = local_enrich.score_topic(entities)
+    if topic != "Unknown" and confidence >= local_enrich.MIN_TOPIC_CONFIDENCE:
+        return topic, 'local'
+
+    metrics.count('topics_sent_remote')
+    remote, source = answer_topic(entities)
+    if remote != "Unknown":
+        return remote, source
+    return topic, 'local' if topic != "Unknown" else None
+
+def local_topic_from_entities(entities):
+    '''
+    Uses the topic model's answer when it is sure (see topic_model), and the entity keywords otherwise.
+    Returns (topic, source) like answer_topic
+    '''
+    learned = topic_model.get_default_model().answer(entities)
+    if learned is not None:
+        metrics.count('topic_model_hits')
+        return learned, 'model'
+    topic = local_enrich.get_topic_from_entities(entities)
+    return topic, 'local' if topic != "Unknown" else None
+
+def enrichment_functions(backend = 'remote', batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES):
+    '''
+    Returns the (sentiment, entities, topic) functions enrich_articles calls for one of ENRICHMENT_BACKENDS.
+    The topic function returns (topic, source) like answer_topic
+    '''
+    if backend == 'remote':
+        return (
+            lambda texts: get_sentiment_batch(texts, batch_size, max_batch_bytes),
+            lambda texts: get_entities_batch(texts, batch_size, max_batch_bytes),
+            answer_topic
+        )
+    if backend == 'local':
+        return local_enrich.get_sentiment_batch, local_enrich.get_entities_batch, local_topic_from_entities
+    if backend == 'local_first':
+        return (
+            lambda texts: local_first_sentiment_batch(texts, batch_size, max_batch_bytes),
+            lambda texts: local_first_entities_batch(texts, batch_size, max_batch_bytes),
+            local_first_topic_from_entities
+        )
+    raise ValueError(f"Unknown enrichment backend '{backend}', expected one of {', '.join(ENRICHMENT_BACKENDS)}")
+
 def categorize_time_of_day(hour):
     '''
     Categorizes hour of day into 3-hour time block
     '''
 
-    if 0 <= hour < 3:
-        return "12AM-3AM"
-    elif 3 <= hour < 6:
-        return "3AM-6AM"
-    elif 6 <= hour < 9:
-        return "6AM-9AM"
-    elif 9 <= hour < 12:
-        return "9AM-12PM"
-    elif 12 <= hour < 15:
-        return "12PM-3PM"
-    elif 15 <= hour < 18:
-        return "3PM-6PM"
-    elif 18 <= hour < 21:
-        return "6PM-9PM"
-    else:
-        return "9PM-12AM"
+    #Each block is 3 hours long, anything outside 0-23 falls in the last block
+    if 0 <= hour < 24:
+        return TIME_OF_DAY_BUCKETS[int(hour) // 3]
+    return TIME_OF_DAY_BUCKETS[-1]
+
+def categorize_time_of_day_series(hours):
+    '''
+    Vectorized categorize_time_of_day: buckets a column of hours into an ordered categorical
+    of 3-hour blocks using integer division. Missing hours stay missing
+    '''
+    codes = (hours // 3).fillna(-1).clip(upper = len(TIME_OF_DAY_BUCKETS) - 1).astype(int)
+    return pd.Series(
+        pd.Categorical.from_codes(codes, dtype = schema.ORDERED_COLUMNS['time_of_day_published']),
+        index = hours.index
+    )
 
 def remove_numeric_entities(entity_list):
     '''
@@ -179,65 +494,526 @@ def remove_numeric_entities(entity_list):
     #Removes normal numbers, decimals, and percentages from entity list
     if not entity_list:
         return []
-    return [e for e in entity_list if not re.fullmatch(r'[\d,]+(\.\d+)?%?', e)]
+    return [e for e in entity_list if not re.fullmatch(NUMERIC_ENTITY_PATTERN, e)]
 
-##MAIN TRANSFORMATION PIPELINE
+def remove_numeric_entities_series(entities):
+    '''
+    Vectorized remove_numeric_entities for a column of entity lists.
+    Explodes the lists, matches every entity at once, then regroups them by row
+    '''
+    count = len(entities)
+    exploded = entities.reset_index(drop = True).explode()
 
-def transform_articles(country_code):
+    #Keeps entities that are present and not purely numeric
+    is_numeric = exploded.astype(str).str.fullmatch(NUMERIC_ENTITY_PATTERN).fillna(False).astype(bool)
+    kept = exploded[exploded.notna() & ~is_numeric]
+
+    #Rows are still in order after explode, so the kept entities split back into rows by their counts
+    counts = np.bincount(kept.index.to_numpy(dtype = int), minlength = count)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    values = kept.tolist()
+    groups = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return pd.Series(groups, index = entities.index, dtype = object)
+
+def canonical_entity_key(entity_list):
     '''
-    Combines all helper functions into a final transormation pipeline to add all features to data
+    Returns a normalized key for an entity list: case-folded, deduplicated and sorted.
+    Lists that only differ in case, order or repeats get the same key
     '''
+    if not entity_list:
+        return ""
+    return ', '.join(sorted({e.strip().casefold() for e in entity_list if e and e.strip()}))
 
-    #Loading raw article data for specified country
-    filepath = os.path.join('cache', f'top_headlines_{country_code.lower()}.csv')
-    df = pd.read_csv(filepath)
+##MAIN TRANSFORMATION PIPELINE
+
+def clean_articles(df):
+    '''
+    Drops empty articles, cleans the text fields and adds the short title
+    '''
 
     #Filter out empty articles
-    df = df.dropna(subset= ['title', 'content'])
+    df = df.dropna(subset= ['title', 'content']).copy()
 
     #Applies clean text to all the text fields
     for field in ['title', 'description', 'content']:
-        df[field] = df[field].apply(clean_text)
+        df[field] = clean_text_series(df[field])
     
     #Creates short title for each article
-    df['short_title'] = df['title'].apply(create_short_title)
-    
-    #Gets sentiment for each article
-    df['sentiment'] = df['content'].apply(get_sentiment)
+    df['short_title'] = create_short_title_series(df['title'])
+    return df
 
-    #Gets entities of each article
-    df['entities'] = df['content'].apply(get_entities)
+def enrich_frame(df, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES,
+                 max_workers = DEFAULT_MAX_WORKERS, requests_per_second = DEFAULT_REQUESTS_PER_SECOND, limiter = None,
+                 progress = None, backend = 'remote'):
+    '''
+    Adds the sentiment, entities (with numeric values removed), topic and topic_source columns to cleaned articles.
+    Near-duplicate articles (see dedupe) are grouped first and only one representative of each group
+    is sent to the APIs, its results are copied to the rest of the group and every row gets the
+    'cluster_id' of its group.
+    Pass a shared 'limiter' to rate limit several runs together, and a 'progress' callback to hear
+    how many rows are finished (see enrich_articles). 'backend' is one of ENRICHMENT_BACKENDS.
+    Returns the enriched frame and the topic grouping stats from enrich_articles
+    '''
+    sentiment_fn, entity_fn, topic_fn = enrichment_functions(backend, batch_size, max_batch_bytes)
+
+    #The local backend makes no API calls, so it works on big batches with no rate limit
+    if backend == 'local':
+        batch_size, max_batch_bytes = LOCAL_BATCH_SIZE, LOCAL_MAX_BATCH_BYTES
+        requests_per_second, limiter = None, None
+
+    with metrics.stage('dedupe'):
+        labels, representatives = dedupe.find_near_duplicates(df)
+    duplicates = len(df) - len(representatives)
+    metrics.count('near_duplicates', duplicates)
+    if duplicates:
+        print(f"Near-duplicates: {duplicates} articles share their enrichment with another article")
+
+    #Progress is reported in rows, each representative standing in for its whole group
+    rows_progress = None
+    if progress is not None:
+        rows_progress = lambda done, total: progress(round(done * len(df) / total) if total else 0, len(df))
+
+    sentiments, entities, topics, enrich_stats = enrich_articles(
+        df['content'].iloc[representatives].tolist(),
+        metrics.timed('sentiment', sentiment_fn),
+        metrics.timed('entities', entity_fn),
+        metrics.timed('topic', topic_fn),
+        entity_filter = lambda entity_lists: remove_numeric_entities_series(pd.Series(entity_lists, dtype = object)).tolist(),
+        topic_key = canonical_entity_key,
+        batch_size = batch_size,
+        max_batch_bytes = max_batch_bytes,
+        max_workers = max_workers,
+        requests_per_second = requests_per_second,
+        limiter = limiter,
+        progress = rows_progress
+    )
+
+    #Maps every row to the position of its group's representative in the results
+    result_positions = pd.Series(np.arange(len(representatives)), index = labels[representatives]).loc[labels].to_numpy()
+    df['sentiment'] = [sentiments[i] for i in result_positions]
+    df['entities'] = pd.Series([entities[i] for i in result_positions], index = df.index, dtype = object)
 
-    #Removes numeric values from entities 
-    df['entities'] = df['entities'].apply(remove_numeric_entities)
+    #Rows without entities keep enrich_articles' plain 'Unknown' topic, which has no source
+    answers = [topic if isinstance(topic, tuple) else (topic, None) for topic in topics]
+    df['topic'] = [answers[i][0] for i in result_positions]
+    df['topic_source'] = pd.Series([answers[i][1] for i in result_positions], index = df.index, dtype = object)
+    df['cluster_id'] = dedupe.cluster_ids(df, labels)
+    return df, enrich_stats
 
-    #Gets topic of each article based on entities
-    df['topic'] = df['entities'].apply(get_topic_from_entities)
+def add_date_features(df):
+    '''
+    Parses publishedAt and adds the day of week, month and time of day columns as ordered categoricals (see schema)
+    '''
     
     #Parse publishedAt converting it to datetime, if there is an error a null value is put in place
     df['publishedAt'] = pd.to_datetime(df['publishedAt'], errors = 'coerce')
 
     #Gets time of day article was published
-    df['day_of_week_published'] = df['publishedAt'].dt.day_name()
+    df['day_of_week_published'] = schema.ordered(df['publishedAt'].dt.day_name(), 'day_of_week_published')
 
     #Gets month article was published
-    df['month_published'] = df['publishedAt'].dt.month_name()
+    df['month_published'] = schema.ordered(df['publishedAt'].dt.month_name(), 'month_published')
 
     #Categorizes time of publish into group of 3 hour block
-    df['time_of_day_published'] = df['publishedAt'].dt.hour.apply(categorize_time_of_day)
+    df['time_of_day_published'] = categorize_time_of_day_series(df['publishedAt'].dt.hour)
+    return df
 
-    # Drop rows with missing or uninformative data
-    df = df[
-    df['entities'].apply(lambda x: isinstance(x, list) and len(x) > 0) &
-    df['sentiment'].notna() & (df['sentiment'] != "Unknown") &
-    df['topic'].notna() & (df['topic'] != "Unknown")
-]
+def unenriched_reasons(df):
+    '''
+    Returns why each row would be dropped by drop_unenriched ('no_entities', 'no_sentiment' or
+    'unknown_topic', the first that applies), or None for rows that are kept
+    '''
+    reasons = pd.Series(None, index = df.index, dtype = object)
+    reasons[df['topic'].isna() | (df['topic'] == "Unknown")] = 'unknown_topic'
+    reasons[df['sentiment'].isna() | (df['sentiment'] == "Unknown")] = 'no_sentiment'
+    reasons[~(df['entities'].str.len().fillna(0) > 0)] = 'no_entities'
+    return reasons
+
+def drop_unenriched(df):
+    '''
+    Drops rows with missing or uninformative enrichment results.
+    The number of rows dropped for each reason is recorded on the current run
+    '''
+    reasons = unenriched_reasons(df)
+    for reason, count in reasons.value_counts().items():
+        metrics.record_dropped(reason, count)
+    return df[reasons.isna()]
+
+def priority_order(df):
+    '''
+    Returns the positions of the articles in the order they are worth enriching when the API budget is short:
+    newest first, and longer stories first among articles published at the same time
+    '''
+    keys = pd.DataFrame({
+        'published': pd.to_datetime(df['publishedAt'], errors = 'coerce', utc = True).to_numpy(),
+        'length': df['content'].fillna('').astype(str).str.len().to_numpy()
+    })
+    return keys.sort_values(['published', 'length'], ascending = False, na_position = 'last', kind = 'stable').index.to_numpy()
+
+def _fit_to_budget(df, batch_size, backend):
+    '''
+    Does the work of fit_to_budget against the iSchool calls no other work has reserved.
+    Returns the articles to enrich, how many were deferred and the calls to reserve for them, retries included
+    '''
+    available = api_budget.get_default_budget().available('ischool')
+    if available is None or df.empty or backend == 'local':
+        return df, 0, 0
+
+    texts = df['content'].tolist()
+    cache = get_default_cache()
+    cached = [s and e for s, e in zip(cache.contains('sentiment', texts), cache.contains('entities', texts))]
+
+    #Until an endpoint is known to batch, every batch may be sent again one text per request
+    batching = (endpoint_batching(SENTIMENT_URL), endpoint_batching(ENTITY_URL))
+    needed = api_budget.with_retry_headroom(api_budget.ischool_calls_needed(len(df), batch_size, len(df) - sum(cached), batching))
+    if needed <= available:
+        return df, 0, needed
+
+    #Takes each article in priority order if it still fits, so cheaper articles further down can fill the gaps
+    kept = []
+    uncached = 0
+    needed = 0
+    for position in priority_order(df):
+        extra = 0 if cached[position] else 1
+        calls = api_budget.with_retry_headroom(api_budget.ischool_calls_needed(len(kept) + 1, batch_size, uncached + extra, batching))
+        if calls <= available:
+            kept.append(position)
+            uncached += extra
+            needed = calls
+
+    return df.iloc[sorted(kept)], len(df) - len(kept), needed
+
+def fit_to_budget(df, batch_size = DEFAULT_BATCH_SIZE, backend = 'remote'):
+    '''
+    Picks the articles today's iSchool budget can pay for, going through them in priority_order.
+    Articles whose sentiment and entities are already cached only need a topic call, so they cost less.
+    Calls reserved by other work (EX: another country enriching at the same time) aren't counted as left,
+    and every plan keeps api_budget.RETRY_HEADROOM spare for retries. Sentiment and entity calls are
+    counted for how each endpoint is known to batch (see endpoint_batching), the worst case until it is known.
+    The 'local' backend makes no calls, so every article fits, and 'local_first' is counted as if every row went to the APIs.
+    Returns the articles to enrich (in their original order) and how many were deferred
+    '''
+    df, deferred, _ = _fit_to_budget(df, batch_size, backend)
+    return df, deferred
+
+@contextlib.contextmanager
+def reserve_budget(df, batch_size = DEFAULT_BATCH_SIZE, backend = 'remote'):
+    '''
+    Fits 'df' to the iSchool budget like fit_to_budget and reserves the calls it needs, so countries
+    enriching at the same time can't plan with the same calls. Yields (articles, deferred); the iSchool
+    requests made inside are drawn from the reservation, and the calls they didn't use are released at the end
+    '''
+    budget = api_budget.get_default_budget()
+    while True:
+        fitted, deferred, calls = _fit_to_budget(df, batch_size, backend)
+        try:
+            reservation = budget.reserve('ischool', calls)
+            break
+        except BudgetExceededError:
+            #Other work reserved calls between planning and reserving, so plans again with what's left
+            continue
+    with reservation:
+        yield fitted, deferred
+
+def article_fingerprint(df):
+    '''
+    Returns a hash of the cleaned title, description and content of each article.
+    Used to tell whether an article with a known url has changed since it was enriched
+    '''
+    text = (
+        df['title'].fillna('').astype(str) + '\n' +
+        df['description'].fillna('').astype(str) + '\n' +
+        df['content'].fillna('').astype(str)
+    )
+    return pd.util.hash_pandas_object(text, index = False)
+
+def fingerprint_index(existing):
+    '''
+    Returns the fingerprint of every already enriched article, indexed by url
+    '''
+    known = pd.Series(article_fingerprint(existing).values, index = existing['url'].values)
+    return known[~known.index.duplicated(keep = 'last')]
+
+def split_incremental(df, existing = None, known = None):
+    '''
+    Compares cleaned raw articles with the already enriched ones using url as the key.
+    Pass either the enriched 'existing' frame or its fingerprint_index as 'known'.
+    Returns (new rows, changed rows, number of unchanged rows)
+    '''
+    if known is None:
+        known = fingerprint_index(existing)
+
+    fingerprints = article_fingerprint(df)
+    is_known = df['url'].isin(known.index)
+    previous = df['url'].map(known)
+    is_changed = is_known & (previous != fingerprints)
+
+    return df[~is_known], df[is_changed], int((is_known & ~is_changed).sum())
+
+def raw_file_path(country_code):
+    '''
+    Returns the path of the raw article file for a country
+    '''
+    return os.path.join('cache', f'top_headlines_{country_code.lower()}.csv')
+
+def raw_file_signature(filepath, rows_per_batch = 10000):
+    '''
+    Returns the number of articles in the raw file and a hash of their urls and contents, used to tell
+    whether saved checkpoints were made from the same articles. Fetching rewrites the file even when the
+    articles are the same, so its size and modification time can't be used
+    '''
+    digest = hashlib.sha256()
+    rows = 0
+    for batch in pd.read_csv(filepath, usecols = lambda c: c in ('url', 'content'), chunksize = rows_per_batch):
+        batch = batch.reindex(columns = ['url', 'content']).fillna('').astype(str)
+        digest.update(pd.util.hash_pandas_object(batch, index = False).to_numpy().tobytes())
+        rows += len(batch)
+    return {'rows': rows, 'hash': digest.hexdigest()}
+
+def checkpoint_run(filepath, chunk_size, incremental = False, backend = 'remote'):
+    '''
+    Returns what a chunked transform was started with, saved with its checkpoints so they are only reused by the same run
+    '''
+    return {'source': raw_file_signature(filepath), 'chunk_size': chunk_size, 'incremental': incremental, 'backend': backend}
+
+def has_unfinished_chunks(country_code, chunk_size, incremental = False, backend = 'remote'):
+    '''
+    True if a chunked transform of the current raw file with the same options stopped partway (EX: the quota
+    or the budget ran out), so the caller can finish it from the raw file instead of fetching new articles
+    '''
+    filepath = raw_file_path(country_code)
+    state = storage.read_checkpoint_state(country_code)
+    if not chunk_size or state is None or not state['chunks'] or not os.path.exists(filepath):
+        return False
+    return state['run'] == checkpoint_run(filepath, chunk_size, incremental, backend)
+
+def load_known_fingerprints(country_code):
+    '''
+    Returns the fingerprint_index of the cleaned file for a country, or None if there isn't one.
+    Only the columns the fingerprint needs are read
+    '''
+    path = storage.cleaned_file_path(country_code)
+    if path is None:
+        return None
+    columns = ['url', 'title', 'description', 'content']
+    if path.endswith('.parquet'):
+        existing = storage.pq.read_table(path, columns = columns).to_pandas()
+    else:
+        existing = pd.read_csv(path, usecols = columns)
+    return fingerprint_index(existing)
+
+def cache_lookup(cache, endpoint, text):
+    '''
+    Returns the cached result of 'text' on 'endpoint', or None, and counts the hit or miss on the current run.
+    The shared cache's own counters add up every country, so a run's numbers come from here
+    '''
+    result = cache.get(endpoint, text)
+    metrics.count('cache_hits' if result is not None else 'cache_misses')
+    return result
+
+def print_cache_stats(cache):
+    '''
+    Prints the enrichment cache hits and misses of the current run and how many results are stored
+    '''
+    run = metrics.current()
+    counts = run.to_dict()['counts'] if run is not None else {}
+    print(f"Enrichment cache: {counts.get('cache_hits', 0)} hits, {counts.get('cache_misses', 0)} misses, {cache.stats()['entries']} stored results")
+
+def print_topic_model_stats():
+    '''
+    Prints how many topics the topic model answered instead of GenAI during the current run
+    '''
+    run = metrics.current()
+    stats = topic_model.hit_rate(run.to_dict()['counts'] if run is not None else {})
+    if stats['hit_rate'] is not None:
+        print(f"Topic model: {stats['hits']} answered locally, {stats['misses']} sent to GenAI ({stats['hit_rate']:.0%} hit rate)")
+
+def transform_in_chunks(country_code, chunk_size, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES,
+                        max_workers = DEFAULT_MAX_WORKERS, requests_per_second = DEFAULT_REQUESTS_PER_SECOND,
+                        incremental = False, limiter = None, progress = None, backend = 'remote'):
+    '''
+    Chunked version of transform_articles. The raw file is read 'chunk_size' articles at a time and every
+    finished chunk is written as a checkpoint, so a crash or a used up quota only loses the chunk in progress.
+    Running again with the same raw articles and chunk size picks up after the last finished chunk.
+    The cleaned file is built from the chunks at the end and the checkpoints are removed.
+    'progress' hears the rows finished so far across chunks, with None as the total since it isn't known up front.
+    Returns the same summary as transform_articles plus how many chunks were resumed
+    '''
+    filepath = raw_file_path(country_code)
+    run = checkpoint_run(filepath, chunk_size, incremental, backend)
+
+    #Checkpoints from different raw articles, chunk size or backend can't be reused
+    state = storage.read_checkpoint_state(country_code)
+    if state is None or state['run'] != run:
+        storage.clear_checkpoints(country_code)
+        state = {'run': run, 'chunks': {}}
+        storage.write_checkpoint_state(country_code, state)
+    elif state['chunks']:
+        print(f"Resuming from checkpoint: {len(state['chunks'])} chunks already done")
+
+    known = load_known_fingerprints(country_code) if incremental else None
+    resumed = len(state['chunks'])
+
+    cache = get_default_cache()
+    topic_calls = 0
+    topic_calls_saved = 0
+
+    rows_finished = 0
+    chunks = iter(pd.read_csv(filepath, chunksize = chunk_size))
+    for index in itertools.count():
+        with metrics.stage('load'):
+            raw = next(chunks, None)
+        if raw is None:
+            break
+        if str(index) in state['chunks']:
+            continue
+
+        with metrics.stage('clean'):
+            df = clean_articles(raw)
+        metrics.count('rows_loaded', len(df))
+        counts = {'added': 0, 'updated': 0, 'skipped': 0, 'enriched': 0}
+        if known is not None:
+            new_rows, changed_rows, counts['skipped'] = split_incremental(df, known = known)
+            df = pd.concat([new_rows, changed_rows])
+
+        #A chunk the iSchool budget can't pay for in full is left for the next run, which resumes from it
+        with reserve_budget(df, batch_size, backend) as (_, deferred):
+            if deferred:
+                raise BudgetExceededError(f'iSchool budget is short: chunk {index + 1} and later are deferred until it resets')
+
+            counts['enriched'] = len(df)
+            chunk_progress = (lambda done, total: progress(rows_finished + done, None)) if progress is not None else None
+            with metrics.stage('enrich'):
+                df, enrich_stats = enrich_frame(df, batch_size, max_batch_bytes, max_workers, requests_per_second, limiter, chunk_progress, backend)
+        rows_finished += counts['enriched']
+        with metrics.stage('date_features'):
+            df = add_date_features(df)
+        with metrics.stage('filter'):
+            df = drop_unenriched(df)
+        topic_calls += enrich_stats['topic_calls']
+        topic_calls_saved += enrich_stats['topic_calls_saved']
+
+        counts['updated'] = int(df['url'].isin(known.index).sum()) if known is not None else 0
+        counts['added'] = len(df) - counts['updated']
+
+        #The chunk counts as done once both its file and its entry in the state are saved
+        with metrics.stage('write'):
+            storage.write_checkpoint(df, country_code, index)
+            state['chunks'][str(index)] = counts
+            storage.write_checkpoint_state(country_code, state)
+        print(f"Chunk {index + 1}: {counts['enriched']} articles enriched")
+
+    summary = {key: sum(c[key] for c in state['chunks'].values()) for key in ['added', 'updated', 'skipped', 'enriched']}
+    summary['deferred'] = 0
+    summary['chunks_resumed'] = resumed
+
+    with metrics.stage('write'):
+        savepath = storage.combine_checkpoints(country_code, keep_existing = known is not None)
+        storage.clear_checkpoints(country_code)
+    print(f'Saved cleaned data to {savepath}')
+    print(f"Rows: {summary['added']} added, {summary['updated']} updated, {summary['skipped']} skipped, {summary['enriched']} enriched, {summary['deferred']} deferred")
+
+    print_cache_stats(cache)
+    print(f"Topic grouping: {topic_calls} unique entity sets, {topic_calls_saved} GenAI calls saved")
+    print_topic_model_stats()
+    return summary
+
+def transform_all(country_code, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES,
+                  max_workers = DEFAULT_MAX_WORKERS, requests_per_second = DEFAULT_REQUESTS_PER_SECOND,
+                  incremental = False, limiter = None, progress = None, backend = 'remote'):
+    '''
+    Loads, cleans and enriches every raw article at once and writes the cleaned file.
+    Called by transform_articles when no chunk size is set. Returns the same summary as transform_articles
+    '''
+    #Loading raw article data for specified country
+    filepath = raw_file_path(country_code)
+    with metrics.stage('load'):
+        raw = pd.read_csv(filepath)
+    with metrics.stage('clean'):
+        df = clean_articles(raw)
+    metrics.count('rows_loaded', len(df))
+
+    #In incremental mode only new and changed articles go on to enrichment
+    with metrics.stage('load'):
+        existing = storage.load_cleaned(country_code) if incremental else None
+    skipped = 0
+    if existing is not None:
+        new_rows, changed_rows, skipped = split_incremental(df, existing)
+        df = pd.concat([new_rows, changed_rows])
+    
+    #Gets sentiment, entities and topic for each article concurrently
+    #Results already in the enrichment cache are reused instead of calling the APIs again
+    cache = get_default_cache()
+
+    #When today's iSchool budget is short only the articles it can pay for are enriched.
+    #Deferred articles aren't in the cleaned file, so an incremental run picks them up once the budget resets
+    with reserve_budget(df, batch_size, backend) as (df, deferred):
+        if deferred:
+            print(f"iSchool budget is short: deferring {deferred} articles until it resets")
+        enriched_count = len(df)
+        with metrics.stage('enrich'):
+            df, enrich_stats = enrich_frame(df, batch_size, max_batch_bytes, max_workers, requests_per_second, limiter, progress, backend)
+    with metrics.stage('date_features'):
+        df = add_date_features(df)
+    with metrics.stage('filter'):
+        df = drop_unenriched(df)
+
+    summary = {'added': len(df), 'updated': 0, 'skipped': skipped, 'enriched': enriched_count, 'deferred': deferred}
+
+    if existing is not None:
+        is_update = df['url'].isin(existing['url'])
+        summary['updated'] = int(is_update.sum())
+        summary['added'] = len(df) - summary['updated']
+
+        #Replaces the changed rows and keeps every other enriched row as it was, without enriching them again
+        #Columns added since the existing file was written (EX: cluster_id) are kept, empty for its older rows
+        kept = existing[~existing['url'].isin(df['url'])]
+        df = pd.concat([kept, df.reindex(columns = existing.columns.union(df.columns, sort = False))], ignore_index = True)
 
     #Writes cleaned data to cache
-    savepath = os.path.join('cache', f'cleaned_headlines_{country_code.lower()}.csv')
-    df.to_csv(savepath, index = False)
+    with metrics.stage('write'):
+        savepath = storage.write_cleaned(df, country_code)
     print(f'Saved cleaned data to {savepath}')
+    print(f"Rows: {summary['added']} added, {summary['updated']} updated, {summary['skipped']} skipped, {summary['enriched']} enriched, {summary['deferred']} deferred")
+
+    print_cache_stats(cache)
+    print(f"Topic grouping: {enrich_stats['topic_calls']} unique entity sets, {enrich_stats['topic_calls_saved']} GenAI calls saved")
+    print_topic_model_stats()
+    return summary
+
+def transform_articles(country_code, batch_size = DEFAULT_BATCH_SIZE, max_batch_bytes = DEFAULT_MAX_BATCH_BYTES,
+                       max_workers = DEFAULT_MAX_WORKERS, requests_per_second = DEFAULT_REQUESTS_PER_SECOND,
+                       incremental = False, limiter = None, chunk_size = None, progress = None, backend = 'remote'):
+    '''
+    Combines all helper functions into a final transormation pipeline to add all features to data.
+    Sentiment and entities are requested 'batch_size' articles at a time, and the API calls run
+    concurrently, 'max_workers' at a time and no more than 'requests_per_second' started each second.
+    With 'incremental' set, only articles whose url is new or whose text changed are enriched, and
+    they are added to (or replaced in) the existing cleaned file. A shared 'limiter' (RateLimiter)
+    replaces 'requests_per_second' so several countries can be rate limited together.
+    With 'chunk_size' set, the articles are processed and checkpointed in chunks (see transform_in_chunks).
+    'progress' is called with (rows enriched, rows to enrich) as the enrichment goes.
+    'backend' picks where the sentiment, entities and topics come from (see ENRICHMENT_BACKENDS).
+    Stage timings, API calls and dropped rows are recorded and added to the run log (see metrics),
+    as part of the caller's run if one is already being recorded.
+    The cleaned articles are also added to the day's snapshot in the history (see history.save_snapshot).
+    Returns a summary of how many rows were added, updated, skipped and enriched
+    '''
+    with metrics.recording(country_code, 'transform') as run:
+        if chunk_size:
+            summary = transform_in_chunks(country_code, chunk_size, batch_size, max_batch_bytes, max_workers,
+                                          requests_per_second, incremental, limiter, progress, backend)
+        else:
+            summary = transform_all(country_code, batch_size, max_batch_bytes, max_workers,
+                                    requests_per_second, incremental, limiter, progress, backend)
+        for key, value in summary.items():
+            run.count(key, value)
+
+        #Keeps this run's articles in the history so trends can be followed over time
+        with metrics.stage('snapshot'):
+            history.save_snapshot(country_code)
+        return summary
 
 if __name__ == "__main__":
     country_code = 'us'
-    transform_articles(country_code)
\ No newline at end of file
+    transform_articles(country_code, incremental = True)
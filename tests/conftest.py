@@ -0,0 +1,34 @@
+import pytest
+
+#Four cleaned articles with every column transform_articles writes that the tests read
+SAMPLE_COLUMNS = {
+    'title': ['NASA plans Mars mission', 'Stocks rally on Nasdaq', 'NASA budget cut', 'Election day'],
+    'short_title': ['NASA plans', 'Stocks rally', 'NASA budget', 'Election day'],
+    'description': ['Space agency news', None, 'Congress votes', 'Polls open'],
+    'content': ['The mission launches in 2030.', 'Markets rose.', 'Funding falls.', 'Voters line up.'],
+    'author': ['Ann', None, 'Ann', 'Bob'],
+    'url': ['https://a.com', 'https://b.com', 'https://c.com', 'https://d.com'],
+    'publishedAt': ['2025-04-28T12:00:00Z', '2025-04-28T01:30:00Z', '2025-05-04T13:00:00Z', '2025-04-29T22:00:00Z'],
+    'source_name': ['CBS', 'CNN', 'CBS', 'BBC News'],
+    'sentiment': ['positive', 'positive', 'negative', 'neutral'],
+    'entities': [['NASA', 'United States'], ['Nasdaq'], ['NASA'], []],
+    'topic': ['space', 'finance', 'space', 'politics'],
+    'day_of_week_published': ['Monday', 'Monday', 'Sunday', 'Tuesday'],
+    'month_published': ['April', 'April', 'May', 'April'],
+    'time_of_day_published': ['12PM-3PM', '12AM-3AM', '12PM-3PM', '9PM-12AM']
+}
+
+@pytest.fixture
+def sample_cleaned():
+    '''
+    Returns a function that builds a small cleaned DataFrame shaped like the output of transform_articles.
+    Columns passed to it replace the sample's, and the sample's other columns are repeated to the same number of rows
+    '''
+    import pandas as pd
+
+    def make(**columns):
+        rows = len(next(iter(columns.values()))) if columns else len(SAMPLE_COLUMNS['url'])
+        data = {name: [values[i % len(values)] for i in range(rows)] for name, values in SAMPLE_COLUMNS.items()}
+        data.update(columns)
+        return pd.DataFrame(data)
+    return make
@@ -0,0 +1,82 @@
+import pytest
+from code import api_budget, http_client
+from code.api_budget import BudgetExceededError, BudgetTracker
+from code.http_client import QuotaExceededError
+
+#This function tests that calls are counted per API and refused once the day's limit is reached
+def test_budget_tracker_spend(tmp_path):
+    budget = BudgetTracker(str(tmp_path / 'budget.db'), limits = {'newsapi': 2, 'ischool': None})
+    budget('newsapi.org')
+    budget('newsapi.org')
+    with pytest.raises(BudgetExceededError):
+        budget('newsapi.org')
+    assert budget.used('newsapi') == 2
+    assert budget.remaining('newsapi') == 0
+
+    #Untracked hosts and APIs without a limit are never refused
+    for _ in range(10):
+        budget('cent.ischool-iot.net')
+        budget('example.com')
+    assert budget.used('ischool') == 10
+    assert budget.remaining('ischool') is None
+    assert budget.can_afford({'ischool': 1000})
+    assert not budget.can_afford({'newsapi': 1})
+
+    #The counts are kept between runs
+    reopened = BudgetTracker(str(tmp_path / 'budget.db'), limits = {'newsapi': 2, 'ischool': None})
+    assert reopened.usage()['newsapi'] == {'used': 2, 'limit': 2, 'remaining': 0}
+
+#This function tests that reserved calls can't be planned or spent by other work and unused ones are released
+def test_budget_reservation(tmp_path):
+    budget = BudgetTracker(str(tmp_path / 'budget.db'), limits = {'ischool': 10})
+    first = budget.reserve('ischool', 6)
+    assert budget.available('ischool') == 4
+    assert budget.remaining('ischool') == 10
+    with pytest.raises(BudgetExceededError):
+        budget.reserve('ischool', 5)
+
+    #Calls made inside the reservation are drawn from it, calls outside can only use what isn't reserved
+    with first:
+        for _ in range(4):
+            budget('cent.ischool-iot.net')
+    assert first.left == 0
+    assert budget.used('ischool') == 4
+    assert budget.available('ischool') == 6
+    for _ in range(6):
+        budget('cent.ischool-iot.net')
+    with pytest.raises(BudgetExceededError):
+        budget('cent.ischool-iot.net')
+
+    #Reserving nothing always works, even with the day's budget gone
+    with budget.reserve('ischool', 0):
+        pass
+    assert budget.available('ischool') == 0
+
+#This function tests that an API reporting its quota as gone is marked used up, while rate limiting isn't
+def test_record_quota_error(tmp_path, monkeypatch):
+    budget = BudgetTracker(str(tmp_path / 'budget.db'), limits = {'newsapi': 100, 'ischool': 100})
+    monkeypatch.setattr(api_budget, '_default_budget', budget)
+
+    api_budget.record_quota_error(QuotaExceededError('still rate limiting', host = 'cent.ischool-iot.net'))
+    assert budget.remaining('ischool') == 100
+
+    api_budget.record_quota_error(QuotaExceededError('Daily API usage limit reached', host = 'cent.ischool-iot.net', used_up = True))
+    assert budget.remaining('ischool') == 0
+    assert budget.remaining('newsapi') == 100
+
+#This function tests the estimate of iSchool calls and that install registers the tracker once
+def test_calls_needed_and_install(tmp_path, monkeypatch):
+    assert api_budget.ischool_calls_needed(15, 10) == 19
+    assert api_budget.ischool_calls_needed(15, 10, uncached = 0) == 15
+
+    #Endpoints that read one text per request need a call per text, and unknown ones may need both
+    assert api_budget.ischool_calls_needed(15, 10, batching = (False, True)) == 32
+    assert api_budget.ischool_calls_needed(15, 10, batching = (None, None)) == 49
+    assert api_budget.country_calls_needed(150, 10) == {'newsapi': 2, 'ischool': 180}
+    assert api_budget.with_retry_headroom(19) == 21
+
+    budget = BudgetTracker(str(tmp_path / 'budget.db'))
+    monkeypatch.setattr(api_budget, '_default_budget', budget)
+    assert api_budget.install() is budget
+    assert api_budget.install() is budget
+    assert http_client._before_request_hooks.count(budget) == 1
@@ -0,0 +1,84 @@
+import os
+import pandas as pd
+from code import dashboard_data, storage
+
+#This function tests the counts, author lists and topics computed for the dashboard
+def test_compute_aggregates(sample_cleaned):
+    aggregates = dashboard_data.compute_aggregates(sample_cleaned())
+
+    assert aggregates['topic_counts'].iloc[0].tolist() == ['space', 2]
+    assert list(aggregates['sentiment_counts'].columns) == ['Sentiment', 'Count']
+    assert aggregates['topics'] == ['finance', 'politics', 'space']
+    assert aggregates['authors'].set_index('author')['article_ids'].to_dict() == {'Ann': [0, 2], 'Bob': [3]}
+
+    #Time groupings keep every bucket in order, months without articles are left out
+    time_counts = aggregates['publication_counts']['Time of Day']
+    assert time_counts['time_of_day_published'].tolist()[0] == '12AM-3AM'
+    assert len(time_counts) == 8
+    assert time_counts['Article Count'].tolist() == [1, 0, 0, 0, 2, 0, 0, 1]
+    day_counts = aggregates['publication_counts']['Day of Week']
+    assert day_counts['day_of_week_published'].tolist()[:2] == ['Monday', 'Tuesday']
+    assert aggregates['publication_counts']['Month Published']['month_published'].tolist() == ['April', 'May']
+
+#This function tests that the modification time used as the cache key follows the cleaned file
+def test_cleaned_mtime(tmp_path, monkeypatch, sample_cleaned):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    assert dashboard_data.cleaned_mtime('us') is None
+
+    path = storage.write_cleaned(sample_cleaned(), 'us')
+    os.utime(path, (1000, 1000))
+    assert dashboard_data.cleaned_mtime('us') == 1000
+
+#This function tests that entity counts per topic keep multi-word entities whole
+def test_entity_frequencies(sample_cleaned):
+    frequencies = dashboard_data.entity_frequencies(sample_cleaned())
+    assert frequencies == {'space': {'NASA': 2, 'United States': 1}, 'finance': {'Nasdaq': 1}}
+
+#This function tests that a word cloud is drawn once per dataset version and older versions are removed
+def test_word_cloud_png_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    drawn = []
+
+    def fake_render(frequencies):
+        drawn.append(frequencies)
+        return b'png-' + str(len(drawn)).encode()
+
+    monkeypatch.setattr(dashboard_data, 'render_word_cloud', fake_render)
+    frequencies = {'NASA': 2}
+
+    assert dashboard_data.word_cloud_png('us', 'space', '1', frequencies) == b'png-1'
+    assert dashboard_data.word_cloud_png('us', 'space', '1', frequencies) == b'png-1'
+    assert len(drawn) == 1
+
+    #New data gets a new image and the old one is deleted
+    assert dashboard_data.word_cloud_png('us', 'space', '2', frequencies) == b'png-2'
+    assert not os.path.exists(dashboard_data.word_cloud_path('us', 'space', '1'))
+    assert os.path.exists(dashboard_data.word_cloud_path('us', 'space', '2'))
+
+#This function tests that a real word cloud renders to PNG bytes
+def test_render_word_cloud():
+    assert dashboard_data.render_word_cloud({'NASA': 3, 'United States': 1}).startswith(b'\x89PNG')
+
+#This function tests that collapsing keeps one article per near-duplicate cluster and every row without one
+def test_collapse_duplicates(sample_cleaned):
+    df = sample_cleaned()
+    assert dashboard_data.collapse_duplicates(df) is df
+
+    df['cluster_id'] = ['a', None, 'a', None]
+    aggregates = dashboard_data.compute_aggregates(df, collapse = True)
+    assert aggregates['topic_counts'].set_index('Topic')['Article Count'].to_dict() == {'space': 1, 'finance': 1, 'politics': 1}
+
+#This function tests that the author browser searches, sorts and pages the author index
+def test_author_browser():
+    df = pd.DataFrame({'author': ['Ann Lee', 'bob Stone', 'Ann Lee', 'Cara Bobbin', None, ' ', 'Bob Stone']})
+    index = dashboard_data.author_index(df)
+    assert index['author'].tolist() == ['Ann Lee', 'Bob Stone', 'Cara Bobbin', 'bob Stone']
+    assert index['article_count'].tolist() == [2, 1, 1, 1]
+
+    matches = dashboard_data.search_authors(index, 'BOB', "Name (A-Z)")
+    assert matches['author'].tolist() == ['Bob Stone', 'bob Stone', 'Cara Bobbin']
+
+    page, pages = dashboard_data.page_of(matches, 2, per_page = 2)
+    assert pages == 2
+    assert page['author'].tolist() == ['Cara Bobbin']
+    assert dashboard_data.page_of(matches.iloc[:0], 5)[1] == 1
@@ -0,0 +1,48 @@
+import pandas as pd
+from code import dedupe
+
+STORY = ('The space agency said on Monday that its new rover landed safely on Mars after a seven month trip, '
+         'and that the first pictures from the surface will be sent back to Earth later this week. '
+         'Engineers at the mission control center cheered as the signal confirming the landing arrived, '
+         'ending what the team called seven minutes of terror while the rover slowed from thousands of miles per hour')
+
+def sample_articles():
+    '''
+    Returns cleaned articles where the first three are the same wire story carried by different outlets
+    '''
+    return pd.DataFrame({
+        'url': ['https://a.com/1', 'https://b.com/1', 'https://c.com/1', 'https://d.com/1', 'https://e.com/1'],
+        'title': ['Rover lands on Mars', 'Rover lands on Mars', 'Rover lands on Mars - CBS', 'Stocks rally', ''],
+        'content': [STORY, STORY + ' and next month', STORY, 'Shares rose across the board as markets opened higher on Tuesday', '']
+    })
+
+#This function tests that copies of a story are grouped and that different stories are kept apart
+def test_find_near_duplicates():
+    labels, representatives = dedupe.find_near_duplicates(sample_articles())
+
+    assert labels.tolist() == [0, 0, 0, 3, 4]
+
+    #The copy with the longest content stands in for the group
+    assert representatives.tolist() == [1, 3, 4]
+
+#This function tests that cluster ids are shared within a group and don't depend on the row order
+def test_cluster_ids():
+    df = sample_articles()
+    ids = dedupe.cluster_ids(df, dedupe.find_near_duplicates(df)[0])
+    assert ids[0] == ids[1] == ids[2]
+    assert ids.nunique() == 3
+
+    reordered = df.iloc[[3, 0, 4, 2, 1]].reset_index(drop = True)
+    reordered_ids = dedupe.cluster_ids(reordered, dedupe.find_near_duplicates(reordered)[0])
+    assert reordered_ids[1] == ids[0]
+
+    #A different article coming first in the cluster still gives the same ids
+    reordered = df.iloc[[2, 1, 0, 3, 4]].reset_index(drop = True)
+    reordered_ids = dedupe.cluster_ids(reordered, dedupe.find_near_duplicates(reordered)[0])
+    assert reordered_ids.tolist() == ids.iloc[[2, 1, 0, 3, 4]].tolist()
+
+#This function tests that an empty frame has no clusters
+def test_find_near_duplicates_empty():
+    labels, representatives = dedupe.find_near_duplicates(sample_articles().iloc[:0])
+    assert len(labels) == 0
+    assert len(representatives) == 0
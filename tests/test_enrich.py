@@ -0,0 +1,136 @@
+import threading
+import time
+from code.enrich import RateLimiter, enrich_articles, make_batches
+
+#This function tests that results come back in the same order as the input texts
+def test_enrich_articles_keeps_order():
+    texts = ["alpha", "beta", "gamma", "delta"]
+
+    #Later batches finish first so the results arrive out of order
+    def sentiment(batch):
+        time.sleep(0.01 * (len(texts) - texts.index(batch[0])))
+        return [f"sentiment-{text}" for text in batch]
+
+    sentiments, entities, topics, _ = enrich_articles(
+        texts,
+        sentiment,
+        lambda batch: [[text.upper(), "2025"] for text in batch],
+        lambda entity_list: f"topic-{entity_list[0]}",
+        batch_size = 1,
+        max_workers = 4,
+        requests_per_second = None
+    )
+    assert sentiments == [f"sentiment-{t}" for t in texts]
+    assert entities == [[t.upper(), "2025"] for t in texts]
+    assert topics == [f"topic-{t.upper()}" for t in texts]
+
+#This function tests that the topic call receives the filtered entity list
+def test_enrich_articles_filters_entities_before_topic():
+    seen = []
+
+    def topic(entity_list):
+        seen.append(entity_list)
+        return "science"
+
+    _, entities, topics, _ = enrich_articles(
+        ["NASA"],
+        lambda batch: ["neutral"],
+        lambda batch: [["NASA", "2025"]],
+        topic,
+        entity_filter = lambda entity_lists: [[e for e in entity_list if not e.isdigit()] for entity_list in entity_lists],
+        requests_per_second = None
+    )
+    assert entities == [["NASA"]]
+    assert seen == [["NASA"]]
+    assert topics == ["science"]
+
+#This function tests that the sentiment and entity calls for one article run at the same time
+def test_enrich_articles_overlaps_sentiment_and_entities():
+
+    #Both calls must be waiting at the barrier together or it times out and raises
+    barrier = threading.Barrier(2, timeout = 2)
+
+    def sentiment(batch):
+        barrier.wait()
+        return ["positive"]
+
+    def entities(batch):
+        barrier.wait()
+        return [["Mars"]]
+
+    sentiments, _, _, _ = enrich_articles(["Mars"], sentiment, entities, lambda e: "space", max_workers = 2, requests_per_second = None)
+    assert sentiments == ["positive"]
+
+#This function tests that the rate limiter spaces calls out
+def test_rate_limiter_spacing():
+    limiter = RateLimiter(requests_per_second = 20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+
+    #5 calls at 20 per second need at least 4 gaps of 0.05 seconds
+    assert time.monotonic() - start >= 0.19
+
+#This function tests that batches respect both the size and the byte limits
+def test_make_batches():
+    assert make_batches(["a", "b", "c", "d", "e"], batch_size = 2) == [[0, 1], [2, 3], [4]]
+    assert make_batches(["aaaa", "bbbb", "cc", "dddddddd"], batch_size = 10, max_batch_bytes = 6) == [[0], [1, 2], [3]]
+    assert make_batches([]) == []
+
+#This function tests that each batch is sent as one call
+def test_enrich_articles_sends_batches():
+    calls = []
+
+    def sentiment(batch):
+        calls.append(batch)
+        return ["neutral"] * len(batch)
+
+    sentiments, _, _, _ = enrich_articles(
+        ["one", "two", "three"],
+        sentiment,
+        lambda batch: [["Mars"]] * len(batch),
+        lambda entity_list: "space",
+        batch_size = 2,
+        requests_per_second = None
+    )
+    assert sorted(calls) == [["one", "two"], ["three"]]
+    assert sentiments == ["neutral", "neutral", "neutral"]
+
+#This function tests that rows with the same topic key share one topic call
+def test_enrich_articles_groups_topic_calls():
+    calls = []
+
+    def topic(entity_list):
+        calls.append(entity_list)
+        time.sleep(0.02)
+        return "finance" if "Nasdaq" in entity_list else "space"
+
+    _, _, topics, stats = enrich_articles(
+        ["a", "b", "c"],
+        lambda batch: ["neutral"] * len(batch),
+        lambda batch: [["NASA", "Mars"], ["mars", "nasa"], ["Nasdaq"]],
+        topic,
+        topic_key = lambda entity_list: tuple(sorted(e.lower() for e in entity_list)),
+        requests_per_second = None
+    )
+    assert topics == ["space", "space", "finance"]
+    assert len(calls) == 2
+    assert stats == {'topic_calls': 2, 'topic_calls_saved': 1}
+
+#This function tests that progress counts a row only once its sentiment, entities and topic are all in
+def test_enrich_articles_reports_progress():
+    reports = []
+
+    enrich_articles(
+        ["a", "b", "c", "d"],
+        lambda batch: ["neutral"] * len(batch),
+        lambda batch: [[] if text == "d" else [text] for text in batch],
+        lambda entity_list: "space",
+        batch_size = 1,
+        max_workers = 2,
+        requests_per_second = None,
+        progress = lambda done, total: reports.append((done, total))
+    )
+    assert reports[0] == (0, 4)
+    assert reports[-1] == (4, 4)
+    assert [done for done, _ in reports] == sorted(done for done, _ in reports)
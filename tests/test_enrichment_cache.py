@@ -0,0 +1,74 @@
+import os
+import time
+from code.enrichment_cache import EnrichmentCache, make_key
+
+#This function tests that the key depends on both the endpoint and the text
+def test_make_key():
+    assert make_key('sentiment', 'NASA') == make_key('sentiment', 'NASA')
+    assert make_key('sentiment', 'NASA') != make_key('entities', 'NASA')
+    assert make_key('sentiment', 'NASA') != make_key('sentiment', 'Mars')
+
+#This function tests that stored results are returned and counted as hits and misses
+def test_get_and_set(tmp_path):
+    cache = EnrichmentCache(os.path.join(tmp_path, 'enrichment.db'))
+    assert cache.get('entities', 'NASA is going to Mars') is None
+
+    cache.set('entities', 'NASA is going to Mars', ['NASA', 'Mars'])
+    assert cache.get('entities', 'NASA is going to Mars') == ['NASA', 'Mars']
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+
+#This function tests that results survive closing and reopening the store
+def test_results_persist(tmp_path):
+    path = os.path.join(tmp_path, 'enrichment.db')
+    EnrichmentCache(path).set('sentiment', 'Great news', 'positive')
+    assert EnrichmentCache(path).get('sentiment', 'Great news') == 'positive'
+
+#This function tests that expired results are treated as missing and pruned
+def test_expired_results(tmp_path):
+    cache = EnrichmentCache(os.path.join(tmp_path, 'enrichment.db'), max_age_days = 1)
+    cache.set('topic', 'NASA, Mars', 'space')
+    cache.set('topic', 'Nasdaq, stock', 'finance')
+
+    #Makes every stored result count as expired
+    cache.max_age_seconds = -1
+    assert cache.get('topic', 'NASA, Mars') is None
+    assert cache.prune() == 1
+    assert cache.stats()['entries'] == 0
+
+#This function tests that the oldest results are removed once the size limit is passed
+def test_size_limit(tmp_path):
+    cache = EnrichmentCache(os.path.join(tmp_path, 'enrichment.db'), max_entries = 2)
+    cache.set('sentiment', 'one', 'positive')
+    time.sleep(0.01)
+    cache.set('sentiment', 'two', 'neutral')
+    time.sleep(0.01)
+    cache.set('sentiment', 'three', 'negative')
+
+    assert cache.stats()['entries'] == 2
+    assert cache.get('sentiment', 'one') is None
+    assert cache.get('sentiment', 'three') == 'negative'
+
+#This function tests that inserts under the limit don't trim, and that hits written in a batch still count as recent use
+def test_trim_and_batched_last_used(tmp_path):
+    cache = EnrichmentCache(os.path.join(tmp_path, 'enrichment.db'), max_entries = 2)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    cache.set('sentiment', 'one', 'positive')
+    time.sleep(0.01)
+    cache.set('sentiment', 'two', 'neutral')
+    assert not any(s.lstrip().startswith('DELETE') for s in statements)
+
+    #Reading 'one' isn't written on its own, but is written before the trim so 'two' is removed instead
+    time.sleep(0.01)
+    assert cache.get('sentiment', 'one') == 'positive'
+    assert not any(s.lstrip().startswith('UPDATE') for s in statements)
+    time.sleep(0.01)
+    cache.set('sentiment', 'three', 'negative')
+
+    assert cache.stats()['entries'] == 2
+    assert cache.contains('sentiment', ['one', 'two', 'three']) == [True, False, True]
@@ -1,6 +1,6 @@
 import os
 import pandas as pd 
-from code.extract import fetch_top_headlines, save_articles_to_csv
+from code.extract import fetch_top_headlines, save_articles_to_csv, merge_articles
 
 def test_should_pass():
     print("\n Always True!")
@@ -52,4 +52,73 @@ def test_save_articles_to_csv():
     assert 'title' in df.columns
 
     #Removes the test article from the cache
-    os.remove(filepath)
\ No newline at end of file
+    os.remove(filepath)
+
+def test_merge_articles():
+
+    #Cached articles and a new fetch where one article changed, one stayed the same and one is new
+    existing = pd.DataFrame({
+        'url': ['https://a.com', 'https://b.com'],
+        'title': ['Title A', 'Title B'],
+        'content': ['Content A', 'Content B']
+    })
+    new = pd.DataFrame({
+        'url': ['https://b.com', 'https://a.com', 'https://c.com'],
+        'title': ['Title B', 'Title A', 'Title C'],
+        'content': ['Content B updated', 'Content A', 'Content C']
+    })
+
+    merged, counts = merge_articles(existing, new)
+
+    #Tests that every url appears once and the changed article has its new content
+    assert sorted(merged['url']) == ['https://a.com', 'https://b.com', 'https://c.com']
+    assert merged.set_index('url').loc['https://b.com', 'content'] == 'Content B updated'
+    assert counts == {'added': 1, 'updated': 1, 'unchanged': 1}
+
+def test_iter_top_headlines_follows_pages(monkeypatch):
+    from code import extract
+
+    #Fake News API with 5 results served 2 per page
+    requested_pages = []
+
+    class Response:
+        status_code = 200
+        def __init__(self, data):
+            self.data = data
+        def json(self):
+            return self.data
+
+    def fake_get(url, headers = None, params = None):
+        requested_pages.append(params['page'])
+        start = (params['page'] - 1) * params['pageSize']
+        articles = [{'title': f'Article {i}'} for i in range(start, min(start + params['pageSize'], 5))]
+        return Response({'totalResults': 5, 'articles': articles})
+
+    monkeypatch.setattr(extract.http_client, 'get', fake_get)
+
+    #Tests that every page is read when there is no cap
+    titles = [a['title'] for a in extract.iter_top_headlines('us', page_size = 2, max_articles = None)]
+    assert titles == [f'Article {i}' for i in range(5)]
+    assert requested_pages == [1, 2, 3]
+
+    #Tests that the cap stops fetching early
+    requested_pages.clear()
+    assert len(extract.fetch_top_headlines('us', page_size = 2, max_articles = 3)) == 3
+    assert requested_pages == [1, 2]
+
+def test_save_articles_streams_batches():
+
+    #A generator of fake articles saved 2 at a time
+    articles = (
+        {"source": {"id": None, "name": "Test Source"}, "title": f"Title {i}", "url": f"https://testurl.com/{i}", "content": "Test content."}
+        for i in range(5)
+    )
+    assert save_articles_to_csv(articles, 'test', batch_size = 2) == 5
+
+    filepath = os.path.join('cache', 'top_headlines_test.csv')
+    df = pd.read_csv(filepath)
+    assert len(df) == 5
+    assert list(df.columns) == ['author', 'title', 'description', 'url', 'urlToImage', 'publishedAt', 'content', 'source_id', 'source_name']
+
+    #Removes the test article from the cache
+    os.remove(filepath)
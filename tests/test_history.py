@@ -0,0 +1,59 @@
+import os
+from code import history, storage
+
+#This function tests that every day's run is kept whole, and that an article's first fetch can be picked at query time
+def test_save_snapshot_partitions(tmp_path, monkeypatch, sample_cleaned):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+
+    day1 = sample_cleaned(url = ['a', 'b'], topic = ['space', 'finance'], sentiment = ['positive', 'neutral'], entities = [['NASA'], ['Nasdaq']])
+    path = history.save_snapshot('US', '2025-04-28', day1)
+    assert os.path.join('country=us', 'fetch_date=2025-04-28') in path
+
+    #The next day's data still holds article 'a', which is stored again as part of that day's headlines
+    day2 = sample_cleaned(url = ['a', 'c'], topic = ['space', 'space'], sentiment = ['positive', 'negative'], entities = [['NASA'], ['NASA', 'Mars']])
+    read = []
+    original = history._read_partition
+    monkeypatch.setattr(history, '_read_partition', lambda path, columns = None: read.append(path) or original(path, columns))
+    history.save_snapshot('us', '2025-04-29', day2)
+    assert read == []
+
+    #A second run on the same day replaces that day's rows instead of adding them twice, reading only that day
+    history.save_snapshot('us', '2025-04-29', day2)
+    assert len(read) == 1
+
+    assert history.snapshot_dates('us') == ['2025-04-28', '2025-04-29']
+    df = history.read_history('us')
+    assert sorted(zip(df['url'], df['fetch_date'].dt.strftime('%Y-%m-%d'))) == [
+        ('a', '2025-04-28'), ('a', '2025-04-29'), ('b', '2025-04-28'), ('c', '2025-04-29')
+    ]
+    first = history.read_history('us', columns = ['topic'], first_fetch_only = True)
+    assert list(first.columns) == ['topic', 'fetch_date']
+    assert first['fetch_date'].dt.strftime('%Y-%m-%d').tolist() == ['2025-04-28', '2025-04-28', '2025-04-29']
+
+    #Each day's shares cover every article of that day's run
+    sentiment = history.sentiment_trends('us', start = '2025-04-29')
+    assert sentiment.set_index('sentiment')['share'].to_dict() == {'positive': 0.5, 'negative': 0.5}
+
+#This function tests that queries only read the partitions in the date range and count labels per day
+def test_trend_queries(tmp_path, monkeypatch, sample_cleaned):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    history.save_snapshot('us', '2025-04-28', sample_cleaned(url = ['a', 'b'], topic = ['space', 'finance'], sentiment = ['positive', 'neutral'], entities = [['NASA'], ['Nasdaq']]))
+    history.save_snapshot('us', '2025-04-29', sample_cleaned(url = ['c', 'd'], topic = ['space', 'space'], sentiment = ['negative', 'negative'], entities = [['NASA', 'NASA'], ['Mars']]))
+    history.save_snapshot('us', '2025-04-30', sample_cleaned(url = ['e'], topic = ['politics'], sentiment = ['neutral'], entities = [['Senate']]))
+
+    read = []
+    original = history._read_partition
+    monkeypatch.setattr(history, '_read_partition', lambda path, columns = None: read.append(path) or original(path, columns))
+
+    topics = history.topic_trends('us', '2025-04-29', '2025-04-30')
+    assert len(read) == 2
+    assert topics[['topic', 'count']].values.tolist() == [['space', 2], ['politics', 1]]
+
+    sentiment = history.sentiment_trends('us', end = '2025-04-28')
+    assert sentiment.set_index('sentiment')['share'].to_dict() == {'positive': 0.5, 'neutral': 0.5}
+
+    #An entity named twice in one article counts once
+    mentions = history.entity_trends('us', ['NASA'])
+    assert mentions['count'].tolist() == [1, 1]
+
+    assert history.read_history('gb').empty
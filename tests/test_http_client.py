@@ -0,0 +1,96 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from code import http_client
+from code.http_client import QuotaExceededError, backoff_delay, request, retry_after_seconds
+
+def start_server(responses):
+    '''
+    Starts a local server that answers each request with the next (status, headers, body) in 'responses'
+    '''
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            calls.append(self.path)
+            status, headers, body = responses[min(len(calls), len(responses)) - 1]
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode('utf-8'))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/', calls
+
+#This function tests that the backoff grows with each attempt but never passes the cap
+def test_backoff_delay():
+    for attempt in range(10):
+        delay = backoff_delay(attempt, backoff = 0.5, cap = 4)
+        assert 0 <= delay <= min(4, 0.5 * 2 ** attempt)
+
+#This function tests reading the Retry-After header
+def test_retry_after_seconds():
+    class Response:
+        def __init__(self, headers):
+            self.headers = headers
+
+    assert retry_after_seconds(Response({'Retry-After': '3'})) == 3
+    assert retry_after_seconds(Response({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0
+    assert retry_after_seconds(Response({})) is None
+
+#This function tests that temporary errors are retried until the request succeeds
+def test_request_retries_then_succeeds():
+    server, url, calls = start_server([
+        (503, {'Retry-After': '0'}, 'busy'),
+        (500, {}, 'error'),
+        (200, {}, 'ok')
+    ])
+    try:
+        response = request('GET', url, retries = 3, backoff = 0.01)
+        assert response.status_code == 200
+        assert len(calls) == 3
+    finally:
+        server.shutdown()
+
+#This function tests that a daily quota message raises the typed error without retrying
+def test_request_raises_on_quota_message():
+    server, url, calls = start_server([(429, {}, 'Daily API usage limit reached')])
+    try:
+        with pytest.raises(QuotaExceededError):
+            request('GET', url, retries = 3, backoff = 0.01)
+        assert len(calls) == 1
+    finally:
+        server.shutdown()
+
+#This function tests that a 429 that never clears raises the typed error after the retries run out
+def test_request_raises_after_repeated_429():
+    server, url, calls = start_server([(429, {'Retry-After': '0'}, 'slow down')])
+    try:
+        with pytest.raises(QuotaExceededError):
+            request('GET', url, retries = 2, backoff = 0.01)
+        assert len(calls) == 3
+    finally:
+        server.shutdown()
+
+#This function tests that other errors are returned to the caller instead of retried
+def test_request_returns_client_errors():
+    server, url, calls = start_server([(404, {}, 'missing')])
+    try:
+        assert request('GET', url, retries = 3, backoff = 0.01).status_code == 404
+        assert len(calls) == 1
+    finally:
+        server.shutdown()
+
+#This function tests that a host limit can be changed and put back, and that None goes back to the default
+def test_set_host_limit():
+    assert http_client.set_host_limit('example.com', 2) is None
+    assert http_client._host_semaphore('example.com')._initial_value == 2
+    assert http_client.set_host_limit('example.com', None) == 2
+    assert 'example.com' not in http_client.HOST_LIMITS
+    assert http_client._host_semaphore('example.com')._initial_value == http_client.DEFAULT_HOST_LIMIT
@@ -0,0 +1,81 @@
+import threading
+from code import api_budget, jobs, http_client, metrics
+from code.http_client import QuotaExceededError
+
+class FakeResponse:
+    status_code = 200
+    text = ''
+
+class FakeSession:
+    def request(self, method, url, **kwargs):
+        return FakeResponse()
+
+#This function tests that a running job reports progress and API calls, and that starting it again re-attaches to it
+def test_job_progress_and_reattach(monkeypatch, tmp_path):
+    release = threading.Event()
+    halfway = threading.Event()
+
+    def fake_transform(country_code, progress = None):
+        http_client.post('http://example.com/sentiment')
+        http_client.post('http://example.com/entities')
+        progress(0, 4)
+        progress(2, 4)
+        halfway.set()
+        release.wait(5)
+        progress(4, 4)
+        return {'added': 4}
+
+    monkeypatch.setattr(http_client, 'get_session', lambda: FakeSession())
+    monkeypatch.setattr(metrics, 'RUN_LOG_PATH', str(tmp_path / 'run_log.jsonl'))
+    monkeypatch.setattr(api_budget, '_default_budget', api_budget.BudgetTracker(str(tmp_path / 'budget.db')))
+    monkeypatch.setattr(jobs, 'iter_top_headlines', lambda country_code, max_articles = None: [{'title': 'Test'}] * 4)
+    monkeypatch.setattr(jobs, 'save_articles_to_csv', lambda articles, country_code: len(list(articles)))
+    monkeypatch.setattr(jobs, 'transform_articles', fake_transform)
+    jobs.clear_finished_jobs()
+
+    job = jobs.start_job('zz')
+    assert halfway.wait(5)
+    progress = job.progress()
+    assert progress['status'] == 'enriching'
+    assert (progress['rows_done'], progress['rows_total']) == (2, 4)
+    assert progress['api_calls'] == 2
+    assert progress['eta_seconds'] is not None
+
+    #A rerun gets the same job instead of starting a second one
+    assert jobs.start_job('ZZ') is job
+    assert jobs.get_job('zz') is job
+
+    release.set()
+    job.join(5)
+    assert job.progress()['status'] == 'done'
+    assert job.summary == {'added': 4}
+
+    #The job is logged as a run with its API calls
+    run = metrics.read_runs(limit = 1)[0]
+    assert (run['country'], run['status'], run['api_calls']) == ('zz', 'done', 2)
+
+    #A finished job is replaced by a new one
+    assert jobs.start_job('zz') is not job
+    jobs.get_job('zz').join(5)
+    jobs.clear_finished_jobs()
+    assert jobs.get_job('zz') is None
+
+#This function tests that a used up quota and empty fetches end the job with their own status
+def test_job_failure_statuses(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, 'RUN_LOG_PATH', str(tmp_path / 'run_log.jsonl'))
+    monkeypatch.setattr(api_budget, '_default_budget', api_budget.BudgetTracker(str(tmp_path / 'budget.db')))
+
+    def quota(country_code, max_articles = None):
+        raise QuotaExceededError('Daily API usage limit reached')
+
+    monkeypatch.setattr(jobs, 'iter_top_headlines', quota)
+    job = jobs.PipelineJob('zz').start()
+    job.join(5)
+    assert job.status == 'quota_exceeded'
+    assert not job.running
+
+    monkeypatch.setattr(jobs, 'iter_top_headlines', lambda country_code, max_articles = None: [])
+    monkeypatch.setattr(jobs, 'save_articles_to_csv', lambda articles, country_code: 0)
+    job = jobs.PipelineJob('zz').start()
+    job.join(5)
+    assert job.status == 'no_articles'
@@ -0,0 +1,46 @@
+from code import local_enrich
+
+#This function tests that the lexicon labels match the API's labels and that negations flip a word
+def test_score_sentiment(monkeypatch):
+    monkeypatch.setattr(local_enrich, '_lexicon', dict(local_enrich._BUILTIN_LEXICON))
+    scored = local_enrich.score_sentiment([
+        'Stocks rally to a record as investors welcome the deal',
+        'Three killed in a shooting after the storm',
+        'The council meets on Tuesday',
+        'The talks did not fail',
+        ''
+    ])
+
+    assert scored['sentiment'].tolist() == ['positive', 'negative', 'neutral', 'positive', None]
+    assert scored['confidence'][0] > local_enrich.MIN_SENTIMENT_CONFIDENCE
+    assert scored['confidence'][2] == 0
+
+#This function tests that names, acronyms and multi-word entities are found once each
+def test_get_entities_batch():
+    entities = local_enrich.get_entities_batch([
+        'The White House said NASA and the Bank of England met in the U.S. on Monday. NASA agreed.',
+        'nothing capitalized here',
+        ''
+    ])
+
+    assert entities[0] == ['White House', 'NASA', 'Bank of England', 'U.S.']
+    assert entities[1] == []
+    assert entities[2] is None
+
+#This function tests that words only capitalized by starting a sentence are dropped and don't count as confident
+def test_score_entities():
+    scored = local_enrich.score_entities([
+        'Officials said the plan works. Critics disagree.',
+        'Stocks fell as the Federal Reserve met',
+        'Stocks fell again',
+        'Shares in NVDA jumped'
+    ])
+    assert scored['entities'].tolist() == [[], ['Stocks', 'Federal Reserve'], ['Stocks'], ['NVDA']]
+    assert scored['confident'].tolist() == [False, True, False, True]
+
+#This function tests that topics come from entity keywords, with the share of hits as the confidence
+def test_score_topic():
+    assert local_enrich.score_topic(['Nasdaq', 'Wall Street', 'Federal Reserve']) == ('finance', 1.0)
+    assert local_enrich.score_topic(['Senate', 'Apple']) == ('politics', 0.5)
+    assert local_enrich.score_topic(['Springfield']) == ('Unknown', 0.0)
+    assert local_enrich.get_topic_from_entities([]) == 'Unknown'
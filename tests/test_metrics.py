@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+from code import metrics, transform
+from code.enrich import enrich_articles
+
+#This function tests that a recorded run keeps its stage times, API calls and dropped rows and is written to the run log
+def test_recording_writes_run_log(tmp_path):
+    path = str(tmp_path / 'run_log.jsonl')
+
+    with metrics.recording('US', path = path) as run:
+        with metrics.stage('clean'):
+            pass
+        with metrics.stage('clean'):
+            pass
+        metrics.record_call('example.com/sentiment', 0.2, 200)
+        metrics.record_call('example.com/sentiment', 40, 500, retry = True)
+        metrics.record_call('example.com/sentiment', 0.05, error = 'ConnectionError')
+        metrics.record_dropped('no_entities', 3)
+
+        #A nested recording is part of the same run instead of a second one
+        with metrics.recording('us', path = path) as inner:
+            assert inner is run
+
+    assert metrics.current() is None
+    runs = metrics.read_runs(path = path)
+    assert len(runs) == 1
+    logged = runs[0]
+    assert logged['country'] == 'us'
+    assert logged['stages']['clean']['calls'] == 2
+    assert logged['api_calls'] == 3
+    assert logged['dropped'] == {'no_entities': 3}
+
+    endpoint = logged['endpoints']['example.com/sentiment']
+    assert (endpoint['retries'], endpoint['errors']) == (1, 2)
+    assert endpoint['statuses'] == {'200': 1, '500': 1, 'ConnectionError': 1}
+    assert endpoint['latency'] == {'<=0.25s': 1, '+inf': 1, '<=0.1s': 1}
+
+    summary = metrics.run_summary(logged)
+    assert (summary['retries'], summary['errors'], summary['rows_dropped']) == (1, 2, 3)
+
+#This function tests that an exception marks the run failed and the run log keeps only the latest runs
+def test_recording_failed_run(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run_log.jsonl')
+    monkeypatch.setattr(metrics, 'MAX_LOGGED_RUNS', 2)
+
+    with pytest.raises(RuntimeError):
+        with metrics.recording('us', path = path):
+            raise RuntimeError('boom')
+    for country in ['gb', 'ca']:
+        with metrics.recording(country, path = path):
+            pass
+
+    runs = metrics.read_runs(path = path)
+    assert [r['country'] for r in runs] == ['ca', 'gb']
+
+    with pytest.raises(RuntimeError):
+        with metrics.recording('au', path = path):
+            raise RuntimeError('boom')
+    assert metrics.read_runs(limit = 1, path = path)[0]['status'] == 'failed'
+
+#This function tests that API calls made on the enrichment threads are recorded on the caller's run
+def test_enrichment_threads_share_run(tmp_path):
+    def sentiment(texts):
+        metrics.record_call('example.com/sentiment', 0.01, 200)
+        return ['positive'] * len(texts)
+
+    with metrics.recording('us', path = str(tmp_path / 'run_log.jsonl')) as run:
+        enrich_articles(['a', 'b', 'c'], metrics.timed('sentiment', sentiment), lambda texts: [[]] * len(texts),
+                        lambda entities: 'Unknown', batch_size = 1, max_workers = 3, requests_per_second = None)
+
+    assert run.endpoints['example.com/sentiment']['calls'] == 3
+    assert run.stages['sentiment']['calls'] == 3
+
+#This function tests that the final filter records why each row was dropped
+def test_drop_unenriched_reasons(tmp_path):
+    df = pd.DataFrame({
+        'entities': [['NASA'], [], ['Mars'], ['Nasdaq']],
+        'sentiment': ['positive', 'neutral', None, 'negative'],
+        'topic': ['space', 'space', 'space', 'Unknown']
+    })
+
+    with metrics.recording('us', path = str(tmp_path / 'run_log.jsonl')) as run:
+        kept = transform.drop_unenriched(df)
+
+    assert len(kept) == 1
+    assert run.dropped == {'no_entities': 1, 'no_sentiment': 1, 'unknown_topic': 1}
@@ -0,0 +1,134 @@
+import json
+import os
+import pytest
+from code import api_budget, metrics, pipeline
+from code.http_client import QuotaExceededError
+
+#This function tests that the run budget stops requests once it is used up
+def test_api_budget():
+    budget = pipeline.ApiBudget(max_calls = 2)
+    budget('cent.ischool-iot.net')
+    budget('cent.ischool-iot.net')
+    with pytest.raises(QuotaExceededError):
+        budget('cent.ischool-iot.net')
+    assert budget.used == 2
+
+    #No limit set means every call is allowed
+    unlimited = pipeline.ApiBudget()
+    for _ in range(100):
+        unlimited('newsapi.org')
+    assert unlimited.used == 100
+
+#This function tests that one failing country doesn't stop the others and that every country is reported
+def test_run_pipeline_continues_on_error(monkeypatch, tmp_path):
+    def fake_fetch(country_code, max_articles = None):
+        if country_code == 'gb':
+            raise RuntimeError('connection reset')
+        if country_code == 'ca':
+            return []
+        return [{'title': 'Test'}]
+
+    monkeypatch.setattr(metrics, 'RUN_LOG_PATH', os.path.join(tmp_path, 'run_log.jsonl'))
+    monkeypatch.setattr(api_budget, '_default_budget', api_budget.BudgetTracker(os.path.join(tmp_path, 'budget.db')))
+    monkeypatch.setattr(pipeline, 'iter_top_headlines', fake_fetch)
+    monkeypatch.setattr(pipeline, 'save_articles_to_csv', lambda articles, country_code, merge = False: len(list(articles)))
+    monkeypatch.setattr(pipeline, 'transform_articles', lambda country_code, **kwargs: {'added': 1})
+
+    report = pipeline.run_pipeline(['us', 'gb', 'ca'], requests_per_second = None, max_concurrency = 3)
+    statuses = {r['country']: r['status'] for r in report['countries']}
+    assert statuses == {'us': 'ok', 'gb': 'error', 'ca': 'no_articles'}
+    assert [r['country'] for r in report['countries']] == ['us', 'gb', 'ca']
+    assert not report['ok']
+
+    #The run's iSchool concurrency limit doesn't outlive the run
+    assert pipeline.http_client.HOST_LIMITS['cent.ischool-iot.net'] == 8
+
+    #Tests that the report is written as JSON
+    path = os.path.join(tmp_path, 'report.json')
+    pipeline.write_report(report, path)
+    with open(path) as f:
+        assert json.load(f)['countries'][0]['summary'] == {'added': 1}
+
+#This function tests that running out of quota is reported separately from other errors
+def test_run_country_quota_exceeded(monkeypatch, tmp_path):
+    def fake_fetch(country_code, max_articles = None):
+        raise QuotaExceededError('Daily API usage limit reached')
+
+    monkeypatch.setattr(metrics, 'RUN_LOG_PATH', os.path.join(tmp_path, 'run_log.jsonl'))
+    monkeypatch.setattr(api_budget, '_default_budget', api_budget.BudgetTracker(os.path.join(tmp_path, 'budget.db')))
+    monkeypatch.setattr(pipeline, 'iter_top_headlines', fake_fetch)
+    status = pipeline.run_country('us')
+    assert status['status'] == 'quota_exceeded'
+
+    #Every country is logged as its own run
+    assert metrics.read_runs()[0]['status'] == 'quota_exceeded'
+
+#This function tests that a country is deferred without fetching when the daily budget is used up
+def test_run_country_deferred(monkeypatch, tmp_path):
+    budget = api_budget.BudgetTracker(os.path.join(tmp_path, 'budget.db'), limits = {'newsapi': 100, 'ischool': 2})
+    monkeypatch.setattr(metrics, 'RUN_LOG_PATH', os.path.join(tmp_path, 'run_log.jsonl'))
+    monkeypatch.setattr(api_budget, '_default_budget', budget)
+    monkeypatch.setattr(pipeline, 'iter_top_headlines', lambda country_code, max_articles = None: pytest.fail('fetched while deferred'))
+
+    status = pipeline.run_country('us')
+    assert status['status'] == 'deferred'
+    assert status['articles_fetched'] == 0
+
+#This function tests that a country whose chunked transform ran out of quota is finished on the next run
+#from the articles it started on, instead of fetching again and throwing its checkpoints away
+def test_run_country_resumes_chunks(monkeypatch, tmp_path):
+    from code import storage, transform
+    from code.enrichment_cache import EnrichmentCache
+    from tests.test_transform import fake_post
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metrics, 'RUN_LOG_PATH', os.path.join(tmp_path, 'run_log.jsonl'))
+    monkeypatch.setattr(api_budget, '_default_budget', api_budget.BudgetTracker(os.path.join(tmp_path, 'budget.db')))
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: EnrichmentCache(os.path.join(tmp_path, 'enrichment.db')))
+    monkeypatch.setattr(transform.topic_model, '_default_model', transform.topic_model.TopicModel())
+
+    articles = [
+        {'title': f'Headline number {i}', 'description': 'Description', 'url': f'https://example.com/{i}',
+         'publishedAt': '2025-04-28T12:00:00Z', 'content': f'Story{i} content', 'source': {'id': None, 'name': 'CBS'}}
+        for i in range(5)
+    ]
+    fetches = []
+    monkeypatch.setattr(pipeline, 'iter_top_headlines', lambda country_code, max_articles = None: fetches.append(country_code) or articles)
+
+    #The quota runs out partway through the second chunk
+    calls = []
+    def failing_post(url, **kwargs):
+        calls.append(url)
+        if len(calls) > 5:
+            raise QuotaExceededError('Daily API usage limit reached')
+        return fake_post(url, **kwargs)
+
+    monkeypatch.setattr(transform.http_client, 'post', failing_post)
+    status = pipeline.run_country('test', max_workers = 1, chunk_size = 2)
+    assert status['status'] == 'quota_exceeded'
+    assert len(storage.checkpoint_files('test')) == 1
+
+    #The second run doesn't fetch, and picks up after the finished chunk
+    monkeypatch.setattr(transform.http_client, 'post', fake_post)
+    status = pipeline.run_country('test', max_workers = 1, chunk_size = 2)
+    assert status['status'] == 'ok'
+    assert status['resumed']
+    assert fetches == ['test']
+    assert status['summary']['chunks_resumed'] == 1
+    assert len(storage.load_cleaned('test')) == 5
+
+#This function tests that the checkpoint key follows the articles, not the raw file's modification time
+def test_raw_file_signature(tmp_path):
+    from code import transform
+    import pandas as pd
+
+    path = os.path.join(tmp_path, 'raw.csv')
+    pd.DataFrame({'url': ['a', 'b'], 'content': ['x', 'y'], 'title': ['t', 't']}).to_csv(path, index = False)
+    first = transform.raw_file_signature(path)
+
+    #Writing the same articles again (as a new fetch does) keeps the key, changing one changes it
+    os.utime(path, (1000, 1000))
+    pd.DataFrame({'url': ['a', 'b'], 'content': ['x', 'y'], 'title': ['t', 't']}).to_csv(path, index = False)
+    assert transform.raw_file_signature(path) == first
+    pd.DataFrame({'url': ['a', 'b'], 'content': ['x', 'z'], 'title': ['t', 't']}).to_csv(path, index = False)
+    assert transform.raw_file_signature(path) != first
@@ -0,0 +1,28 @@
+import pandas as pd
+from code import schema
+
+#This function tests that the label, date and text columns get their compact dtypes and missing columns are skipped
+def test_apply_schema():
+    df = schema.apply_schema(pd.DataFrame({
+        'title': ['NASA plans Mars mission', None],
+        'publishedAt': ['2025-04-28T12:00:00Z', 'not a date'],
+        'topic': ['space', 'finance'],
+        'month_published': ['April', 'Smarch'],
+        'time_of_day_published': ['12PM-3PM', '12AM-3AM']
+    }))
+    assert df['title'].dtype == schema.STRING_DTYPE
+    assert df['title'].isna().tolist() == [False, True]
+    assert pd.api.types.is_datetime64_any_dtype(df['publishedAt'])
+    assert isinstance(df['topic'].dtype, pd.CategoricalDtype)
+    assert df['month_published'].isna().tolist() == [False, True]
+    assert df['time_of_day_published'].cat.ordered
+    assert df['time_of_day_published'].min() == '12AM-3AM'
+
+#This function tests that the date columns sort and count in calendar order instead of alphabetically
+def test_ordered_columns():
+    days = schema.ordered(pd.Series(['Sunday', 'Monday', 'Friday', 'Monday']), 'day_of_week_published')
+    assert days.sort_values().tolist() == ['Monday', 'Monday', 'Friday', 'Sunday']
+
+    counts = days.value_counts(sort = False)
+    assert counts.index.tolist() == schema.DAY_ORDER
+    assert counts.tolist() == [2, 0, 0, 0, 1, 0, 1]
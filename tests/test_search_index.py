@@ -0,0 +1,35 @@
+import pandas as pd
+from code import search_index, storage
+
+#This function tests that entity, word and label lookups are combined like a query
+def test_search(sample_cleaned):
+    #Another spelling of NASA and a categorical sentiment column are handled like the plain ones
+    index = search_index.build_index(sample_cleaned(
+        entities = [['NASA', 'Mars'], ['Nasdaq'], [' nasa ', 'Congress'], []],
+        sentiment = pd.Categorical(['positive', 'positive', 'negative', 'neutral'])
+    ))
+
+    #All articles mentioning NASA with negative sentiment
+    assert search_index.search(index, entities = ['NASA'], sentiment = 'negative').tolist() == [2]
+    assert search_index.search(index, entities = ['nasa']).tolist() == [0, 2]
+    assert search_index.search(index, text = 'NASA mission').tolist() == [0]
+    assert search_index.search(index, text = 'space', topic = 'space').tolist() == [0]
+    assert search_index.search(index, text = 'unknownword').tolist() == []
+    assert search_index.search(index).tolist() == [0, 1, 2, 3]
+
+    #The most used spelling is shown, most mentioned first
+    assert search_index.top_entities(index)[0] == 'NASA'
+
+#This function tests that the saved index is reused for the same data version and ignored for another
+def test_load_index_persists(tmp_path, monkeypatch, sample_cleaned):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    df = sample_cleaned()
+
+    index = search_index.load_index('test', df, 'v1')
+    saved = search_index.read_index('test', 'v1')
+    assert saved['entity'].keys() == index['entity'].keys()
+    assert saved['token']['mission'].tolist() == [0]
+    assert saved['names']['nasa'] == 'NASA'
+    assert search_index.search(saved, entities = ['NASA'], sentiment = 'negative').tolist() == [2]
+
+    assert search_index.read_index('test', 'v2') is None
@@ -0,0 +1,42 @@
+import pandas as pd
+from code import schema, storage
+
+#This function tests that Parquet keeps entities as lists, publishedAt as a timestamp and labels as categoricals
+def test_write_and_load_parquet(tmp_path, monkeypatch, sample_cleaned):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    path = storage.write_cleaned(sample_cleaned(), 'test')
+    assert path.endswith('.parquet')
+
+    df = storage.load_cleaned('test')
+    assert df['entities'].tolist() == [['NASA', 'United States'], ['Nasdaq'], ['NASA'], []]
+    assert pd.api.types.is_datetime64_any_dtype(df['publishedAt'])
+    assert isinstance(df['sentiment'].dtype, pd.CategoricalDtype)
+    assert df['day_of_week_published'].dtype == schema.ORDERED_COLUMNS['day_of_week_published']
+    assert df['title'].dtype == schema.STRING_DTYPE
+    assert list(df.columns) == list(sample_cleaned().columns)
+
+#This function tests that an older CSV cache is still loaded when there is no Parquet file
+def test_load_csv_fallback(tmp_path, monkeypatch, sample_cleaned):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    sample_cleaned().to_csv(storage.cleaned_csv_path('test'), index = False)
+
+    df = storage.load_cleaned('test')
+    assert df['entities'].tolist() == [['NASA', 'United States'], ['Nasdaq'], ['NASA'], []]
+    assert pd.api.types.is_datetime64_any_dtype(df['publishedAt'])
+
+#This function tests that missing data returns None and that both formats count as cached
+def test_cached_countries(tmp_path, monkeypatch, sample_cleaned):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    assert storage.load_cleaned('us') is None
+
+    storage.write_cleaned(sample_cleaned(), 'us')
+    sample_cleaned().to_csv(storage.cleaned_csv_path('gb'), index = False)
+    sample_cleaned().to_csv(storage.cleaned_csv_path('us'), index = False)
+    assert storage.cached_countries() == ['gb', 'us']
+
+#This function tests parsing entities from their CSV string form
+def test_safe_parse_entities():
+    assert storage.safe_parse_entities("['NASA', 'Mars']") == ['NASA', 'Mars']
+    assert storage.safe_parse_entities("[]") == []
+    assert storage.safe_parse_entities("not a list [") == []
+    assert storage.safe_parse_entities(None) == []
@@ -0,0 +1,28 @@
+import json
+import os
+import sys
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from stub_servers import ENTITY_PATH, StubConfig, StubServer
+
+def post_texts(url, texts):
+    '''
+    Sends 'texts' as repeated 'text' fields, like transform does, and returns the documents that came back
+    '''
+    data = urlencode([('text', text) for text in texts]).encode('utf-8')
+    with urlopen(url, data) as response:
+        return json.load(response)['results']['documents']
+
+#This function tests that the stub answers every text by default and only one in single-document mode
+def test_stub_single_document():
+    texts = ['NASA plans a launch', 'Nasdaq rally', 'Congress budget vote']
+    with StubServer() as stub:
+        documents = post_texts(stub.urls()['SENTIMENT_URL'], texts)
+    assert [d['id'] for d in documents] == ['0', '1', '2']
+
+    with StubServer(config = StubConfig(single_document = True)) as stub:
+        documents = post_texts(stub.urls()['ENTITY_URL'], texts)
+    assert stub.counts[f'{ENTITY_PATH} 200'] == 1
+    assert documents == [{'id': '0', 'entities': [{'text': 'Congress'}]}]
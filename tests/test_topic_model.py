@@ -0,0 +1,56 @@
+import pandas as pd
+from code import storage, topic_model
+from code.topic_model import TopicModel
+
+#This function tests that entities vote for the topics they were seen with and only clear winners are answered
+def test_predict_and_answer():
+    model = TopicModel()
+    for _ in range(3):
+        model.learn(['Nasdaq', 'Federal Reserve'], 'Finance')
+    model.learn(['Federal Reserve', 'Senate'], 'politics')
+    model.learn(['Senate'], 'Unknown')
+
+    topic, confidence, support = model.predict(['nasdaq', 'Federal Reserve'])
+    assert topic == 'Finance'
+    assert support == 7
+    assert model.answer(['Nasdaq']) == 'Finance'
+
+    #Split votes, unknown entities and entities seen too few times are left to GenAI
+    assert model.answer(['Federal Reserve', 'Senate']) is None
+    assert model.answer(['Nasdaq', 'Mars', 'Rover']) is None
+    assert model.answer(['Senate']) is None
+    assert model.predict(['Mars']) == (None, 0.0, 0)
+
+#This function tests that the model is trained from the GenAI topics in the cleaned headlines of every cached country
+def test_train_from_cleaned(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path))
+    storage.write_cleaned(pd.DataFrame({
+        'url': ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'],
+        'topic': ['space', 'space', 'Space', 'Unknown', 'science', 'science', 'space', 'space'],
+        'topic_source': ['genai', 'cache', 'genai', None, 'local', 'model', 'genai', 'genai'],
+        'cluster_id': [None, None, 'c1', None, None, None, 'c1', 'c1'],
+        'entities': [['NASA', 'Mars'], ['NASA', 'NASA'], ['nasa'], ['NASA'], ['NASA'], ['NASA'], ['NASA'], ['NASA']]
+    }), 'us')
+
+    #Keyword and model topics are skipped and the three copies of cluster c1 count once
+    model = topic_model.train_from_cleaned()
+    assert model.pairs == 3
+    assert dict(model.entity_topics['nasa']) == {'space': 3}
+    assert model.answer(['NASA']) == 'space'
+
+    #Files written before topic_source was stored hold only GenAI topics, so the model learns from all of them
+    with open(storage.cleaned_csv_path('gb'), 'w') as f:
+        f.write('author,title,url,publishedAt,content,source_name,short_title,sentiment,entities,topic\n')
+        f.write(",Rover lands,https://a.com,2025-04-28T12:00:00Z,Text,CBS,Rover lands,positive,\"['NASA', 'Mars']\",space\n")
+        f.write(",Rocket test,https://b.com,2025-04-28T13:00:00Z,Text,CBS,Rocket test,neutral,\"['NASA']\",space\n")
+        f.write(",Launch delayed,https://c.com,2025-04-28T14:00:00Z,Text,CBS,Launch delayed,neutral,\"['NASA']\",space\n")
+    model = topic_model.train_from_cleaned(countries = ['gb'])
+    assert model.pairs == 3
+    assert model.answer(['NASA']) == 'space'
+
+#This function tests the hit rate reported for a run
+def test_hit_rate():
+    assert topic_model.hit_rate({'topic_model_hits': 3, 'topic_model_misses': 1}) == {
+        'hits': 3, 'misses': 1, 'hit_rate': 0.75, 'genai_calls_avoided': 3
+    }
+    assert topic_model.hit_rate({})['hit_rate'] is None
@@ -1,8 +1,16 @@
+import os
 import pytest
+import pandas as pd
 from code.transform import (
     clean_text,
     create_short_title,
     remove_numeric_entities,
+    canonical_entity_key,
+    split_incremental,
+    clean_text_series,
+    create_short_title_series,
+    categorize_time_of_day_series,
+    remove_numeric_entities_series,
     categorize_time_of_day,
     get_sentiment,
     get_entities,
@@ -31,6 +39,13 @@ def test_remove_numeric_entities():
     assert remove_numeric_entities(["NASA", "15.5", "50%", "99.9%"]) == ["NASA"]
     assert remove_numeric_entities(["Elon Musk", "SpaceX", "1000"]) == ["Elon Musk", "SpaceX"]
 
+#This function tests that entity lists that only differ in case, order or repeats share a key
+def test_canonical_entity_key():
+    assert canonical_entity_key(["NASA", "Mars"]) == canonical_entity_key(["mars", "nasa", "NASA"])
+    assert canonical_entity_key(["NASA", "Mars"]) != canonical_entity_key(["NASA"])
+    assert canonical_entity_key([]) == ""
+    assert canonical_entity_key(None) == ""
+
 #This function tests that hours of day are correctly categorized
 def test_categorize_time_of_day():
     assert categorize_time_of_day(0) == "12AM-3AM"
@@ -57,4 +72,298 @@ def test_get_entities():
 def test_get_topic_from_entities():
     topic = get_topic_from_entities(["NASA", "Mars", "rover"])
     assert isinstance(topic, str)
-    assert len(topic) > 0
\ No newline at end of file
+    assert len(topic) > 0
+
+#This function tests that only new and changed articles are picked for enrichment
+def test_split_incremental():
+    existing = pd.DataFrame({
+        'url': ['a', 'b'],
+        'title': ['Title A', 'Title B'],
+        'description': ['', 'Desc B'],
+        'content': ['Content A', 'Content B']
+    })
+    df = pd.DataFrame({
+        'url': ['a', 'b', 'c'],
+        'title': ['Title A', 'Title B', 'Title C'],
+        'description': [None, 'Desc B', 'Desc C'],
+        'content': ['Content A', 'Content B changed', 'Content C']
+    })
+
+    new_rows, changed_rows, skipped = split_incremental(df, existing)
+    assert list(new_rows['url']) == ['c']
+    assert list(changed_rows['url']) == ['b']
+    assert skipped == 1
+
+#This function tests that the vectorized text cleaning matches clean_text
+def test_clean_text_series():
+    texts = pd.Series(["This   is  a\n\n test.", None, "Already clean", " tab\there\r\n"])
+    assert clean_text_series(texts).tolist() == [clean_text(t) for t in texts]
+
+#This function tests that the vectorized short title matches create_short_title
+def test_create_short_title_series():
+    titles = pd.Series(["This is a very long title that should be shortened down to less words", "", None, "  Short  title "])
+    cleaned = clean_text_series(titles)
+    assert create_short_title_series(cleaned).tolist() == [create_short_title(t) for t in titles]
+    assert create_short_title_series(cleaned, num_words = 2).tolist() == [create_short_title(t, 2) for t in titles]
+
+#This function tests that hours are bucketed into an ordered categorical
+def test_categorize_time_of_day_series():
+    hours = pd.Series([0, 4, 7, 10, 13, 16, 19, 22, None])
+    buckets = categorize_time_of_day_series(hours)
+    assert buckets.tolist()[:-1] == [categorize_time_of_day(h) for h in hours[:-1]]
+    assert pd.isna(buckets.iloc[-1])
+    assert buckets.cat.ordered
+
+#This function tests that the vectorized numeric entity removal matches remove_numeric_entities
+def test_remove_numeric_entities_series():
+    entities = pd.Series([["NASA", "Mars", "2025", "1,500"], [], None, ["15.5", "50%"], ["Elon Musk"]], index = [4, 2, 0, 3, 1])
+    result = remove_numeric_entities_series(entities)
+    assert result.tolist() == [remove_numeric_entities(e) for e in entities]
+    assert list(result.index) == [4, 2, 0, 3, 1]
+
+class FakeResponse:
+    status_code = 200
+    def __init__(self, data):
+        self.data = data
+    def json(self):
+        return self.data
+
+def fake_post(url, headers = None, data = None, **kwargs):
+    '''
+    Stands in for the iSchool APIs: every article is positive, its first word is the entity and the topic is politics
+    '''
+    if 'genai' in url:
+        return FakeResponse('politics')
+    documents = [
+        {'id': str(i), 'sentiment': 'positive', 'entities': [{'text': text.split()[0]}]}
+        for i, (_, text) in enumerate(data)
+    ]
+    return FakeResponse({'results': {'documents': documents}})
+
+def write_raw_articles(count):
+    '''
+    Writes 'count' fake raw articles to cache/top_headlines_test.csv
+    '''
+    os.makedirs('cache', exist_ok = True)
+    pd.DataFrame({
+        'title': [f'Headline number {i}' for i in range(count)],
+        'description': ['Description'] * count,
+        'url': [f'https://example.com/{i}' for i in range(count)],
+        'publishedAt': ['2025-04-28T12:00:00Z'] * count,
+        'content': [f'Story{i} content' for i in range(count)],
+        'source_name': ['CBS'] * count
+    }).to_csv(os.path.join('cache', 'top_headlines_test.csv'), index = False)
+
+#This function tests that a chunked transform stopped by the quota resumes from its last finished chunk
+def test_transform_in_chunks_resumes(tmp_path, monkeypatch):
+    from code import transform, storage
+    from code.enrichment_cache import EnrichmentCache
+    from code.http_client import QuotaExceededError
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: EnrichmentCache(str(tmp_path / 'enrichment.db')))
+    monkeypatch.setattr(transform.topic_model, '_default_model', transform.topic_model.TopicModel())
+    write_raw_articles(5)
+
+    #The quota runs out partway through the second chunk
+    calls = []
+    def failing_post(url, **kwargs):
+        calls.append(url)
+        if len(calls) > 5:
+            raise QuotaExceededError('Daily API usage limit reached')
+        return fake_post(url, **kwargs)
+
+    monkeypatch.setattr(transform.http_client, 'post', failing_post)
+    with pytest.raises(QuotaExceededError):
+        transform.transform_articles('test', chunk_size = 2, max_workers = 1)
+    assert len(storage.checkpoint_files('test')) == 1
+    assert storage.load_cleaned('test') is None
+
+    #The second run skips the finished chunk and builds the cleaned file from all three chunks
+    monkeypatch.setattr(transform.http_client, 'post', fake_post)
+    summary = transform.transform_articles('test', chunk_size = 2, max_workers = 1)
+    assert summary['chunks_resumed'] == 1
+    assert summary['added'] == 5
+
+    df = storage.load_cleaned('test')
+    assert list(df['url']) == [f'https://example.com/{i}' for i in range(5)]
+    assert df['entities'].tolist() == [[f'Story{i}'] for i in range(5)]
+    assert storage.checkpoint_files('test') == []
+
+#This function tests that an incremental chunked run keeps the rows it doesn't enrich again
+def test_transform_in_chunks_incremental(tmp_path, monkeypatch):
+    from code import transform, storage
+    from code.enrichment_cache import EnrichmentCache
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: EnrichmentCache(str(tmp_path / 'enrichment.db')))
+    monkeypatch.setattr(transform.http_client, 'post', fake_post)
+    write_raw_articles(3)
+    transform.transform_articles('test')
+
+    write_raw_articles(6)
+    summary = transform.transform_articles('test', chunk_size = 4, incremental = True)
+    assert summary == {'added': 3, 'updated': 0, 'skipped': 3, 'enriched': 3, 'deferred': 0, 'chunks_resumed': 0}
+    assert sorted(storage.load_cleaned('test')['url']) == sorted(f'https://example.com/{i}' for i in range(6))
+
+#This function tests that a short iSchool budget enriches the newest articles first and defers the rest
+def test_fit_to_budget(tmp_path, monkeypatch):
+    from code import transform, api_budget
+    from code.enrichment_cache import EnrichmentCache
+
+    cache = EnrichmentCache(str(tmp_path / 'enrichment.db'))
+    budget = api_budget.BudgetTracker(str(tmp_path / 'budget.db'), limits = {'ischool': 6})
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: cache)
+    monkeypatch.setattr(api_budget, '_default_budget', budget)
+
+    df = pd.DataFrame({
+        'publishedAt': ['2025-04-28T10:00:00Z', '2025-04-28T12:00:00Z', '2025-04-28T11:00:00Z', '2025-04-28T09:00:00Z'],
+        'content': ['old story', 'newest story', 'middle story', 'oldest story']
+    })
+
+    #Until the endpoints are known to batch, every batch may be sent again one text per request (1 + 1 calls each + 1 topic call = 5, 6 with retries)
+    kept, deferred = transform.fit_to_budget(df, batch_size = 2)
+    assert kept['content'].tolist() == ['newest story']
+    assert deferred == 3
+    for url in [transform.SENTIMENT_URL, transform.ENTITY_URL]:
+        cache.set(transform.BATCHING_CACHE_ENDPOINT, url, True)
+
+    #6 calls pay for 2 uncached articles in one batch (2 batch calls + 2 topic calls = 4, 5 with retries) but not a third (4 + 3 = 7, 8 with retries)
+    kept, deferred = transform.fit_to_budget(df, batch_size = 2)
+    assert kept['content'].tolist() == ['newest story', 'middle story']
+    assert deferred == 2
+
+    #An article with cached sentiment and entities only needs its topic call, so it fits too
+    cache.set('sentiment', 'oldest story', 'neutral')
+    cache.set('entities', 'oldest story', ['Story'])
+    kept, deferred = transform.fit_to_budget(df, batch_size = 2)
+    assert kept['content'].tolist() == ['newest story', 'middle story', 'oldest story']
+    assert deferred == 1
+
+    #Calls another country reserved aren't planned with again, and are free once it's done
+    other = budget.reserve('ischool', 2)
+    assert transform.fit_to_budget(df, batch_size = 2)[1] == 3
+    with transform.reserve_budget(df, batch_size = 2) as (kept, deferred):
+        assert kept['content'].tolist() == ['newest story']
+        assert budget.available('ischool') == 0
+    other.release()
+    assert budget.available('ischool') == 6
+
+    #With no limit every article is kept
+    budget.limits['ischool'] = None
+    assert transform.fit_to_budget(df)[1] == 0
+
+#This function tests that near-duplicate articles are sent to the APIs once and share the results and cluster id
+def test_enrich_frame_near_duplicates(tmp_path, monkeypatch):
+    from code import transform
+    from code.enrichment_cache import EnrichmentCache
+
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: EnrichmentCache(str(tmp_path / 'enrichment.db')))
+    monkeypatch.setattr(transform.topic_model, '_default_model', transform.topic_model.TopicModel())
+    sent = []
+    def recording_post(url, headers = None, data = None, **kwargs):
+        if 'sentiment' in url:
+            sent.extend(text for _, text in data)
+        return fake_post(url, headers, data, **kwargs)
+    monkeypatch.setattr(transform.http_client, 'post', recording_post)
+
+    story = 'Senate leaders agreed on Tuesday to a budget deal that keeps the government open through the end of the year'
+    df = pd.DataFrame({
+        'url': ['https://a.com/1', 'https://b.com/1', 'https://c.com/1'],
+        'title': ['Budget deal reached', 'Budget deal reached', 'Storm hits coast'],
+        'content': [story, story, 'Heavy rain and strong winds hit the coast overnight, cutting power to thousands of homes']
+    })
+    df, _ = transform.enrich_frame(df, max_workers = 1)
+
+    assert len(sent) == 2
+    assert df['entities'].tolist() == [['Senate'], ['Senate'], ['Heavy']]
+    assert df['cluster_id'][0] == df['cluster_id'][1] != df['cluster_id'][2]
+
+#This function tests that the local backends only call the APIs for rows the local rules aren't sure about
+def test_enrich_frame_local_backends(tmp_path, monkeypatch):
+    from code import transform, local_enrich
+    from code.enrichment_cache import EnrichmentCache
+
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: EnrichmentCache(str(tmp_path / 'enrichment.db')))
+    monkeypatch.setattr(transform.topic_model, '_default_model', transform.topic_model.TopicModel())
+    monkeypatch.setattr(local_enrich, '_lexicon', dict(local_enrich._BUILTIN_LEXICON))
+    sent = []
+    def recording_post(url, headers = None, data = None, **kwargs):
+        sent.append((url, data))
+        return fake_post(url, headers, data, **kwargs)
+    monkeypatch.setattr(transform.http_client, 'post', recording_post)
+
+    def sample():
+        return pd.DataFrame({
+            'url': ['https://a.com/1', 'https://b.com/1'],
+            'title': ['Markets', 'Council'],
+            'content': ['Stocks rally to a record as investors welcome the deal', 'The council meets on Tuesday']
+        })
+
+    df, _ = transform.enrich_frame(sample(), backend = 'local')
+    assert sent == []
+    assert df['sentiment'].tolist() == ['positive', 'neutral']
+    assert df['topic'].tolist() == ['finance', 'Unknown']
+    assert df['topic_source'].tolist() == ['local', None]
+
+    #Only the neutral row's sentiment is unsure, and neither row has a multi-word name or acronym, so both go for entities
+    df, _ = transform.enrich_frame(sample(), max_workers = 1, backend = 'local_first')
+    assert [data for url, data in sent if url == transform.SENTIMENT_URL] == [[('text', 'The council meets on Tuesday')]]
+    assert [data for url, data in sent if url == transform.ENTITY_URL] == [
+        [('text', 'Stocks rally to a record as investors welcome the deal'), ('text', 'The council meets on Tuesday')]
+    ]
+    assert df['sentiment'].tolist() == ['positive', 'positive']
+    assert df['entities'].tolist() == [['Stocks'], ['The']]
+    assert df['topic'].tolist() == ['finance', 'politics']
+    assert df['topic_source'].tolist() == ['local', 'genai']
+
+#This function tests that a confident topic model answers without GenAI and that GenAI answers are fed back into it
+def test_get_topic_from_entities_topic_model(tmp_path, monkeypatch):
+    from code import transform, metrics
+    from code.enrichment_cache import EnrichmentCache
+    from code.topic_model import TopicModel
+
+    model = TopicModel()
+    for _ in range(3):
+        model.learn(['Nasdaq', 'Wall Street'], 'finance')
+    monkeypatch.setattr(transform.topic_model, '_default_model', model)
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: EnrichmentCache(str(tmp_path / 'enrichment.db')))
+    calls = []
+    monkeypatch.setattr(transform.http_client, 'post', lambda url, **kwargs: calls.append(url) or fake_post(url, **kwargs))
+
+    with metrics.recording('us', path = str(tmp_path / 'run_log.jsonl')) as run:
+        assert transform.get_topic_from_entities(['Nasdaq']) == 'finance'
+        assert transform.get_topic_from_entities(['Senate', 'Congress']) == 'politics'
+    assert calls == [transform.GENAI_URL]
+    assert run.counts == {'topic_model_hits': 1, 'topic_model_misses': 1, 'cache_misses': 2}
+    assert model.predict(['Senate'])[0] == 'politics'
+
+#This function tests that a batch answered with fewer documents than texts is sent again one text per request
+#and that nothing is cached for a text its document wasn't matched to
+def test_analyze_documents_unmatched_batch(tmp_path, monkeypatch):
+    from code import transform
+    from code.enrichment_cache import EnrichmentCache
+
+    cache = EnrichmentCache(str(tmp_path / 'enrichment.db'))
+    monkeypatch.setattr(transform, 'get_default_cache', lambda: cache)
+
+    #Like an endpoint that only reads the last 'text' field and answers it as document 0
+    requests = []
+    def single_document_post(url, headers = None, data = None, **kwargs):
+        requests.append(len(data))
+        text = data[-1][1]
+        return FakeResponse({'results': {'documents': [
+            {'id': '0', 'sentiment': 'positive' if 'good' in text else 'negative', 'entities': []}
+        ]}})
+
+    monkeypatch.setattr(transform.http_client, 'post', single_document_post)
+    texts = ['good news', 'bad news', 'more good news']
+    assert transform.get_sentiment_batch(texts, batch_size = 3) == ['positive', 'negative', 'positive']
+    assert requests == [3, 1, 1, 1]
+    assert [cache.get('sentiment', text) for text in texts] == ['positive', 'negative', 'positive']
+
+    #The endpoint is remembered as reading one text per request, so later texts skip the wasted batch call
+    assert transform.endpoint_batching(transform.SENTIMENT_URL) is False
+    requests.clear()
+    assert transform.get_sentiment_batch(['good day', 'bad day'], batch_size = 3) == ['positive', 'negative']
+    assert requests == [1, 1]